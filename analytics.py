@@ -0,0 +1,303 @@
+"""
+离线分析：dialogue_json -> Parquet
+
+Streams sessions from a CSV export of the results sheet or from the local
+session journal, re-parses every dialogue across a process pool and writes
+two columnar tables:
+
+    turns.parquet     one row per dialogue turn
+    sessions.parquet  one row per session, with every metric the app computes
+
+Usage:
+    python analytics.py --csv export.csv --out analysis/
+    python analytics.py --journal session_journal.db --out analysis/ --workers 8
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from lexicon import default_lexicon
+from stream_parser import CORRECT, EXAM_START, INCORRECT, ReplyParser
+from turn_log import decode_dialogue
+
+# 与 app2avatar.build_sheet_row 的列顺序一致
+SHEET_COLUMNS = [
+    "uuid", "mode", "start_time", "duration", "score", "sentiment_score",
+    "user_word_count", "avg_response_time", "turn_count", "confusion_rate",
+    "dialogue_json", "prompt_tokens", "cached_prompt_tokens", "completion_tokens",
+    "latency_summary",
+]
+
+# 旧数据中情感指令直接拼在用户消息前面
+LEGACY_INSTRUCTION_RE = re.compile(r"^\(System: .*?\)\s*", re.S)
+MAX_RESPONSE_TIME = 300
+SENTIMENT_MIN, SENTIMENT_MAX = -10, 10
+
+TURN_FIELDS = [
+    ("session_id", "string"), ("mode", "string"), ("turn_index", "int32"),
+    ("role", "string"), ("text", "string"), ("word_count", "int32"),
+    ("positive", "int32"), ("negative", "int32"), ("confused", "bool"),
+    ("graded", "string"), ("in_exam", "bool"), ("created_at", "float64"),
+    ("response_time", "float64"),
+]
+SESSION_FIELDS = [
+    ("session_id", "string"), ("mode", "string"), ("start_time", "string"),
+    ("duration", "float64"), ("score", "int32"), ("sentiment_score", "int32"),
+    ("user_word_count", "int32"), ("avg_response_time", "float64"),
+    ("turn_count", "int32"), ("confusion_rate", "float64"),
+    ("exam_started", "bool"), ("completed", "bool"),
+    ("recorded_score", "float64"), ("recorded_avg_response_time", "float64"),
+]
+
+
+# --- Sources ---
+
+def iter_csv_records(path):
+    """
+    逐行读取 Sheets 导出的 CSV（有无表头均可）
+    """
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if not row or row[0] == "uuid":
+                continue
+            record = dict(zip(SHEET_COLUMNS, row))
+            # 超过单元格上限的 dialogue_json 续写在末尾的额外列中
+            dialogue = (record.get("dialogue_json") or "") + "".join(row[len(SHEET_COLUMNS):])
+            yield {
+                "session_id": record.get("uuid"),
+                "mode": record.get("mode"),
+                "start_time": record.get("start_time"),
+                "duration": _to_float(record.get("duration")),
+                "dialogue_json": dialogue or "[]",
+                "timestamps": None,
+                "completed": True,
+                "recorded_score": _to_float(record.get("score")),
+                "recorded_avg_response_time": _to_float(record.get("avg_response_time")),
+            }
+
+
+def iter_journal_records(path, completed_only=False):
+    """
+    从本地日志读取会话；日志里有每轮的时间戳，可以重新计算响应时间
+    """
+    from session_journal import SessionJournal
+
+    journal = SessionJournal(path)
+    try:
+        for subject_id in journal.session_ids(completed_only=completed_only):
+            saved = journal.load_session(subject_id)
+            turns = saved["turns"]
+            duration = None
+            if turns:
+                duration = turns[-1]["created_at"] - turns[0]["created_at"]
+            yield {
+                "session_id": subject_id,
+                "mode": saved["mode"],
+                "start_time": saved["started_at"],
+                "duration": duration,
+                "dialogue_json": json.dumps([{"role": t["role"], "content": t["content"]} for t in turns]),
+                "timestamps": [t["created_at"] for t in turns],
+                "completed": saved["completed"],
+                "recorded_score": _to_float(saved["state"].get("correct_count")),
+                "recorded_avg_response_time": None,
+            }
+    finally:
+        journal.close()
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# --- Metrics (worker side) ---
+
+def analyze_session(record):
+    """
+    重新计算一个会话的全部指标，返回 (session_row, turn_rows)
+
+    Mirrors handle_bot_response: each assistant reply goes through
+    ``ReplyParser`` and its events are applied in order, so the score counts
+    [CORRECT] tags and resets when the final exam begins, sentiment is clamped to [-10, 10], turn_count
+    and confusion_rate are over user turns, response times above five
+    minutes are ignored.
+    """
+    lexicon = default_lexicon()
+    try:
+        messages = decode_dialogue(record["dialogue_json"])
+    except (TypeError, ValueError, zlib.error):
+        messages = []
+    timestamps = record.get("timestamps")
+    session_id = record["session_id"]
+    mode = record["mode"]
+
+    turns = []
+    score = sentiment = confused_turns = user_turns = words = 0
+    exam_started = False
+    response_times = []
+    last_bot_at = None
+
+    for i, msg in enumerate(messages):
+        role = msg.get("role")
+        content = msg.get("content") or ""
+        created_at = timestamps[i] if timestamps and i < len(timestamps) else None
+        turn = {
+            "session_id": session_id, "mode": mode, "turn_index": i, "role": role,
+            "text": content, "word_count": 0, "positive": 0, "negative": 0,
+            "confused": False, "graded": None, "in_exam": exam_started,
+            "created_at": created_at, "response_time": None,
+        }
+
+        if role == "user":
+            text = LEGACY_INSTRUCTION_RE.sub("", content)
+            positive, negative = lexicon.score(text)
+            sentiment = max(SENTIMENT_MIN, min(SENTIMENT_MAX, sentiment + positive))
+            sentiment = max(SENTIMENT_MIN, min(SENTIMENT_MAX, sentiment - negative))
+            user_turns += 1
+            words += len(content.split())
+            if negative:
+                confused_turns += 1
+            if created_at is not None and last_bot_at is not None:
+                delta = created_at - last_bot_at
+                if delta < MAX_RESPONSE_TIME:
+                    response_times.append(delta)
+                    turn["response_time"] = delta
+            turn.update(text=text, word_count=len(text.split()), positive=positive,
+                        negative=negative, confused=bool(negative))
+
+        elif role == "assistant":
+            # 与应用相同：用 ReplyParser 解析，事件按出现顺序计分（见 app2avatar.apply_turn_events）
+            parser = ReplyParser()
+            parser.feed(content)
+            parser.finish()
+            for event in parser.events:
+                if event == EXAM_START:
+                    exam_started = True
+                    score = 0
+                elif event == CORRECT:
+                    score += 1
+                if event in (CORRECT, INCORRECT) and turn["graded"] is None:
+                    turn["graded"] = event
+            turn["text"] = parser.display
+            turn["in_exam"] = exam_started
+            last_bot_at = created_at
+
+        turns.append(turn)
+
+    if response_times:
+        avg_response_time = round(statistics.mean(response_times), 2)
+    else:
+        avg_response_time = record.get("recorded_avg_response_time")
+
+    session = {
+        "session_id": session_id,
+        "mode": mode,
+        "start_time": record.get("start_time"),
+        "duration": record.get("duration"),
+        "score": score,
+        "sentiment_score": sentiment,
+        "user_word_count": words,
+        "avg_response_time": avg_response_time,
+        "turn_count": user_turns,
+        "confusion_rate": round(confused_turns / user_turns, 2) if user_turns else 0.0,
+        "exam_started": exam_started,
+        "completed": bool(record.get("completed")),
+        "recorded_score": record.get("recorded_score"),
+        "recorded_avg_response_time": record.get("recorded_avg_response_time"),
+    }
+    return session, turns
+
+
+# --- Parquet output ---
+
+class ParquetSink:
+    """
+    按批次增量写入 Parquet（每批一个 row group），内存只保留当前批次
+    """
+
+    def __init__(self, path, fields):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self.schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in fields])
+        self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        self.rows = 0
+
+    def write(self, rows):
+        if not rows:
+            return
+        columns = {name: [r[name] for r in rows] for name in self.schema.names}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self.schema))
+        self.rows += len(rows)
+
+    def close(self):
+        self._writer.close()
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run(records, out_dir, workers=None, batch_size=500):
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    sessions_sink = ParquetSink(os.path.join(out_dir, "sessions.parquet"), SESSION_FIELDS)
+    turns_sink = ParquetSink(os.path.join(out_dir, "turns.parquet"), TURN_FIELDS)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for batch in _batched(records, batch_size):
+                session_rows, turn_rows = [], []
+                chunksize = max(1, len(batch) // (4 * workers))
+                for session, turns in pool.map(analyze_session, batch, chunksize=chunksize):
+                    session_rows.append(session)
+                    turn_rows.extend(turns)
+                sessions_sink.write(session_rows)
+                turns_sink.write(turn_rows)
+    finally:
+        sessions_sink.close()
+        turns_sink.close()
+    return sessions_sink.rows, turns_sink.rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export dialogue metrics to Parquet.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="CSV export of the results sheet")
+    source.add_argument("--journal", help="path to the local session journal (SQLite)")
+    parser.add_argument("--out", default="analysis", help="output directory")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=500, help="sessions per Parquet row group")
+    parser.add_argument("--completed-only", action="store_true", help="journal: skip unfinished sessions")
+    args = parser.parse_args(argv)
+
+    if args.csv:
+        records = iter_csv_records(args.csv)
+    else:
+        records = iter_journal_records(args.journal, completed_only=args.completed_only)
+
+    started = time.perf_counter()
+    sessions, turns = run(records, args.out, workers=args.workers, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {sessions} sessions / {turns} turns to {args.out} in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
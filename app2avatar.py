@@ -1,16 +1,35 @@
+import time
+# 冷启动剖析：导入耗时和首屏时间都从脚本开始算起
+_run_started = time.perf_counter()
 import streamlit as st
+import atexit
 import os
-from openai import OpenAI
 import streamlit.components.v1 as components 
-import requests 
 import base64
 import json
 import datetime
-import gspread
-from google.oauth2.service_account import Credentials
 import uuid 
 import hashlib
+import re
 import statistics
+import threading
+from sheets_writer import SheetsWriter, FakeWorksheet, open_worksheet
+from session_journal import SessionJournal
+from context_manager import ContextManager, estimate_tokens, message_tokens
+from stream_render import CoalescingRenderer
+from lexicon import default_lexicon
+from stream_parser import ReplyParser, CORRECT, INCORRECT, EXAM_START, SESSION_COMPLETE
+from tts import AudioCache, TTSPipeline, DEFAULT_VOICES, edge_tts_synthesize_async
+from response_cache import ResponseCache, cache_key
+from avatar_assets import avatar_html, load_manifest
+import telemetry
+from turn_log import TurnLog, encode_dialogue, split_cells
+from rate_limiter import RateLimiter, QueueTimeout
+from quiz_engine import QuizEngine, default_bank
+from prefetch import ASSUMED_REPLY, Prefetcher, is_affirmative, is_check_in, new_session_stats
+# openai / httpx（llm_client, stream_engine）和 gspread / google-auth 在首次使用时才导入
+
+telemetry.startup_phase("imports", time.perf_counter() - _run_started)
 
 # --- 1. Configuration ---
 
@@ -21,16 +40,106 @@ if "OPENAI_API_KEY" not in st.secrets:
 
 api_key_chatbot = st.secrets["OPENAI_API_KEY"]
 
-try:
-    client = OpenAI(api_key=api_key_chatbot)
-except Exception as e:
-    st.error(f"Failed to initialize OpenAI Client: {e}")
-    st.stop()
+@st.cache_resource
+def get_llm_client():
+    """
+    同步客户端（后台预热等非流式调用）；每个进程一个连接池，带超时与重试
+    """
+    with telemetry.startup_timer("load_llm_client"):
+        from llm_client import LLMClient
+        return LLMClient(api_key_chatbot, on_connect=telemetry.CONNECT.observe)
+
+@st.cache_resource
+def get_stream_engine():
+    """
+    所有会话的流式调用共用一个事件循环线程和连接池（对冲备用端点：hedge_base_url / hedge_api_key）
+
+    第一次真正调用模型时才创建；引导页不需要它
+    """
+    with telemetry.startup_timer("load_stream_engine"):
+        from stream_engine import StreamEngine
+    engine = StreamEngine(
+        api_key_chatbot,
+        secondary_base_url=st.secrets.get("hedge_base_url"),
+        secondary_api_key=st.secrets.get("hedge_api_key"),
+        max_connections=int(st.secrets.get("engine_max_connections", 500)),
+        on_connect=telemetry.CONNECT.observe,
+    )
+    for key, help_text in (
+        ("active_streams", "Completion streams currently running on the engine loop"),
+        ("hedges", "Duplicate requests sent because the first token was late"),
+        ("hedge_wins", "Hedged requests where the duplicate showed text first"),
+        ("hedge_wasted_tokens", "Estimated tokens of cancelled hedge losers"),
+    ):
+        telemetry.REGISTRY.gauge(f"tutor_llm_{key}", help_text, lambda key=key: engine.stats()[key])
+    return engine
+
+def require_stream_engine():
+    """
+    需要流式引擎的地方用它：创建失败（缺少依赖、配置错误）时提示并停止本次运行
+
+    The failure is not cached, so the next rerun tries again.
+    """
+    try:
+        return get_stream_engine()
+    except Exception as e:
+        st.error(f"Failed to initialize OpenAI Client: {e}")
+        st.stop()
+
+@st.cache_resource
+def preload_modules():
+    """
+    引导页画完之后在后台导入 openai / httpx（以及 edge-tts），参与者点击开始时通常已经加载好
+
+    preload_modules = false 时不预加载（测量严格的冷启动时用）
+    """
+    if not st.secrets.get("preload_modules", True):
+        return None
+    with_tts = st.secrets.get("tts_enabled", True)
+
+    def load():
+        with telemetry.startup_timer("preload_modules"):
+            import stream_engine  # noqa: F401
+            if with_tts:
+                try:
+                    import edge_tts  # noqa: F401
+                except ImportError:
+                    pass
+
+    thread = threading.Thread(target=load, name="preload", daemon=True)
+    thread.start()
+    return thread
 
 MODEL = "gpt-4o-mini"
 MAX_TOKENS = 800 
 TEMPERATURE = 0.5   
 
+@st.cache_resource
+def get_rate_limiter():
+    """
+    同一台机器上所有 worker 进程共享的 RPM / TPM 配额（rate_limit_rpm = 0 时关闭）
+    """
+    rpm = int(st.secrets.get("rate_limit_rpm", 500))
+    if not rpm:
+        return None
+    limiter = RateLimiter(
+        st.secrets.get("rate_limit_path", "rate_limit.db"),
+        requests_per_minute=rpm,
+        tokens_per_minute=int(st.secrets.get("rate_limit_tpm", 200000)),
+        on_admit=lambda admission: telemetry.QUEUE_WAIT.observe(admission.waited),
+    )
+    for key, help_text in (
+        ("waiting", "LLM calls currently waiting for admission"),
+        ("admitted_last_minute", "LLM calls admitted in the last minute"),
+        ("queued_last_minute", "Admitted LLM calls in the last minute that had to wait"),
+        ("tokens_last_minute", "Tokens reserved in the last minute"),
+    ):
+        telemetry.REGISTRY.gauge(f"tutor_llm_{key}", help_text, lambda key=key: limiter.stats()[key])
+    return limiter
+
+# 固定的自动开场指令（所有会话逐字节一致，便于前缀缓存）
+AUTO_START_TRIGGER = "The student has logged in. Please start Phase 1: Introduction now."
+
 # --- Prompt Definitions (UNCHANGED) ---
 
 SYSTEM_PROMPT_EMPATHY = """
@@ -189,51 +298,149 @@ PHASE 3: FINAL EXAM
   - (Do not report the score yourself; the system will display the accurate count.)
 """
 
+SYSTEM_PROMPTS = {
+    "Empathy Mode": SYSTEM_PROMPT_EMPATHY,
+    "Neutral Mode": SYSTEM_PROMPT_NEUTRAL,
+}
+
 # --- 2. Helper Functions ---
 
-def save_to_google_sheets(data_dict):
+@st.cache_resource
+def get_sheets_writer():
+    """
+    每个进程只授权一次，行数据由后台线程批量写入
+    """
+    if st.secrets.get("sheets_backend") == "fake":
+        fake = FakeWorksheet()
+        factory = lambda: fake  # noqa: E731
+    else:
+        creds_dict = dict(st.secrets["gcp_service_account"])
+        sheet_name = st.secrets.get("sheet_name", "Experiment_Data")
+        factory = lambda: open_worksheet(creds_dict, sheet_name)  # noqa: E731
+    writer = SheetsWriter(factory, on_flush=telemetry.SHEETS_FLUSH.observe)
+    # 进程退出时把还在队列里的行写完（其余的由日志在下次启动时补写）
+    atexit.register(writer.close)
+    telemetry.REGISTRY.gauge("tutor_sheets_queue_depth", "Rows waiting to be written to Sheets", writer.queue_depth)
+    return writer
+
+def sheets_configured():
+    return st.secrets.get("sheets_backend") == "fake" or "gcp_service_account" in st.secrets
+
+def build_sheet_row(data_dict):
+    """
+    固定列顺序；dialogue_json 超过单元格上限时，其余片段追加在行尾
+    """
+    dialogue_cells = split_cells(str(data_dict.get("dialogue_json")))
+    return [
+        str(data_dict.get("uuid")),
+        str(data_dict.get("mode")),
+        str(data_dict.get("start_time")),
+        str(data_dict.get("duration")),
+        str(data_dict.get("score")),
+        str(data_dict.get("sentiment_score")),
+        str(data_dict.get("user_word_count")),
+        str(data_dict.get("avg_response_time")),
+        str(data_dict.get("turn_count")),
+        str(data_dict.get("confusion_rate")),
+        dialogue_cells[0],
+        str(data_dict.get("prompt_tokens")),
+        str(data_dict.get("cached_prompt_tokens")),
+        str(data_dict.get("completion_tokens")),
+        str(data_dict.get("latency_summary")),
+    ] + dialogue_cells[1:]
+
+def save_to_google_sheets(data_dict, on_done=None):
     """
-    保存详细数据到 Google Sheets
+    把数据行放入后台写入队列（不阻塞界面）
     """
     try:
-        if "gcp_service_account" not in st.secrets:
+        if not sheets_configured():
             return False, "Error: 'gcp_service_account' not found in st.secrets."
-        
-        scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-        creds_dict = st.secrets["gcp_service_account"]
-        credentials = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-        gc = gspread.authorize(credentials)
-        
-        sheet_name = st.secrets.get("sheet_name", "Experiment_Data")
-        try:
-            sh = gc.open(sheet_name)
-        except gspread.SpreadsheetNotFound:
-            return False, f"Error: Spreadsheet '{sheet_name}' not found."
 
-        worksheet = sh.sheet1
-        
-        # 构建完整的数据行
-        row = [
-            str(data_dict.get("uuid")),
-            str(data_dict.get("mode")),
-            str(data_dict.get("start_time")),
-            str(data_dict.get("duration")),
-            str(data_dict.get("score")),
-            str(data_dict.get("sentiment_score")),
-            str(data_dict.get("user_word_count")),
-            str(data_dict.get("avg_response_time")),
-            str(data_dict.get("turn_count")),
-            str(data_dict.get("confusion_rate")),
-            str(data_dict.get("dialogue_json"))
-        ]
-        
-        worksheet.append_row(row)
-        return True, "Success"
+        writer = get_sheets_writer()
+        writer.enqueue(build_sheet_row(data_dict), on_done=on_done)
+        return True, f"Queued (queue depth {writer.queue_depth()})"
     except Exception as e:
         return False, str(e)
 
-POSITIVE_WORDS = ["good", "great", "excellent", "ready", "yes", "understand", "clear"]
-NEGATIVE_WORDS = ["bad", "hard", "don't understand", "no", "confused", "wait", "what?", "difficult"]
+@st.cache_resource
+def get_journal():
+    return SessionJournal(st.secrets.get("journal_path", "session_journal.db"))
+
+@st.cache_resource
+def replay_pending_sessions():
+    """
+    进程启动时把日志里尚未写入 Sheets 的会话批量补写
+    """
+    if not sheets_configured():
+        return 0
+    journal = get_journal()
+    pending = journal.pending_rows()
+    if not pending:
+        return 0
+    writer = get_sheets_writer()
+    for subject_id, row in pending:
+        writer.enqueue(row, on_done=lambda ok, _msg, sid=subject_id: ok and journal.mark_synced(sid))
+    return len(pending)
+
+def session_snapshot():
+    """
+    需要跨重连保留的标量指标
+    """
+    ss = st.session_state
+    return {
+        "correct_count": ss.correct_count,
+        "sentiment_value": ss.sentiment_counter.value,
+        "confusion_counter": ss.confusion_counter,
+        "user_response_times": ss.user_response_times,
+        "user_total_words": ss.user_total_words,
+        "session_start_time": ss.session_start_time.isoformat(),
+        "auto_start_triggered": ss.auto_start_triggered,
+        "session_completed": ss.session_completed,
+        "token_usage": ss.token_usage,
+        "turn_metrics": ss.turn_metrics,
+        "quiz": ss.quiz_engine.state(),
+        "prefetch": ss.prefetch_stats,
+    }
+
+def record_turn(role, content, display=None):
+    """
+    追加一轮对话到 session_state，并增量写入本地日志
+    """
+    st.session_state.turn_log.append(role, content, shown=display is not None, display=display)
+    get_journal().record_turn(st.session_state.subject_id, role, content, display, session_snapshot())
+
+def restore_session(saved):
+    """
+    从日志恢复会话（不重新调用 LLM）
+    """
+    state = saved["state"]
+    ss = st.session_state
+    ss.subject_id = saved["subject_id"]
+    ss.active_mode = saved["mode"]
+    ss.session_started = True
+    ss.turn_log = TurnLog.from_journal(saved["turns"])
+    ss.correct_count = state.get("correct_count", 0)
+    ss.sentiment_counter = SafeCounter()
+    ss.sentiment_counter.value = state.get("sentiment_value", 0)
+    ss.confusion_counter = state.get("confusion_counter", 0)
+    ss.user_response_times = list(state.get("user_response_times", []))
+    ss.user_total_words = state.get("user_total_words", 0)
+    ss.session_start_time = datetime.datetime.fromisoformat(state["session_start_time"])
+    # 重连期间的等待不计入响应时间
+    ss.last_bot_finish_time = datetime.datetime.now()
+    ss.auto_start_triggered = state.get("auto_start_triggered", True)
+    ss.session_completed = state.get("session_completed", saved["completed"])
+    ss.token_usage = dict(new_token_usage(), **state.get("token_usage", {}))
+    ss.turn_metrics = list(state.get("turn_metrics", []))
+    ss.quiz_engine = QuizEngine.from_state(default_bank(), ss.subject_id, state.get("quiz"))
+    ss.prefetch_stats = dict(new_session_stats(), **state.get("prefetch", {}))
+    # 上下文管理器会根据恢复的消息重新建立（摘要是抽取式的，不需要 LLM）
+    if "context_manager" in ss:
+        del ss["context_manager"]
+    st.query_params["sid"] = ss.subject_id
+
+# 情感词典见 lexicons/positive.txt 与 lexicons/negative.txt
 
 class SafeCounter:
     def __init__(self, min_val=-10, max_val=10):
@@ -242,6 +449,7 @@ class SafeCounter:
         self.max_val = max_val
     def increment(self): self.value = min(self.max_val, self.value + 1)
     def decrement(self): self.value = max(self.min_val, self.value - 1)
+    def add(self, delta): self.value = max(self.min_val, min(self.max_val, self.value + delta))
     def reset(self): self.value = 0
 
 if "sentiment_counter" not in st.session_state: st.session_state.sentiment_counter = SafeCounter()
@@ -251,30 +459,372 @@ def detect_sentiment(user_message):
     """
     检测情感并统计困惑次数
     """
-    msg = user_message.lower()
-    
-    # 情感计分
-    for w in POSITIVE_WORDS: 
-        if w in msg: st.session_state.sentiment_counter.increment()
-    
+    positive, negative = default_lexicon().score(user_message)
+
+    # 情感计分（先正后负，与逐词计数的截断顺序一致）
+    counter = st.session_state.sentiment_counter
+    counter.add(positive)
+    counter.add(-negative)
+
     # 困惑与负面计分
-    is_confused = False
-    for w in NEGATIVE_WORDS: 
-        if w in msg: 
-            st.session_state.sentiment_counter.decrement()
-            is_confused = True
-            
-    if is_confused:
+    if negative:
         st.session_state.confusion_counter += 1
 
-def enforce_token_budget(messages):
-    if len(messages) > 60:
-        return [messages[0]] + messages[-58:]
-    return messages
+def sentiment_instruction(mode, sentiment_val):
+    """
+    共情模式下根据情感分给模型的附加指令
+    """
+    if mode != "Empathy Mode":
+        return ""
+    if sentiment_val <= -2:
+        return f"User discouraged (Score {sentiment_val}). Be extra encouraging!"
+    if sentiment_val >= 2:
+        return "User confident. Keep going."
+    return ""
+
+# 情感指令里的分数值每轮都可能变化，不作为投机结果的匹配条件
+_SCORE_RE = re.compile(r"\s*\(Score -?\d+\)")
+
+def speculation_key(tail):
+    """
+    投机结果的匹配键：本轮指令去掉具体分数，只比较指令本身
+    """
+    return tuple(_SCORE_RE.sub("", m["content"]) for m in tail or ())
+
+def turn_tail(*instructions):
+    """
+    本轮的动态指令，作为最后一条系统消息（保证静态前缀可被缓存复用）
+    """
+    text = " ".join(filter(None, instructions))
+    return [{"role": "system", "content": text}] if text else None
+
+def get_context_manager():
+    if "context_manager" not in st.session_state:
+        st.session_state.context_manager = ContextManager(local_questions=True)
+    return st.session_state.context_manager
+
+def enforce_token_budget(messages, tail=None):
+    """
+    按 token 预算裁剪上下文：旧的教学片段折叠成摘要，系统提示和考试状态固定保留
+    """
+    return get_context_manager().build(messages, tail)
+
+def new_token_usage():
+    return {"calls": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0}
+
+def record_token_usage(usage):
+    """
+    累计每个会话的 prompt / cached / completion token 数
+    """
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    totals = st.session_state.token_usage
+    totals["calls"] += 1
+    totals["prompt_tokens"] += usage.prompt_tokens or 0
+    totals["cached_prompt_tokens"] += cached
+    totals["completion_tokens"] += usage.completion_tokens or 0
+
+@st.cache_resource
+def get_tts_pipeline():
+    """
+    头像语音（edge-tts 未安装或 tts_enabled = false 时关闭）
+    """
+    if not st.secrets.get("tts_enabled", True):
+        return None
+    try:
+        import edge_tts  # noqa: F401
+    except ImportError:
+        return None
+    cache = AudioCache(
+        st.secrets.get("tts_cache_dir", ".tts_cache"),
+        max_bytes=int(st.secrets.get("tts_cache_mb", 200)) * 1024 * 1024,
+    )
+    # 合成也在流式引擎的事件循环上进行，不再每句占用一个线程
+    return TTSPipeline(cache, synthesize=edge_tts_synthesize_async, engine=require_stream_engine())
+
+def play_clip(slot, clip):
+    slot.audio(clip.data, format="audio/mp3", autoplay=True)
+
+def play_playlist(slot, delay, clips):
+    """
+    流结束后剩余的句子：按时长排队，在前一句播完后依次播放
+    """
+    sources = json.dumps(["data:audio/mp3;base64," + base64.b64encode(c.data).decode() for c in clips])
+    with slot:
+        components.html(f"""
+        <script>
+            const clips = {sources};
+            let i = 0;
+            function next() {{
+                if (i >= clips.length) return;
+                const audio = new Audio(clips[i++]);
+                audio.onended = next;
+                audio.play().catch(next);
+            }}
+            setTimeout(next, {int(delay * 1000)});
+        </script>
+        """, height=0)
+
+def intro_messages(mode):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPTS[mode]},
+        {"role": "system", "content": AUTO_START_TRIGGER},
+    ]
+
+def intro_cache_key(mode, request_messages):
+    """
+    只有开场白请求（系统提示 + 自动开场指令）可以走缓存
+    """
+    if request_messages != intro_messages(mode):
+        return None
+    return cache_key(mode, request_messages)
+
+def prewarm_intro_cache(cache, llm_client, limiter=None):
+    for mode in SYSTEM_PROMPTS:
+        messages = intro_messages(mode)
+        key = cache_key(mode, messages)
+        prompt_tokens = sum(message_tokens(m) for m in messages)
+        # 回复重复（低温度、确定性的模型）时凑不齐不同的变体：限制尝试次数
+        for _ in range(cache.max_variants * 3):
+            if cache.is_full(key):
+                break
+            admission = resp = None
+            try:
+                if limiter:
+                    admission = limiter.acquire("prewarm", prompt_tokens + MAX_TOKENS)
+                resp = llm_client.complete(
+                    model=MODEL,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    max_tokens=MAX_TOKENS,
+                )
+            except Exception:
+                return
+            finally:
+                if admission:
+                    usage = getattr(resp, "usage", None)
+                    limiter.settle(admission, usage.total_tokens if usage is not None else prompt_tokens)
+            cache.add(key, resp.choices[0].message.content)
+
+@st.cache_resource
+def get_response_cache():
+    """
+    开场白缓存；prewarm_intro = true 时启动时在后台预先生成
+    """
+    cache = ResponseCache(max_variants=int(st.secrets.get("intro_cache_variants", 3)))
+    if st.secrets.get("prewarm_intro", False):
+        threading.Thread(target=prewarm_intro_cache, args=(cache, get_llm_client(), get_rate_limiter()), daemon=True).start()
+    return cache
+
+def completion_kwargs(request_messages, active_mode):
+    return dict(
+        model=MODEL,
+        messages=request_messages,
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+        stream_options={"include_usage": True},
+        extra_body={"prompt_cache_key": f"tutor-{active_mode}"},
+    )
+
+def hedge_deadline():
+    """
+    对冲等待时间：最近首 token 时间的 hedge_percentile 分位，夹在上下限之间；未启用时为 None
+    """
+    if not st.secrets.get("hedge_enabled", False):
+        return None
+    low = float(st.secrets.get("hedge_min_seconds", 1.0))
+    high = float(st.secrets.get("hedge_max_seconds", 8.0))
+    observed = get_stream_engine().ttft_percentile(float(st.secrets.get("hedge_percentile", 0.95)))
+    return high if observed is None else min(high, max(low, observed))
+
+def stream_completion(request_messages, active_mode, on_queued=None):
+    """
+    流式调用 LLM，逐段返回文本（首个 token 之前的失败会自动重试）
+
+    配额不足时先在共享队列里等待，``on_queued(position)`` 用于显示排队提示。
+    网络读写都在共享事件循环上进行，这里只取已经到达的文本
+    """
+    # 先建引擎再排队：创建失败时不会占着配额
+    engine = require_stream_engine()
+    limiter = get_rate_limiter()
+    admission = None
+    estimate = sum(message_tokens(m) for m in request_messages) + MAX_TOKENS
+    subject_id = st.session_state.subject_id
+    if limiter:
+        admission = limiter.acquire(subject_id, estimate, on_wait=on_queued)
+    hedge_admissions = []
+
+    # 对冲请求同样占用配额，但不排队：没有空闲配额就不发
+    def may_hedge():
+        if not limiter:
+            return True
+        try:
+            hedge_admissions.append(limiter.acquire(subject_id, estimate, timeout=0))
+            return True
+        except QueueTimeout:
+            return False
+
+    handle = None
+    try:
+        handle = engine.stream(
+            hedge_after=hedge_deadline(),
+            secondary_model=st.secrets.get("hedge_model"),
+            may_hedge=may_hedge,
+            prompt_tokens=estimate,
+            **completion_kwargs(request_messages, active_mode),
+        )
+        yield from handle.deltas()
+        # usage 来自最后一个 chunk（include_usage）
+        record_token_usage(handle.usage)
+    finally:
+        if admission:
+            settle_stream_admissions(limiter, handle, admission, hedge_admissions, estimate - MAX_TOKENS)
+
+def settle_stream_admissions(limiter, handle, admission, hedge_admissions, prompt_estimate):
+    """
+    结算一次流式调用占用的配额：赢家按实际用量，输家和失败的请求按提示词
+
+    Runs whether the stream finished, failed or was cancelled. Without a
+    final usage the winner is charged its prompt plus the text it produced.
+    """
+    usage = handle.usage if handle is not None else None
+    winner = handle.winner if handle is not None else None
+    prompt = usage.prompt_tokens if usage is not None else prompt_estimate
+    for leg, leg_admission in [("primary", admission)] + [("hedge", a) for a in hedge_admissions]:
+        if leg != winner:
+            tokens = prompt
+        elif usage is not None:
+            tokens = usage.total_tokens
+        else:
+            tokens = prompt + estimate_tokens(handle.text)
+        limiter.settle(leg_admission, tokens)
+
+@st.cache_resource
+def get_prefetcher():
+    """
+    投机预取（prefetch_enabled = false 时关闭）；上限见 prefetch.Prefetcher
+    """
+    if not st.secrets.get("prefetch_enabled", True):
+        return None
+    return Prefetcher(
+        max_inflight=int(st.secrets.get("prefetch_max_inflight", 20)),
+        max_wasted_tokens=int(st.secrets.get("prefetch_max_wasted_tokens", 5000)),
+        min_hit_rate=float(st.secrets.get("prefetch_min_hit_rate", 0.3)),
+    )
+
+def start_speculation(reply_display, active_mode):
+    """
+    回复以确认式提问结尾时，假设学生回答“是”，在后台先生成下一段
+    """
+    prefetcher = get_prefetcher()
+    quiz = st.session_state.quiz_engine
+    if prefetcher is None or quiz.active is not None or quiz.exam_started or not is_check_in(reply_display):
+        return
+    tail = turn_tail(
+        quiz.instruction(None),
+        sentiment_instruction(active_mode, st.session_state.sentiment_counter.value),
+    )
+    request_messages = enforce_token_budget(st.session_state.turn_log) + [{"role": "user", "content": ASSUMED_REPLY}]
+    request_messages += tail or []
+    estimate = sum(message_tokens(m) for m in request_messages) + MAX_TOKENS
+    # 之前的前缀已由上一轮请求写入缓存；新的只有刚才的回复、假设的回答和 tail
+    uncached = sum(message_tokens(m) for m in request_messages[-(2 + len(tail or [])):])
+    limiter = get_rate_limiter()
+    subject_id = st.session_state.subject_id
+    engine = get_stream_engine()
+
+    admissions = []
+
+    def launch(on_done):
+        # 投机请求不排队：没有空闲配额就放弃（QueueTimeout），不和真实请求抢
+        admission = limiter.acquire(subject_id, estimate, timeout=0) if limiter else None
+        if admission:
+            admissions.append(admission)
+        settle = (lambda usage: limiter.settle(admission, usage.total_tokens)) if admission else None
+        return engine.stream(on_done=on_done, on_usage=settle, **completion_kwargs(request_messages, active_mode))
+
+    spec = prefetcher.start(
+        st.session_state.prefetch_stats, speculation_key(tail), estimate, launch, uncached_estimate=uncached
+    )
+    if spec is not None and admissions:
+        # 被取消的流拿不到 usage：按已生成的部分结算配额
+        spec.on_discard = lambda: limiter.settle(admissions[0], spec.tokens())
+    st.session_state.speculation = spec
+
+def take_speculation(user_input, grade, tail):
+    """
+    取出上一轮的投机结果：学生只是简单确认时直接使用，否则取消并计入浪费
+    """
+    spec = st.session_state.pop("speculation", None)
+    if spec is None:
+        return None
+    if grade is None and spec.usable and spec.tail == speculation_key(tail) and is_affirmative(user_input):
+        return spec
+    get_prefetcher().discard(spec, st.session_state.prefetch_stats)
+    return None
+
+@st.cache_resource
+def start_metrics_endpoint():
+    """
+    metrics_port 配置后，在后台线程提供 /metrics（Prometheus 文本格式）
+    """
+    port = st.secrets.get("metrics_port")
+    if not port:
+        return None
+    return telemetry.start_metrics_server(int(port))
+
+def render_admin_view():
+    """
+    本地管理页（?admin=<admin_token>）：进程级直方图和各组件的统计
+    """
+    st.title("Admin: process metrics")
+    cols = st.columns(2)
+    with cols[0]:
+        st.subheader("Stream engine")
+        st.json(get_stream_engine().stats())
+        st.subheader("LLM client (non-streaming)")
+        st.json(get_llm_client().stats())
+        st.subheader("Intro cache")
+        st.json(get_response_cache().stats())
+        limiter = get_rate_limiter()
+        st.subheader("Rate limiter")
+        st.json(limiter.stats() if limiter else {})
+        prefetcher = get_prefetcher()
+        st.subheader("Prefetch")
+        st.json(prefetcher.stats() if prefetcher else {})
+    with cols[1]:
+        st.subheader("Sheets writer")
+        st.json(get_sheets_writer().stats() if sheets_configured() else {})
+        tts = get_tts_pipeline()
+        st.subheader("TTS")
+        st.json(tts.stats() if tts else {})
+    st.subheader("Startup")
+    st.json(telemetry.startup_report())
+    st.subheader("Histograms")
+    st.code(telemetry.REGISTRY.render(), language="text")
+
+@st.cache_resource
+def get_avatar_html():
+    """
+    头像 HTML 每个进程只生成一次（优先使用本地优化后的资源）
+    """
+    return avatar_html(load_manifest(), show_metrics=st.secrets.get("avatar_metrics", False))
 
 # --- 3. Logic ---
 
-def handle_bot_response(user_input, chat_container, active_mode):
+def apply_turn_events(events):
+    """
+    根据解析出的结构化事件更新计分（按出现顺序）
+    """
+    for event in events:
+        if event == EXAM_START:
+            st.session_state.correct_count = 0
+        elif event == CORRECT:
+            st.session_state.correct_count += 1
+
+def handle_bot_response(user_input, chat_container, active_mode, turn_instruction="", audio_slots=None):
     # --- Metric: User Response Time Logic ---
     current_time = datetime.datetime.now()
     if st.session_state.last_bot_finish_time:
@@ -283,69 +833,140 @@ def handle_bot_response(user_input, chat_container, active_mode):
         if time_diff < 300: 
             st.session_state.user_response_times.append(time_diff)
 
+    # --- 本地判分：分数在调用模型之前就记下（随下面的日志快照一起保存）---
+    quiz = st.session_state.quiz_engine
+    grade = quiz.grade(user_input) if user_input and user_input.strip() != "/dev_skip" else None
+    if grade is not None and grade.correct:
+        st.session_state.correct_count += 1
+
     # --- Metric: User Word Count ---
     if user_input:
         word_count = len(user_input.split())
         st.session_state.user_total_words += word_count
-        st.session_state.messages.append({"role": "user", "content": user_input})
+        record_turn("user", user_input, user_input)
     
     with chat_container:
         bot_avatar = "👨‍🏫" if active_mode == "Neutral Mode" else "👩‍🏫"
         
         with st.chat_message("assistant", avatar=bot_avatar):
             chat_placeholder = st.empty()
-            
-            full_response = ""
+            renderer = CoalescingRenderer(chat_placeholder)
+            parser = ReplyParser()
+            tts = get_tts_pipeline()
+            speech = tts.start_reply(DEFAULT_VOICES[active_mode]) if tts and audio_slots else None
+            timer = None
             
             # 【DEV FEATURE】: 开发者跳过机制
             if user_input.strip() == "/dev_skip":
-                full_response = "The session is complete. Score: 10/10."
-                chat_placeholder.markdown(full_response)
+                take_speculation(user_input, None, None)
+                parser.feed("The session is complete. Score: 10/10.")
                 # 模拟正确数以用于测试
                 st.session_state.correct_count = 10
             else:
-                try:
-                    stream = client.chat.completions.create(
-                        model=MODEL,
-                        messages=enforce_token_budget(st.session_state.messages),
-                        temperature=TEMPERATURE,
-                        max_tokens=MAX_TOKENS,
-                        stream=True,
+                # 题库相关指令（开场白之后才需要）与情感指令合并
+                quiz_note = quiz.instruction(grade) if user_input else None
+                tail = turn_tail(quiz_note, turn_instruction)
+                request_messages = enforce_token_budget(st.session_state.turn_log, tail)
+                spec = take_speculation(user_input, grade, tail)
+
+                # 开场白命中缓存时直接渲染，不调用 LLM
+                intro_key = intro_cache_key(active_mode, request_messages)
+                cached_reply = get_response_cache().get(intro_key) if intro_key else None
+                def show_queued(position):
+                    chat_placeholder.markdown(
+                        f"⏳ *Many participants are active right now. Your reply is queued (position {position})...*"
                     )
-                    for chunk in stream:
-                        txt = chunk.choices[0].delta.content
-                        if txt:
-                            full_response += txt
-                            chat_placeholder.markdown(full_response + "▌")
+
+                if spec is not None:
+                    deltas = spec.deltas()
+                elif cached_reply:
+                    deltas = [cached_reply]
+                else:
+                    deltas = stream_completion(request_messages, active_mode, show_queued)
+                # 只对真正的 LLM 调用计时（缓存命中不算）
+                if not cached_reply:
+                    timer = telemetry.TurnTimer()
+                usage_before = dict(st.session_state.token_usage)
+                if grade is not None:
+                    # 本地判分结果写在回复开头（隐藏标签），模型只负责反馈文字
+                    parser.feed(grade.tag)
+                failed = False
+                try:
+                    for txt in deltas:
+                        if timer:
+                            timer.first_token()
+                        # 标签在流式过程中即被识别并隐藏
+                        display_delta, _ = parser.feed(txt)
+                        renderer.push(display_delta)
+                        # 边生成边合成：整句完成即送去合成，上一句播完就播下一句
+                        if speech:
+                            speech.add_text(display_delta)
+                            clip = speech.poll()
+                            if clip:
+                                play_clip(audio_slots[0], clip)
                 except Exception as e:
-                    st.error(f"API Error: {e}")
-                    return
+                    # 已判分的回答不能让学生重发（题目已经推进）：用本地反馈结束本轮，照常出下一题
+                    if grade is None or grade.correct is None:
+                        if spec is not None:
+                            get_prefetcher().discard(spec, st.session_state.prefetch_stats)
+                        if isinstance(e, QueueTimeout):
+                            chat_placeholder.empty()
+                            st.warning("The tutor is very busy right now. Please send your message again in a moment.")
+                        else:
+                            st.error(f"API Error: {e}")
+                        return
+                    failed = True
+                    timer = None
+                    display_delta, _ = parser.feed(("\n\n" if parser.display else "") + quiz.fallback_feedback(grade))
+                    renderer.push(display_delta)
+
+                if failed:
+                    if spec is not None:
+                        get_prefetcher().discard(spec, st.session_state.prefetch_stats)
+                elif spec is not None:
+                    # 投机结果的 usage 在引擎的事件循环上拿到，这里再计入本会话
+                    record_token_usage(spec.usage)
+                    get_prefetcher().commit(spec, st.session_state.prefetch_stats)
+                elif intro_key and not cached_reply:
+                    get_response_cache().add(intro_key, parser.raw)
 
             # --- Metric: Update Last Bot Finish Time ---
             st.session_state.last_bot_finish_time = datetime.datetime.now()
 
-            if "begin the final exam" in full_response.lower():
-                st.session_state.correct_count = 0
-
-            clean_display_response = full_response
-            
-            if "[CORRECT]" in full_response:
-                st.session_state.correct_count += 1
-                clean_display_response = full_response.replace("[CORRECT]", "").strip()
-            elif "[INCORRECT]" in full_response:
-                clean_display_response = full_response.replace("[INCORRECT]", "").strip()
-            
-            # 如果不是跳过模式，重新渲染去掉了光标的内容
-            if user_input.strip() != "/dev_skip":
-                chat_placeholder.markdown(clean_display_response)
+            tail_text = parser.finish()
+            events = parser.events
+            if grade is not None:
+                # 分数在判分时已经记过，忽略回复里的评分标签
+                events = [e for e in events if e not in (CORRECT, INCORRECT)]
+            apply_turn_events(events)
+
+            # 下一道题（或结束语）直接来自题库，不经过模型
+            followup = quiz.after_reply(grade, parser.events) if user_input.strip() != "/dev_skip" else None
+            if followup:
+                extra, followup_events = parser.feed("\n\n" + followup)
+                tail_text += extra + parser.finish()
+                apply_turn_events(followup_events)
+            renderer.push(tail_text)
+            full_response = parser.raw
+            clean_display_response = parser.display
             
-            st.session_state.messages.append({"role": "assistant", "content": full_response}) 
-            st.session_state.display_history.append({"role": "assistant", "content": clean_display_response})
+            # 最后一帧：去掉光标
+            renderer.finish(clean_display_response)
+
+            if timer:
+                usage = st.session_state.token_usage
+                st.session_state.turn_metrics.append(timer.finish(
+                    render_seconds=renderer.render_seconds,
+                    prompt_tokens=usage["prompt_tokens"] - usage_before["prompt_tokens"],
+                    completion_tokens=usage["completion_tokens"] - usage_before["completion_tokens"],
+                ))
             
-            # --- 结算逻辑 ---
-            response_lower = full_response.lower()
-            # 兼容 "session is complete" 或者 "/dev_skip" 强制生成的 Score 文本
-            if ("session" in response_lower and "complete" in response_lower) or ("score" in response_lower and "10" in response_lower):
+            record_turn("assistant", full_response, clean_display_response)
+            if not parser.has(SESSION_COMPLETE):
+                start_speculation(clean_display_response, active_mode)
+
+            # --- 结算逻辑（已结算的会话不再重复保存）---
+            if parser.has(SESSION_COMPLETE) and not st.session_state.session_completed:
                 
                 # 1. 计算所有指标
                 final_score = st.session_state.correct_count
@@ -363,15 +984,15 @@ def handle_bot_response(user_input, chat_container, active_mode):
                     avg_resp_time = 0
                 
                 # 轮数
-                turn_count = len([m for m in st.session_state.messages if m["role"] == "user"])
+                turn_count = st.session_state.turn_log.count_role("user")
                 
                 # 困惑率
                 confusion_rate = 0
                 if turn_count > 0:
                     confusion_rate = st.session_state.confusion_counter / turn_count
                 
-                # 完整对话 JSON
-                dialogue_dump = json.dumps(st.session_state.messages, ensure_ascii=False)
+                # 完整对话（压缩编码，系统提示只保存引用）
+                dialogue_dump = encode_dialogue(st.session_state.turn_log, SYSTEM_PROMPTS)
 
                 st.info(f"📊 Final Score: {final_score}/10 | Time: {int(duration_seconds)}s")
                 
@@ -387,18 +1008,38 @@ def handle_bot_response(user_input, chat_container, active_mode):
                     "avg_response_time": round(avg_resp_time, 2),
                     "turn_count": turn_count,
                     "confusion_rate": round(confusion_rate, 2),
-                    "dialogue_json": dialogue_dump
+                    "dialogue_json": dialogue_dump,
+                    "prompt_tokens": st.session_state.token_usage["prompt_tokens"],
+                    "cached_prompt_tokens": st.session_state.token_usage["cached_prompt_tokens"],
+                    "completion_tokens": st.session_state.token_usage["completion_tokens"],
+                    "latency_summary": telemetry.summary_json(st.session_state.turn_metrics),
                 }
                 
-                # 3. 保存
-                success, msg = save_to_google_sheets(data_payload)
+                # 3. 保存（先写本地日志，再进入后台队列写入 Sheets）
+                subject_id = st.session_state.subject_id
+                journal = get_journal()
+                st.session_state.session_completed = True
+                journal.save_state(subject_id, session_snapshot())
+                journal.mark_completed(subject_id, build_sheet_row(data_payload))
+                success, msg = save_to_google_sheets(
+                    data_payload,
+                    on_done=lambda ok, _msg: ok and journal.mark_synced(subject_id),
+                )
                 
                 if success:
-                    st.success("✅ Session Complete. All metrics saved successfully.")
+                    st.success("✅ Session Complete. All metrics submitted successfully.")
                     st.balloons()
                 else:
                     st.error(f"Save Failed: {msg}")
 
+            # 剩余句子的合成放在保存之后：等待语音不会推迟日志和 Sheets 写入
+            if speech and user_input.strip() != "/dev_skip":
+                speech.add_text(tail_text)
+                speech.finish()
+                delay, clips = speech.remaining()
+                if clips:
+                    play_playlist(audio_slots[1], delay, clips)
+
 # --- 4. Initialization & Setup ---
 
 st.set_page_config(page_title="Psychology Experiment", layout="wide", initial_sidebar_state="collapsed")
@@ -410,6 +1051,21 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+replay_pending_sessions()
+start_metrics_endpoint()
+
+admin_token = st.secrets.get("admin_token")
+if admin_token and st.query_params.get("admin") == admin_token:
+    render_admin_view()
+    st.stop()
+
+# --- 断线重连：通过 URL 中的 sid 恢复会话 ---
+if "subject_id" not in st.session_state:
+    resume_id = st.query_params.get("sid")
+    saved = get_journal().load_session(resume_id) if resume_id else None
+    if saved:
+        restore_session(saved)
+
 # --- ID生成与模式分配 ---
 
 if "subject_id" not in st.session_state:
@@ -445,17 +1101,85 @@ if "user_total_words" not in st.session_state:
     st.session_state.user_total_words = 0
 
 # --- System Prompt Init ---
-if "messages" not in st.session_state:
-    prompt = SYSTEM_PROMPT_EMPATHY if st.session_state.active_mode == "Empathy Mode" else SYSTEM_PROMPT_NEUTRAL
-    st.session_state.messages = [{"role": "system", "content": prompt}]
+if "turn_log" not in st.session_state:
+    prompt = SYSTEM_PROMPTS[st.session_state.active_mode]
+    st.session_state.turn_log = TurnLog()
+    st.session_state.turn_log.append("system", prompt, shown=False)
 
-if "display_history" not in st.session_state:
-    st.session_state.display_history = []
 if "correct_count" not in st.session_state:
     st.session_state.correct_count = 0
+if "session_completed" not in st.session_state:
+    st.session_state.session_completed = False
+if "token_usage" not in st.session_state:
+    st.session_state.token_usage = new_token_usage()
+if "turn_metrics" not in st.session_state:
+    st.session_state.turn_metrics = []
+if "quiz_engine" not in st.session_state:
+    st.session_state.quiz_engine = QuizEngine(default_bank(), st.session_state.subject_id)
+if "prefetch_stats" not in st.session_state:
+    st.session_state.prefetch_stats = new_session_stats()
+if "rerun_timings" not in st.session_state:
+    st.session_state.rerun_timings = []
 
 # --- 5. Main UI Logic ---
 
+@st.fragment
+def chat_panel(locked_mode):
+    """
+    聊天区：作为 fragment 独立重跑，发送消息时不重跑整页（头像不受影响）
+    """
+    run_started = time.perf_counter()
+    chat_container = st.container(height=520)
+    # 语音播放位置（实时句子 / 剩余句子队列）
+    audio_slots = (st.empty(), st.empty())
+
+    # 显示历史记录
+    bot_avatar = "👩‍🏫" if locked_mode == "Empathy Mode" else "👨‍🏫"
+    with chat_container:
+        for role, text in st.session_state.turn_log.display_history():
+            avatar = bot_avatar if role == "assistant" else "👤"
+            st.chat_message(role, avatar=avatar).markdown(text)
+    reply_time = 0.0
+
+    # 自动触发逻辑
+    if st.session_state.turn_log.shown_count == 0:
+        has_assistant_reply = st.session_state.turn_log.has_role("assistant")
+        
+        if not has_assistant_reply and not st.session_state.auto_start_triggered:
+            st.session_state.auto_start_triggered = True 
+            record_turn("system", AUTO_START_TRIGGER)
+            st.session_state.last_bot_finish_time = datetime.datetime.now() 
+            reply_started = time.perf_counter()
+            handle_bot_response("", chat_container, locked_mode, audio_slots=audio_slots)
+            reply_time += time.perf_counter() - reply_started
+
+    # 用户输入（会话结束后禁用；结束那一轮渲染出的输入框再提交也忽略）
+    completed = st.session_state.session_completed
+    user_input = st.chat_input(
+        "The session is complete. Thank you!" if completed else "Type your response here...",
+        disabled=completed,
+    )
+    
+    if user_input and not completed:
+        with chat_container:
+            st.chat_message("user", avatar="👤").markdown(user_input)
+            
+            # Analysis Logic
+            detect_sentiment(user_input)
+            
+            system_instruction = sentiment_instruction(locked_mode, st.session_state.sentiment_counter.value)
+            
+            reply_started = time.perf_counter()
+            handle_bot_response(user_input, chat_container, locked_mode, turn_instruction=system_instruction, audio_slots=audio_slots)
+            reply_time += time.perf_counter() - reply_started
+
+    # 每次重跑的服务端开销（不含 LLM 回复本身），用于确认不随对话长度增长
+    st.session_state.rerun_timings.append({
+        "history_len": st.session_state.turn_log.shown_count,
+        "server_ms": round((time.perf_counter() - run_started - reply_time) * 1000, 2),
+    })
+
+
 # 【逻辑分支 1：引导页（去掉了调查问卷，换为直接开始按钮）】
 if not st.session_state.session_started:
     st.container().markdown("<br><br>", unsafe_allow_html=True) # Spacer
@@ -472,8 +1196,34 @@ if not st.session_state.session_started:
         # 简洁清晰的开始按钮
         if st.button("🚀 Start the Learning Session", type="primary", use_container_width=True):
             st.session_state.session_started = True
+            get_journal().start_session(
+                st.session_state.subject_id,
+                st.session_state.active_mode,
+                st.session_state.session_start_time.isoformat(),
+                session_snapshot(),
+            )
+            for m in st.session_state.turn_log:
+                get_journal().record_turn(st.session_state.subject_id, m["role"], m["content"])
+            st.query_params["sid"] = st.session_state.subject_id
             st.rerun()
 
+        # 老用户：输入 ID 继续之前的会话
+        with st.expander("Returning participant? Resume your session"):
+            resume_id = st.text_input("Participant ID", placeholder="SUB_xxxxxxxx")
+            if st.button("Resume", use_container_width=True) and resume_id:
+                saved = get_journal().load_session(resume_id.strip())
+                if saved:
+                    restore_session(saved)
+                    st.rerun()
+                else:
+                    st.warning("No saved session found for this ID.")
+
+    # 首屏已经画完：记录耗时，再在后台预加载对话需要的模块
+    landing_seconds = time.perf_counter() - _run_started
+    telemetry.LANDING_RENDER.observe(landing_seconds)
+    telemetry.startup_phase("first_paint", landing_seconds)
+    preload_modules()
+
 # 【逻辑分支 2：Avatar 互动环节】
 else:
     st.title("🧠 Psychology Learning Session")
@@ -481,92 +1231,10 @@ else:
     col_avatar, col_chat = st.columns([1, 2])
 
     # -------------------------------------------------------------
-    # 3D Avatar Model
+    # 3D Avatar Model（聊天轮次只重跑右侧 fragment，不会碰到头像）
     # -------------------------------------------------------------
-    NEW_MODEL_URL = "https://huggingface.co/Giillm/Avatar/resolve/main/GLB.glb?download=true" 
-
-    html = f"""
-    <script type="module" src="https://ajax.googleapis.com/ajax/libs/model-viewer/3.4.0/model-viewer.min.js"></script>
-    <div style="
-        display: flex; 
-        justify-content: center; 
-        align-items: center; 
-        height: 540px; 
-        background-color: #f0f2f6; 
-        border-radius: 10px; 
-        border: 1px solid #e0e0e0;
-    ">
-        <model-viewer 
-            src="{NEW_MODEL_URL}" 
-            camera-controls 
-            autoplay 
-            animation-name="*" 
-            shadow-intensity="1" 
-            style="width:100%; height:100%;" 
-            interaction-prompt="none"
-            loading="eager" 
-            alt="AI Teacher Avatar"
-        >
-            <div slot="poster" style="
-                display: flex; 
-                justify-content: center; 
-                align-items: center; 
-                height: 100%; 
-                color: #555; 
-                font-family: sans-serif;
-                flex-direction: column;
-            ">
-                <div style="font-size: 40px;">⏳</div>
-                <div style="margin-top: 10px; font-weight: bold;">Loading AI Teacher...</div>
-                <div style="font-size: 12px; color: #888; margin-top: 5px;">(Large file downloading, please wait...)</div>
-            </div>
-        </model-viewer>
-    </div>
-    """
     with col_avatar: 
-        components.html(html, height=540)
+        components.html(get_avatar_html(), height=540)
 
     with col_chat:
-        chat_container = st.container(height=520)
-        locked_mode = st.session_state.active_mode
-
-        # 显示历史记录
-        with chat_container:
-            for msg in st.session_state.display_history:
-                avatar = "👩‍🏫" if msg["role"] == "assistant" and locked_mode == "Empathy Mode" else ("👨‍🏫" if msg["role"] == "assistant" else "👤")
-                st.chat_message(msg["role"], avatar=avatar).write(msg["content"])
-
-        # 自动触发逻辑
-        if len(st.session_state.display_history) == 0:
-            trigger_msg = "The student has logged in. Please start Phase 1: Introduction now."
-            has_assistant_reply = any(m["role"] == "assistant" for m in st.session_state.messages)
-            
-            if not has_assistant_reply and not st.session_state.auto_start_triggered:
-                st.session_state.auto_start_triggered = True 
-                st.session_state.messages.append({"role": "system", "content": trigger_msg})
-                st.session_state.last_bot_finish_time = datetime.datetime.now() 
-                handle_bot_response("", chat_container, locked_mode)
-                st.rerun() 
-
-        # 用户输入
-        user_input = st.chat_input("Type your response here...")
-        
-        if user_input:
-            with chat_container:
-                st.chat_message("user", avatar="👤").write(user_input)
-                st.session_state.display_history.append({"role": "user", "content": user_input})
-                
-                # Analysis Logic
-                detect_sentiment(user_input)
-                
-                sentiment_val = st.session_state.sentiment_counter.value
-                system_instruction = ""
-                if locked_mode == "Empathy Mode":
-                    if sentiment_val <= -2:
-                        system_instruction = f"(System: User discouraged (Score {sentiment_val}). Be extra encouraging!) "
-                    elif sentiment_val >= 2:
-                        system_instruction = f"(System: User confident. Keep going.) "
-                
-                final_prompt = system_instruction + user_input
-                
-                handle_bot_response(final_prompt, chat_container, locked_mode)
+        chat_panel(st.session_state.active_mode)
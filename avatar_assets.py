@@ -0,0 +1,236 @@
+"""
+3D 头像资源：本地优化、内容哈希、缓存的 viewer HTML
+
+Build step (run once per model update, then commit ``static/avatar``):
+
+    python avatar_assets.py build
+    python avatar_assets.py build --source path/to/GLB.glb --no-optimize
+
+The GLB is mesh- and texture-optimized with gltf-transform (meshopt
+geometry compression, WebP textures) when ``npx`` is available. The
+model-viewer script and the meshopt decoder are vendored, and every file
+gets a content-hashed name listed in ``static/avatar/manifest.json``.
+Streamlit serves ``static/`` at ``app/static/`` when ``enableStaticServing``
+is on. URLs also carry ``?v=<hash>``, which makes the static handler send
+a long-lived Cache-Control header.
+
+At runtime ``avatar_html()`` builds the component HTML from the manifest,
+or falls back to the remote URLs when no local build exists.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+NEW_MODEL_URL = "https://huggingface.co/Giillm/Avatar/resolve/main/GLB.glb?download=true"
+MODEL_VIEWER_URL = "https://ajax.googleapis.com/ajax/libs/model-viewer/3.4.0/model-viewer.min.js"
+MESHOPT_DECODER_URL = "https://cdn.jsdelivr.net/npm/meshoptimizer@0.20.0/meshopt_decoder.js"
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+ASSET_SUBDIR = "avatar"
+MANIFEST_NAME = "manifest.json"
+
+
+# --- Runtime ---
+
+def load_manifest(static_dir=STATIC_DIR):
+    path = os.path.join(static_dir, ASSET_SUBDIR, MANIFEST_NAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def asset_url(entry):
+    # Relative to the page, resolved in JS against document.baseURI
+    return f"app/static/{ASSET_SUBDIR}/{entry['file']}?v={entry['hash']}"
+
+
+VIEWER_FRAME = """
+<div style="
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    height: 540px;
+    background-color: #f0f2f6;
+    border-radius: 10px;
+    border: 1px solid #e0e0e0;
+    position: relative;
+">
+    <model-viewer
+        id="avatar"
+        {src_attr}
+        camera-controls
+        autoplay
+        animation-name="*"
+        shadow-intensity="1"
+        style="width:100%; height:100%;"
+        interaction-prompt="none"
+        loading="eager"
+        alt="AI Teacher Avatar"
+    >
+        <div slot="poster" style="
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            height: 100%;
+            color: #555;
+            font-family: sans-serif;
+            flex-direction: column;
+        ">
+            <div style="font-size: 40px;">⏳</div>
+            <div style="margin-top: 10px; font-weight: bold;">Loading AI Teacher...</div>
+        </div>
+    </model-viewer>
+    <div id="avatar-metrics" style="position: absolute; bottom: 6px; right: 10px;
+         font: 11px sans-serif; color: #888;"></div>
+</div>
+"""
+
+METRICS_SCRIPT = """
+<script>
+    // time-to-avatar and bytes transferred for the avatar assets
+    const avatarStart = performance.now();
+    document.getElementById("avatar").addEventListener("load", () => {
+        const ms = Math.round(performance.now() - avatarStart);
+        const bytes = performance.getEntriesByType("resource")
+            .filter(e => /avatar|model-viewer|meshopt|GLB/.test(e.name))
+            .reduce((sum, e) => sum + (e.transferSize || 0), 0);
+        console.info(`[avatar] time-to-avatar ${ms} ms, ${bytes} bytes transferred`);
+        if (%(show)s) {
+            document.getElementById("avatar-metrics").textContent =
+                `${ms} ms · ${(bytes / 1024).toFixed(0)} KB`;
+        }
+    });
+</script>
+"""
+
+LOCAL_LOADER = """
+<script>
+    const resolve = (path) => new URL(path, document.baseURI).href;
+    self.ModelViewerElement = self.ModelViewerElement || {};
+    self.ModelViewerElement.meshoptDecoderLocation = resolve("%(decoder)s");
+    document.getElementById("avatar").src = resolve("%(model)s");
+    // Static files are served as text/plain, so load the vendored module via a typed blob
+    fetch(resolve("%(viewer)s"))
+        .then(r => r.text())
+        .then(code => import(URL.createObjectURL(new Blob([code], {type: "text/javascript"}))));
+</script>
+"""
+
+
+def avatar_html(manifest=None, show_metrics=False):
+    """
+    生成头像组件 HTML（每个进程生成一次即可）
+    """
+    if manifest:
+        frame = VIEWER_FRAME.format(src_attr="")
+        loader = LOCAL_LOADER % {
+            "model": asset_url(manifest["model"]),
+            "viewer": asset_url(manifest["viewer"]),
+            "decoder": asset_url(manifest["meshopt_decoder"]),
+        }
+        body = frame + loader
+    else:
+        head = f'<script type="module" src="{MODEL_VIEWER_URL}"></script>'
+        body = head + VIEWER_FRAME.format(src_attr=f'src="{NEW_MODEL_URL}"')
+    return body + METRICS_SCRIPT % {"show": "true" if show_metrics else "false"}
+
+
+# --- Build ---
+
+def _download(url, dest):
+    import requests
+
+    with requests.get(url, stream=True, timeout=60) as resp:
+        resp.raise_for_status()
+        with open(dest, "wb") as f:
+            for block in resp.iter_content(chunk_size=1 << 16):
+                f.write(block)
+
+
+def _optimize_glb(src, dest):
+    npx = shutil.which("npx")
+    if npx is None:
+        print("npx not found, shipping the GLB unoptimized", file=sys.stderr)
+        shutil.copyfile(src, dest)
+        return False
+    subprocess.run(
+        [npx, "--yes", "@gltf-transform/cli", "optimize", src, dest,
+         "--compress", "meshopt", "--texture-compress", "webp", "--texture-size", "1024"],
+        check=True,
+    )
+    return True
+
+
+def _publish(src, out_dir, stem, ext):
+    """
+    按内容哈希命名并拷贝到输出目录，删除同名旧版本
+    """
+    with open(src, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    name = f"{stem}.{digest}{ext}"
+    for old in os.listdir(out_dir):
+        if old.startswith(stem + ".") and old.endswith(ext) and old != name:
+            os.remove(os.path.join(out_dir, old))
+    shutil.copyfile(src, os.path.join(out_dir, name))
+    return {"file": name, "hash": digest, "bytes": os.path.getsize(src)}
+
+
+def build(source=NEW_MODEL_URL, static_dir=STATIC_DIR, optimize=True):
+    out_dir = os.path.join(static_dir, ASSET_SUBDIR)
+    os.makedirs(out_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = os.path.join(tmp, "source.glb")
+        if os.path.exists(source):
+            shutil.copyfile(source, raw)
+        else:
+            _download(source, raw)
+        optimized = os.path.join(tmp, "avatar.glb")
+        if optimize:
+            did_optimize = _optimize_glb(raw, optimized)
+        else:
+            shutil.copyfile(raw, optimized)
+            did_optimize = False
+
+        viewer = os.path.join(tmp, "model-viewer.js")
+        decoder = os.path.join(tmp, "meshopt_decoder.js")
+        _download(MODEL_VIEWER_URL, viewer)
+        _download(MESHOPT_DECODER_URL, decoder)
+
+        manifest = {
+            "source_bytes": os.path.getsize(raw),
+            "optimized": did_optimize,
+            "model": _publish(optimized, out_dir, "avatar", ".glb"),
+            "viewer": _publish(viewer, out_dir, "model-viewer", ".js"),
+            "meshopt_decoder": _publish(decoder, out_dir, "meshopt_decoder", ".js"),
+        }
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    total = sum(manifest[k]["bytes"] for k in ("model", "viewer", "meshopt_decoder"))
+    print(f"GLB: {manifest['source_bytes']} -> {manifest['model']['bytes']} bytes")
+    print(f"Total avatar payload: {total} bytes, written to {out_dir}")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the locally served avatar assets.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="download, optimize and hash the avatar assets")
+    build_cmd.add_argument("--source", default=NEW_MODEL_URL, help="GLB URL or local path")
+    build_cmd.add_argument("--static-dir", default=STATIC_DIR)
+    build_cmd.add_argument("--no-optimize", action="store_true", help="skip gltf-transform")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build(args.source, args.static_dir, optimize=not args.no_optimize)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Per-turn server time over a full scripted session.
+
+Drives app2avatar.py with Streamlit's AppTest against the local mock LLM
+through the intro, three topics with mini-quizzes and the 10-question
+exam, and prints the chat fragment's own server time per turn (history
+rendering and widgets, excluding the LLM reply itself), as recorded in
+``st.session_state.rerun_timings``.
+
+``--history-only`` skips Streamlit and times just the history pass the
+fragment makes on every rerun (``TurnLog.display_history()``), with the
+cached display text versus re-parsing every assistant turn.
+
+    python bench/bench_chat_turns.py
+    python bench/bench_chat_turns.py --history-only
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_openai import start_server  # noqa: E402
+
+TEACHING_TURNS_PER_TOPIC = 3
+
+
+def session_script():
+    """
+    模拟学生的完整输入序列
+    """
+    for _ in range(3):
+        for _ in range(TEACHING_TURNS_PER_TOPIC):
+            yield "yes, ready"
+        # 模型以 [QUIZ] 结束本主题，应用从题库出题；答案在本地判分
+        yield "quiz"
+        yield "A"
+    yield "start exam"
+    for _ in range(10):
+        yield "A"
+
+
+def history_only(repeats=200):
+    from mock_openai import scripted_reply
+    from turn_log import TurnLog, display_text
+
+    log = TurnLog()
+    log.append("system", "You are a psychology teacher.", shown=False)
+    rows = []
+    for text in session_script():
+        log.append("user", text, display=text)
+        reply = scripted_reply(list(log))
+        # 和 record_turn 一样：新回复的显示文本在流式解析时已经得到
+        log.append("assistant", reply, display=display_text("assistant", reply))
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for _role, _text in log.display_history():
+                pass
+        cached = (time.perf_counter() - started) / repeats * 1000
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for t in log.turns:
+                if t.shown:
+                    display_text(t.role, t.content)
+        reparsed = (time.perf_counter() - started) / repeats * 1000
+        rows.append((log.shown_count, cached, reparsed))
+
+    print(f"{'turn':>5}{'history':>10}{'cached ms':>12}{'reparse ms':>12}")
+    for i, (history, cached, reparsed) in enumerate(rows):
+        print(f"{i:>5}{history:>10}{cached:>12.4f}{reparsed:>12.4f}")
+    half = len(rows) // 2
+    for label, col in (("cached", 1), ("reparse", 2)):
+        early = statistics.median(r[col] for r in rows[:half])
+        late = statistics.median(r[col] for r in rows[half:])
+        print(f"median {label} ms: first half {early:.4f}, second half {late:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-turn server time of the chat fragment")
+    parser.add_argument("--history-only", action="store_true",
+                        help="time only the history pass, without Streamlit")
+    args = parser.parse_args()
+    if args.history_only:
+        history_only()
+        return
+
+    from streamlit.testing.v1 import AppTest
+
+    server, base_url = start_server(ttft=0.05, tokens_per_sec=400)
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    at = AppTest.from_file(os.path.join(ROOT, "app2avatar.py"), default_timeout=60)
+    at.secrets["OPENAI_API_KEY"] = "mock"
+    at.secrets["tts_enabled"] = False
+    at.secrets["journal_path"] = os.path.join(tempfile.mkdtemp(), "journal.db")
+    at.run()
+    at.button[0].click().run()
+
+    for text in session_script():
+        at.chat_input[0].set_value(text).run()
+
+    timings = at.session_state["rerun_timings"]
+    print(f"{'turn':>5}{'history':>10}{'server ms':>12}")
+    for i, t in enumerate(timings):
+        print(f"{i:>5}{t['history_len']:>10}{t['server_ms']:>12.2f}")
+
+    half = len(timings) // 2
+    early = statistics.median(t["server_ms"] for t in timings[1:half])
+    late = statistics.median(t["server_ms"] for t in timings[half:])
+    print(f"median server ms: first half {early:.2f}, second half {late:.2f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
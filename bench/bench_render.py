@@ -0,0 +1,80 @@
+"""
+Streaming render benchmark: per-chunk markdown vs. CoalescingRenderer.
+
+Simulates a reply streamed token by token into a fake placeholder and
+reports how many websocket messages (markdown calls) and bytes each
+strategy produces, plus the CPU time spent building the frames.
+
+    python bench/bench_render.py --tokens 300 --token-interval 0.01
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_render import CURSOR, CoalescingRenderer  # noqa: E402
+
+
+class CountingPlaceholder:
+    """Stand-in for ``st.empty()``: each call is one websocket delta."""
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self.last = ""
+
+    def markdown(self, body):
+        self.calls += 1
+        self.bytes += len(body.encode("utf-8"))
+        self.last = body
+
+
+def fake_tokens(n):
+    words = ("Classical conditioning pairs a neutral stimulus with an "
+             "unconditioned stimulus until it alone evokes the response. ").split()
+    for i in range(n):
+        yield words[i % len(words)] + " "
+
+
+def run_naive(tokens, interval):
+    placeholder = CountingPlaceholder()
+    full = ""
+    cpu = time.process_time()
+    for tok in fake_tokens(tokens):
+        full += tok
+        placeholder.markdown(full + CURSOR)
+        time.sleep(interval)
+    placeholder.markdown(full)
+    return placeholder, full, time.process_time() - cpu
+
+
+def run_coalesced(tokens, interval):
+    placeholder = CountingPlaceholder()
+    renderer = CoalescingRenderer(placeholder)
+    full = ""
+    cpu = time.process_time()
+    for tok in fake_tokens(tokens):
+        full += tok
+        renderer.push(tok)
+        time.sleep(interval)
+    renderer.finish()
+    return placeholder, full, time.process_time() - cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--token-interval", type=float, default=0.01, help="seconds between streamed tokens")
+    args = parser.parse_args()
+
+    print(f"{'strategy':<12}{'ws msgs':>10}{'bytes':>12}{'cpu ms':>10}")
+    for name, fn in (("per-chunk", run_naive), ("coalesced", run_coalesced)):
+        placeholder, full, cpu = fn(args.tokens, args.token_interval)
+        assert placeholder.last == full, "final render must be exact"
+        print(f"{name:<12}{placeholder.calls:>10}{placeholder.bytes:>12}{cpu * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Cold-start profile: import time and first paint of the landing page.
+
+Each run starts a fresh interpreter with ``-X importtime`` and renders
+app2avatar.py once in Streamlit's AppTest (the landing page with the
+"Start the Learning Session" button), then renders it again to show the
+warm rerun cost. Reports the first-paint time, the packages that
+dominate import time and which heavy dependencies were loaded before the
+landing page was drawn (there should be none: openai, httpx, gspread and
+google-auth are loaded on first use).
+
+    python bench/bench_startup.py --runs 5
+    python bench/bench_startup.py --runs 5 --out startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+HEAVY = ("openai", "httpx", "gspread", "google.oauth2", "pandas", "pyarrow", "edge_tts", "mutagen")
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+framework = time.perf_counter() - started
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.secrets["OPENAI_API_KEY"] = "bench"
+at.secrets["preload_modules"] = False
+at.secrets["journal_path"] = {journal!r}
+started = time.perf_counter()
+at.run()
+first = time.perf_counter() - started
+heavy = [m for m in {heavy!r} if m in sys.modules]
+started = time.perf_counter()
+at.run()
+rerun = time.perf_counter() - started
+print(json.dumps({{
+    "framework_import_seconds": framework,
+    "first_paint_seconds": first,
+    "rerun_seconds": rerun,
+    "start_button": any("Start the Learning Session" in b.label for b in at.button),
+    "exception": [str(e.value) for e in at.exception],
+    "heavy_modules_at_first_paint": heavy,
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    ``-X importtime`` 输出按顶层包汇总自身耗时（秒）
+    """
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _cumulative, name = line[len("import time:"):].split("|", 2)
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0.0) + int(self_us) / 1e6
+    return totals
+
+
+def cold_run(journal_path):
+    code = CHILD.format(app=os.path.join(ROOT, "app2avatar.py"), journal=journal_path, heavy=HEAVY)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["imports"] = parse_importtime(proc.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import and first-paint profile")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="packages to list by import time")
+    parser.add_argument("--out", help="write the JSON result here")
+    args = parser.parse_args()
+
+    journal_path = os.path.join(BENCH_DIR, ".startup_journal.db")
+    runs = [cold_run(journal_path) for _ in range(args.runs)]
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(journal_path + suffix):
+            os.remove(journal_path + suffix)
+
+    imports = {}
+    for run in runs:
+        for package, seconds in run["imports"].items():
+            imports.setdefault(package, []).append(seconds)
+    top = sorted(imports.items(), key=lambda kv: -statistics.median(kv[1]))[:args.top]
+    result = {
+        "runs": args.runs,
+        "first_paint_seconds": round(statistics.median(r["first_paint_seconds"] for r in runs), 4),
+        "rerun_seconds": round(statistics.median(r["rerun_seconds"] for r in runs), 4),
+        "framework_import_seconds": round(statistics.median(r["framework_import_seconds"] for r in runs), 4),
+        "start_button": all(r["start_button"] for r in runs),
+        "exceptions": sorted({e for r in runs for e in r["exception"]}),
+        "heavy_modules_at_first_paint": sorted({m for r in runs for m in r["heavy_modules_at_first_paint"]}),
+        "import_seconds_by_package": {package: round(statistics.median(v), 4) for package, v in top},
+    }
+
+    print(f"first paint (median of {args.runs}): {result['first_paint_seconds']:.3f}s, "
+          f"warm rerun {result['rerun_seconds']:.3f}s, streamlit import {result['framework_import_seconds']:.3f}s")
+    print(f"heavy modules loaded before first paint: {', '.join(result['heavy_modules_at_first_paint']) or 'none'}")
+    print(f"{'package':<32}{'import s':>10}")
+    for package, seconds in result["import_seconds_by_package"].items():
+        print(f"{package:<32}{seconds:>10.4f}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
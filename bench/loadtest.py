@@ -0,0 +1,313 @@
+"""
+Concurrent-participant load test.
+
+Starts the mock OpenAI server (bench/mock_openai.py) in a subprocess, so
+its CPU does not count against the app, and simulates N participants
+walking through the intro, three topics with mini-quizzes and the
+10-question exam. Two drivers are available:
+
+  engine   each participant runs the app's own request path
+           (QuizEngine grading -> ContextManager -> LLMClient.stream_chat
+           -> ReplyParser -> CoalescingRenderer -> bank follow-up) and saves through SheetsWriter to a
+           FakeWorksheet; reports TTFT, full-turn and save latency.
+           With --client async the streams run on the shared asyncio
+           StreamEngine instead of one blocking read per thread.
+  apptest  each participant runs app2avatar.py in Streamlit's AppTest,
+           including the rerun loop; reports full-turn latency.
+
+Both report CPU seconds and peak RSS per session. Results can be saved
+as JSON and compared:
+
+    python bench/loadtest.py run --participants 200 --ttft 0.5 --out base.json
+    python bench/loadtest.py run --participants 200 --out new.json
+    python bench/loadtest.py compare base.json new.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_chat_turns import session_script  # noqa: E402
+
+
+class NullPlaceholder:
+    def markdown(self, body):
+        pass
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = 0
+
+    def add(self, metric, value):
+        with self._lock:
+            self.samples.setdefault(metric, []).append(value)
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return None
+    k = (len(values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(samples):
+    return {
+        metric: {
+            "n": len(values),
+            "p50": round(percentile(values, 50), 4),
+            "p95": round(percentile(values, 95), 4),
+            "p99": round(percentile(values, 99), 4),
+            "mean": round(statistics.mean(values), 4),
+        }
+        for metric, values in samples.items() if values
+    }
+
+
+def start_mock(port, ttft, tokens_per_sec, fail_rate):
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "mock_openai.py"), "--port", str(port),
+         "--ttft", str(ttft), "--tokens-per-sec", str(tokens_per_sec), "--fail-rate", str(fail_rate)],
+        stdout=subprocess.DEVNULL,
+    )
+    time.sleep(1.0)
+    return proc, f"http://127.0.0.1:{port}/v1"
+
+
+# --- engine driver ---
+
+def reply_deltas(client, **kwargs):
+    if hasattr(client, "stream"):
+        yield from client.stream(**kwargs).deltas()
+        return
+    for chunk in client.stream_chat(**kwargs):
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def engine_participant(pid, llm, writer, recorder, think_time):
+    from context_manager import ContextManager
+    from quiz_engine import QuizEngine, default_bank
+    from stream_parser import ReplyParser, SESSION_COMPLETE
+    from stream_render import CoalescingRenderer
+
+    messages = [
+        {"role": "system", "content": "You are a psychology teacher. " * 150},
+        {"role": "system", "content": "The student has logged in. Please start Phase 1: Introduction now."},
+    ]
+    context = ContextManager(local_questions=True)
+    quiz = QuizEngine(default_bank(), f"LOAD_{pid}")
+    turns = [None] + list(session_script())
+    for text in turns:
+        grade = None
+        if text is not None:
+            time.sleep(random.uniform(0.5, 1.5) * think_time)
+            messages.append({"role": "user", "content": text})
+            grade = quiz.grade(text)
+        # 与 app2avatar.turn_tail 相同：本轮指令作为最后一条系统消息
+        note = quiz.instruction(grade)
+        tail = [{"role": "system", "content": note}] if note else None
+        parser = ReplyParser()
+        renderer = CoalescingRenderer(NullPlaceholder())
+        if grade is not None:
+            parser.feed(grade.tag)
+        started = time.perf_counter()
+        first = None
+        try:
+            for txt in reply_deltas(
+                llm, model="gpt-4o-mini", messages=context.build(messages, tail), max_tokens=800,
+                temperature=0.5, stream_options={"include_usage": True},
+            ):
+                if first is None:
+                    first = time.perf_counter() - started
+                display, _ = parser.feed(txt)
+                renderer.push(display)
+        except Exception:
+            recorder.error()
+            return
+        tail_text = parser.finish()
+        followup = quiz.after_reply(grade, parser.events)
+        if followup:
+            extra, _ = parser.feed("\n\n" + followup)
+            tail_text += extra + parser.finish()
+        renderer.push(tail_text)
+        renderer.finish(parser.display)
+        recorder.add("ttft", first or 0.0)
+        recorder.add("turn_latency", time.perf_counter() - started)
+        messages.append({"role": "assistant", "content": parser.raw})
+        if parser.has(SESSION_COMPLETE):
+            break
+
+    enqueued = time.perf_counter()
+    done = threading.Event()
+
+    def on_done(ok, _msg):
+        recorder.add("save_flush_latency", time.perf_counter() - enqueued)
+        done.set()
+
+    writer.enqueue([f"LOAD_{pid}", json.dumps(messages)], on_done=on_done)
+    recorder.add("save_ui_latency", time.perf_counter() - enqueued)
+    done.wait(120)
+
+
+def run_engine(args, base_url, recorder):
+    from llm_client import LLMClient
+    from sheets_writer import FakeWorksheet, SheetsWriter
+    from stream_engine import StreamEngine
+
+    client_cls = StreamEngine if args.client == "async" else LLMClient
+    llm = client_cls("mock", base_url=base_url, max_connections=args.participants,
+                     max_keepalive=args.participants)
+    fake = FakeWorksheet(latency=args.sheets_latency)
+    writer = SheetsWriter(lambda: fake, base_backoff=0.5)
+    threads = [
+        threading.Thread(target=engine_participant, args=(i, llm, writer, recorder, args.think_time))
+        for i in range(args.participants)
+    ]
+    for t in threads:
+        t.start()
+        time.sleep(args.ramp_up / max(1, args.participants))
+    for t in threads:
+        t.join()
+    return {"llm": llm.stats(), "sheets": writer.stats(), "sheet_rows": len(fake.rows)}
+
+
+# --- apptest driver ---
+
+def apptest_participant(pid, recorder, think_time, journal_path):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "app2avatar.py"), default_timeout=120)
+    at.secrets["OPENAI_API_KEY"] = "mock"
+    at.secrets["tts_enabled"] = False
+    at.secrets["sheets_backend"] = "fake"
+    at.secrets["journal_path"] = journal_path
+    try:
+        at.run()
+        started = time.perf_counter()
+        at.button[0].click().run()
+        recorder.add("turn_latency", time.perf_counter() - started)
+        for text in session_script():
+            time.sleep(random.uniform(0.5, 1.5) * think_time)
+            started = time.perf_counter()
+            at.chat_input[0].set_value(text).run()
+            recorder.add("turn_latency", time.perf_counter() - started)
+    except Exception:
+        recorder.error()
+
+
+def run_apptest(args, base_url, recorder):
+    os.environ["OPENAI_BASE_URL"] = base_url
+    journal_path = os.path.join(tempfile.mkdtemp(), "journal.db")
+    threads = [
+        threading.Thread(target=apptest_participant, args=(i, recorder, args.think_time, journal_path))
+        for i in range(args.participants)
+    ]
+    for t in threads:
+        t.start()
+        time.sleep(args.ramp_up / max(1, args.participants))
+    for t in threads:
+        t.join()
+    return {}
+
+
+def run(args):
+    mock, base_url = start_mock(args.port, args.ttft, args.tokens_per_sec, args.fail_rate)
+    recorder = Recorder()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    try:
+        extra = (run_engine if args.driver == "engine" else run_apptest)(args, base_url, recorder)
+    finally:
+        mock.terminate()
+    wall = time.perf_counter() - started
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (usage.ru_utime + usage.ru_stime) - (usage_before.ru_utime + usage_before.ru_stime)
+
+    result = {
+        "config": vars(args),
+        "wall_seconds": round(wall, 2),
+        "errors": recorder.errors,
+        "cpu_seconds_per_session": round(cpu / args.participants, 4),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "rss_mb_per_session": round((usage.ru_maxrss - usage_before.ru_maxrss) / 1024 / args.participants, 3),
+        "latency": summarize(recorder.samples),
+        **extra,
+    }
+    print(json.dumps(result, indent=2, default=str))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2, default=str)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        base = json.load(f)
+    with open(args.candidate) as f:
+        cand = json.load(f)
+    print(f"{'metric':<36}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    rows = [("cpu_seconds_per_session",), ("rss_mb_per_session",), ("errors",)]
+    for metric in sorted(set(base["latency"]) | set(cand["latency"])):
+        for pct in ("p50", "p95", "p99"):
+            rows.append(("latency", metric, pct))
+    for path in rows:
+        b, c = base, cand
+        for key in path:
+            b = b.get(key, {}) if isinstance(b, dict) else None
+            c = c.get(key, {}) if isinstance(c, dict) else None
+        if not isinstance(b, (int, float)) or not isinstance(c, (int, float)):
+            continue
+        change = f"{(c - b) / b * 100:+.1f}%" if b else "n/a"
+        print(f"{'.'.join(path[1:]) or path[0]:<36}{b:>12.4f}{c:>12.4f}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent participant load test")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_cmd = sub.add_parser("run")
+    run_cmd.add_argument("--driver", choices=("engine", "apptest"), default="engine")
+    run_cmd.add_argument("--client", choices=("threads", "async"), default="threads",
+                         help="engine driver: LLMClient per thread or the shared asyncio StreamEngine")
+    run_cmd.add_argument("--participants", type=int, default=50)
+    run_cmd.add_argument("--ramp-up", type=float, default=10.0, help="seconds to start all participants")
+    run_cmd.add_argument("--think-time", type=float, default=2.0, help="mean seconds between turns")
+    run_cmd.add_argument("--ttft", type=float, default=0.5)
+    run_cmd.add_argument("--tokens-per-sec", type=float, default=60.0)
+    run_cmd.add_argument("--fail-rate", type=float, default=0.0)
+    run_cmd.add_argument("--sheets-latency", type=float, default=0.3)
+    run_cmd.add_argument("--port", type=int, default=8765)
+    run_cmd.add_argument("--out", help="write the JSON result here")
+    cmp_cmd = sub.add_parser("compare")
+    cmp_cmd.add_argument("baseline")
+    cmp_cmd.add_argument("candidate")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Local mock of the OpenAI chat completions endpoint for benchmarks.
+
+Streams SSE chunks in the same shape as the real API (including the final
+usage chunk when ``stream_options.include_usage`` is set), with a
+configurable time to first token and token rate. Replies follow the app's
+local question-bank protocol (quiz_engine): the model never writes quiz or
+exam questions or scoring tags, it ends a topic with ``[QUIZ]``, announces
+the exam, and writes feedback for answers the app has already graded.
+They are scripted from the last user message and the app's per-turn
+instruction, so simulated participants can walk through the whole lesson
+without any server-side state:
+
+    graded-answer instruction -> short feedback (+ "ready for the next
+                                 topic / final exam?" after a mini-quiz)
+    unclear-answer instruction -> a request to answer with a letter
+    "quiz"              -> a wrap-up sentence ending with [QUIZ]
+    "start exam"        -> "Now we will begin the final exam ..."
+    anything else       -> a ~120 word teaching segment with a check-in
+
+    python bench/mock_openai.py --port 8765 --ttft 0.4 --tokens-per-sec 60
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run app2avatar.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TEACHING = (
+    "Classical conditioning is a learning process in which a neutral stimulus becomes "
+    "associated with a meaningful one. In Pavlov's experiments, dogs heard a bell before "
+    "receiving food; after several pairings the bell alone caused salivation. The food is "
+    "the unconditioned stimulus, salivation to food the unconditioned response, the bell "
+    "becomes the conditioned stimulus and salivation to the bell the conditioned response. "
+    "A everyday example is feeling hungry when you hear a familiar snack wrapper, because "
+    "that sound has repeatedly come right before eating. Extinction happens when the bell "
+    "keeps ringing without food and the response fades. Ready to move on?"
+)
+QUIZ_DUE = "That covers the key ideas of this topic, so let's check your understanding. [QUIZ]"
+EXAM_START = "Great work on all three topics. Now we will begin the final exam. I will ask 10 questions one by one."
+
+
+def scripted_reply(messages):
+    last_user = max((i for i, m in enumerate(messages) if m["role"] == "user"), default=-1)
+    text = messages[last_user]["content"].lower() if last_user >= 0 else ""
+    # 本轮的动态指令是最后一个用户消息之后的系统消息（见 app2avatar.turn_tail）
+    tail = " ".join(m["content"] for m in messages[last_user + 1:] if m["role"] == "system")
+    if "has graded the student's answer" in tail:
+        reply = ("Excellent, that's exactly right." if "which is CORRECT" in tail
+                 else "Not quite, but that's a common mix-up. Let's look at why the other option fits better.")
+        if "ready for the next topic" in tail:
+            reply += " Are you ready for the next topic?"
+        elif "ready for the final exam" in tail:
+            reply += " Are you ready for the final exam?"
+        return reply
+    if "does not clearly choose" in tail:
+        return "Please answer with a single letter: A, B, C or D."
+    if "start exam" in text:
+        return EXAM_START
+    if "quiz" in text:
+        return QUIZ_DUE
+    return TEACHING
+
+
+def tokenize(text):
+    return re.findall(r"\S+\s*", text)
+
+
+class MockOpenAI:
+    def __init__(self, ttft=0.3, tokens_per_sec=50.0, jitter=0.2, fail_rate=0.0):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with mock._lock:
+                    mock.requests += 1
+                if mock.fail_rate and random.random() < mock.fail_rate:
+                    self._json(429, {"error": {"message": "mock rate limit", "type": "rate_limit"}})
+                    return
+                reply = scripted_reply(body.get("messages", []))
+                if body.get("stream"):
+                    self._stream(body, reply)
+                else:
+                    time.sleep(mock._delay(mock.ttft))
+                    self._json(200, {
+                        "id": "chatcmpl-" + uuid.uuid4().hex, "object": "chat.completion",
+                        "created": int(time.time()), "model": body.get("model", "mock"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": reply}}],
+                        "usage": mock._usage(body, reply),
+                    })
+
+            def _json(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body, reply):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                base = {"id": "chatcmpl-" + uuid.uuid4().hex, "object": "chat.completion.chunk",
+                        "created": int(time.time()), "model": body.get("model", "mock")}
+                try:
+                    time.sleep(mock._delay(mock.ttft))
+                    for tok in tokenize(reply):
+                        self._event(dict(base, choices=[{"index": 0, "delta": {"content": tok}, "finish_reason": None}]))
+                        time.sleep(mock._delay(1.0 / mock.tokens_per_sec))
+                    self._event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+                    if body.get("stream_options", {}).get("include_usage"):
+                        self._event(dict(base, choices=[], usage=mock._usage(body, reply)))
+                    self._chunk(b"data: [DONE]\n\n")
+                    self._chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _event(self, payload):
+                self._chunk(b"data: " + json.dumps(payload).encode() + b"\n\n")
+
+            def _chunk(self, data):
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def _delay(self, seconds):
+        return max(0.0, seconds * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    @staticmethod
+    def _usage(body, reply):
+        prompt = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        completion = len(tokenize(reply))
+        return {"prompt_tokens": prompt, "completion_tokens": completion,
+                "total_tokens": prompt + completion,
+                "prompt_tokens_details": {"cached_tokens": 0}}
+
+
+def start_server(port=0, **kwargs):
+    """
+    在后台线程启动 mock 服务，返回 (server, base_url)
+    """
+    mock = MockOpenAI(**kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), mock.handler())
+    server.daemon_threads = True
+    server.mock = mock
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI streaming server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server, url = start_server(args.port, ttft=args.ttft, tokens_per_sec=args.tokens_per_sec,
+                               fail_rate=args.fail_rate)
+    print(f"Mock OpenAI listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
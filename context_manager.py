@@ -0,0 +1,191 @@
+"""
+Token-aware conversation context
+
+Token counts are estimated offline (tiktoken when installed, a byte
+heuristic otherwise) and tracked per message as turns arrive. When the
+history grows past the budget, the oldest turns are folded into a compact
+extractive summary, so the prompt sent on every call stays roughly flat
+while the system prompt and the exam state stay pinned. Folding goes down
+to a low-water mark in one step, so the summary (and with it the cached
+prompt prefix) stays the same for several turns between folds.
+"""
+import re
+
+MESSAGE_OVERHEAD = 4
+TAG_RE = re.compile(r"\[(?:CORRECT|INCORRECT)\]\s*")
+SENTENCE_RE = re.compile(r"(.+?[.!?])(?:\s|$)", re.S)
+
+_encoder = None
+
+
+def _get_encoder():
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoder = False
+    return _encoder
+
+
+def estimate_tokens(text):
+    """
+    估算文本 token 数（不联网）
+    """
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text))
+    # ~4 bytes per token for English; CJK text is 3 bytes per char and
+    # roughly one token per char, which this also approximates.
+    return max(1, (len(text.encode("utf-8")) + 3) // 4)
+
+
+def message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def first_sentence(text, limit=160):
+    text = TAG_RE.sub("", text).strip()
+    match = SENTENCE_RE.match(text)
+    sentence = (match.group(1) if match else text).replace("\n", " ").strip()
+    if len(sentence) > limit:
+        sentence = sentence[:limit - 3].rstrip() + "..."
+    return sentence
+
+
+class ContextManager:
+    """
+    Keeps ``messages[0]`` (the system prompt) pinned, a running summary of
+    folded turns, a pinned exam-state note and the most recent turns that
+    fit into ``history_budget`` tokens.
+
+    ``sync(messages)`` only looks at messages it has not seen yet, so the
+    per-turn cost does not grow with the session. Once the history passes
+    ``history_budget``, turns are folded until it is under ``low_water``
+    (default 60% of the budget).
+    """
+
+    def __init__(self, history_budget=2500, summary_budget=500, min_recent=6, exam_questions=10,
+                 local_questions=False, low_water=None):
+        self.history_budget = history_budget
+        self.low_water = int(history_budget * 0.6) if low_water is None else low_water
+        self.summary_budget = summary_budget
+        self.min_recent = min_recent
+        self.exam_questions = exam_questions
+        # 题目由本地题库给出时，考试状态说明里不要求模型出下一题
+        self.local_questions = local_questions
+
+        self._seen = 0
+        self._start = 1                 # index of the first unfolded message
+        self._tokens = []               # per-message token estimates
+        self.history_tokens = 0         # tokens of messages[_start:]
+        self.summary_lines = []
+        self.summary_tokens = 0
+        self.folded_count = 0
+        self.exam_started = False
+        self.exam_answered = 0
+
+    # --- Incremental bookkeeping ---
+
+    def sync(self, messages):
+        for message in messages[self._seen:]:
+            tokens = message_tokens(message)
+            self._tokens.append(tokens)
+            if self._seen > 0:
+                self.history_tokens += tokens
+            self._track_exam(message)
+            self._seen += 1
+        self._fold(messages)
+
+    def _track_exam(self, message):
+        if message["role"] != "assistant":
+            return
+        content = message["content"]
+        if "begin the final exam" in content.lower():
+            self.exam_started = True
+            self.exam_answered = 0
+        elif self.exam_started and ("[CORRECT]" in content or "[INCORRECT]" in content):
+            self.exam_answered += 1
+
+    def _fold(self, messages):
+        if self.history_tokens <= self.history_budget:
+            return
+        # 一次折叠到低水位：之后几轮摘要不变，发送的前缀可以继续命中缓存
+        while self.history_tokens > self.low_water and self._seen - self._start > self.min_recent:
+            message = messages[self._start]
+            self.history_tokens -= self._tokens[self._start]
+            self._start += 1
+            self.folded_count += 1
+            line = self._summarize(message)
+            if line:
+                self._add_summary_line(line)
+
+    def _summarize(self, message):
+        if message["role"] != "assistant":
+            return None
+        content = message["content"]
+        if "[CORRECT]" in content:
+            return "Student answered a question correctly: " + first_sentence(content, 100)
+        if "[INCORRECT]" in content:
+            return "Student answered a question incorrectly: " + first_sentence(content, 100)
+        return "Covered: " + first_sentence(content)
+
+    def _add_summary_line(self, line):
+        line = "- " + line
+        self.summary_lines.append(line)
+        self.summary_tokens += estimate_tokens(line) + 1
+        while self.summary_tokens > self.summary_budget and len(self.summary_lines) > 1:
+            dropped = self.summary_lines.pop(0)
+            self.summary_tokens -= estimate_tokens(dropped) + 1
+
+    # --- Prompt assembly ---
+
+    def summary_message(self):
+        if not self.summary_lines:
+            return None
+        text = (
+            "Summary of the earlier part of this session (older turns are omitted):\n"
+            + "\n".join(self.summary_lines)
+        )
+        return {"role": "system", "content": text}
+
+    def exam_message(self):
+        if not self.exam_started:
+            return None
+        answered = min(self.exam_answered, self.exam_questions)
+        text = (
+            f"Exam state: the final exam is in progress. {answered} of {self.exam_questions} "
+            f"questions have been answered and graded. Do not restart the exam."
+        )
+        if answered < self.exam_questions and not self.local_questions:
+            text += f" Continue with Question {answered + 1}."
+        return {"role": "system", "content": text}
+
+    def build(self, messages, tail=None):
+        """
+        返回本次 API 调用实际发送的消息列表
+
+        Layout is ordered from most to least stable so provider-side prefix
+        caching can reuse as much as possible: the static system prompt,
+        the running summary (changes only when turns are folded), the
+        unfolded history, then per-call volatile notes (exam state and
+        ``tail``) last.
+        """
+        self.sync(messages)
+        context = [messages[0]]
+        summary = self.summary_message()
+        if summary is not None:
+            context.append(summary)
+        context.extend(messages[self._start:])
+        exam = self.exam_message()
+        if exam is not None:
+            context.append(exam)
+        if tail:
+            context.extend(tail)
+        return context
+
+    def prompt_tokens(self, messages, tail=None):
+        return sum(message_tokens(m) for m in self.build(messages, tail))
@@ -0,0 +1,106 @@
+"""
+情感与困惑检测词典引擎
+
+All lexicon terms are compiled into one regular expression (longest term
+first, word boundaries on both sides, flexible whitespace inside phrases)
+so a message is scanned once no matter how many terms there are. The same
+engine scores single live messages and whole batches of stored dialogues.
+"""
+import os
+import re
+from functools import lru_cache
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicons")
+
+_APOSTROPHES = str.maketrans({"’": "'", "‘": "'"})
+
+
+def load_terms(path):
+    """
+    读取词典文件：每行一个词或短语，# 开头为注释
+    """
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def normalize(text):
+    return text.translate(_APOSTROPHES).lower()
+
+
+def _term_pattern(term):
+    words = [re.escape(w) for w in term.split()]
+    body = r"\s+".join(words)
+    # \b does not work next to punctuation such as "what?", so use lookarounds
+    return rf"(?<!\w){body}(?!\w)"
+
+
+class Lexicon:
+    """
+    ``score(text)`` returns ``(positive, negative)``: the number of distinct
+    positive and negative terms found. Overlapping terms resolve to the
+    longest one, so "don't understand" does not also count "understand".
+    """
+
+    def __init__(self, positive, negative):
+        self.polarity = {}
+        for term in positive:
+            self.polarity[normalize(term)] = 1
+        for term in negative:
+            self.polarity[normalize(term)] = -1
+        terms = sorted(self.polarity, key=len, reverse=True)
+        self.pattern = re.compile("|".join(_term_pattern(t) for t in terms)) if terms else None
+
+    @classmethod
+    def from_files(cls, positive_path, negative_path):
+        return cls(load_terms(positive_path), load_terms(negative_path))
+
+    def matches(self, text):
+        """
+        返回消息中出现的（不重复的）词典词条
+        """
+        if self.pattern is None or not text:
+            return set()
+        return {" ".join(m.split()) for m in self.pattern.findall(normalize(text))}
+
+    def _count(self, terms):
+        positive = negative = 0
+        for term in terms:
+            if self.polarity.get(term, 0) > 0:
+                positive += 1
+            else:
+                negative += 1
+        return positive, negative
+
+    def score(self, text):
+        return self._count(self.matches(text))
+
+    def score_batch(self, texts):
+        """
+        批量打分：返回包含 positive / negative / confused 列的 DataFrame
+
+        The regex runs through pandas' vectorized string methods; without
+        pandas a list of ``(positive, negative)`` tuples is returned instead.
+        """
+        try:
+            import pandas as pd
+        except ImportError:
+            return [self.score(t) for t in texts]
+
+        series = pd.Series(list(texts), dtype="object").fillna("")
+        if self.pattern is None:
+            found = pd.Series([[]] * len(series), index=series.index)
+        else:
+            normalized = series.str.translate(_APOSTROPHES).str.lower()
+            found = normalized.str.findall(self.pattern)
+        counts = [self._count({" ".join(m.split()) for m in terms}) for terms in found]
+        frame = pd.DataFrame(counts, columns=["positive", "negative"], index=series.index)
+        frame["confused"] = frame["negative"] > 0
+        return frame
+
+
+@lru_cache(maxsize=None)
+def default_lexicon():
+    return Lexicon.from_files(
+        os.path.join(LEXICON_DIR, "positive.txt"),
+        os.path.join(LEXICON_DIR, "negative.txt"),
+    )
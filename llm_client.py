@@ -0,0 +1,235 @@
+"""
+进程级共享的 LLM 客户端
+
+One OpenAI client per process over a tuned httpx connection pool with
+keep-alive, per-request deadlines and retries with jittered backoff. A
+streamed completion is only retried while nothing has been shown to the
+participant yet, so a retry can never duplicate visible text. Pool and
+connection-reuse counters are available from ``stats()``; ``on_connect``
+receives the TCP + TLS setup time of every new connection.
+
+The app streams through ``stream_engine.StreamEngine`` (which also does
+the hedging); this synchronous client serves non-streaming background
+calls and scripts such as the load test.
+"""
+import collections
+import logging
+import random
+import threading
+import time
+
+import httpx
+import openai
+from openai import OpenAI
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+
+def is_retryable(exc):
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS
+    return isinstance(exc, (openai.APIConnectionError, httpx.TransportError, TimeoutError))
+
+
+def retry_after(exc):
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class ClientBase:
+    """
+    Counters, the recent-TTFT window and retry backoff, shared by
+    ``LLMClient`` and the asyncio ``stream_engine.StreamEngine``.
+    """
+
+    def __init__(self, deadline=120.0, max_attempts=3, base_backoff=0.5, max_backoff=8.0,
+                 on_connect=None, ttft_window=200):
+        self.deadline = deadline
+        self.on_connect = on_connect
+        self._ttfts = collections.deque(maxlen=ttft_window)
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "connections_opened": 0,
+            "retries": 0,
+            "failures": 0,
+            "streams": 0,
+            "hedged_streams": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "hedge_wasted_tokens": 0,
+        }
+
+    # --- Stats ---
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _connection_tracer(self, request):
+        """
+        返回 httpcore trace 事件的处理函数（同步 / 异步客户端各自包一层）
+        """
+        self._count("requests")
+        tls = request.url.scheme == "https"
+        connect_started = []
+
+        def on_event(event_name):
+            # httpcore 只在新建连接时触发 connect_tcp
+            if event_name == "connection.connect_tcp.started":
+                connect_started.append(time.perf_counter())
+            elif event_name == "connection.connect_tcp.complete":
+                self._count("connections_opened")
+                if not tls:
+                    self._connected(connect_started)
+            elif event_name == "connection.start_tls.complete":
+                self._connected(connect_started)
+
+        return on_event
+
+    def _connected(self, connect_started):
+        if self.on_connect is not None and connect_started:
+            self.on_connect(time.perf_counter() - connect_started[0])
+
+    def _first_token(self, seconds):
+        with self._lock:
+            self._ttfts.append(seconds)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        requests = snapshot["requests"]
+        snapshot["connection_reuse"] = (
+            round(1 - snapshot["connections_opened"] / requests, 3) if requests else 0.0
+        )
+        hedged = snapshot["hedged_streams"]
+        snapshot["hedge_rate"] = round(snapshot["hedges"] / hedged, 3) if hedged else 0.0
+        return snapshot
+
+    def ttft_percentile(self, pct):
+        """
+        最近若干次流式调用首个 token 时间的百分位；样本不足时返回 None
+        """
+        with self._lock:
+            samples = sorted(self._ttfts)
+        if len(samples) < 20:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct))]
+
+    def _backoff(self, attempt, exc):
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1))
+        delay = random.uniform(0, delay)
+        hinted = retry_after(exc)
+        if hinted is not None:
+            delay = max(delay, min(hinted, self.max_backoff))
+        return delay
+
+
+class LLMClient(ClientBase):
+    """
+    Thread-safe; share one instance across all sessions of the process.
+    """
+
+    def __init__(self, api_key, base_url=None, max_connections=100, max_keepalive=20,
+                 keepalive_expiry=60.0, connect_timeout=5.0, read_timeout=30.0,
+                 deadline=120.0, max_attempts=3, base_backoff=0.5, max_backoff=8.0,
+                 on_connect=None, ttft_window=200):
+        super().__init__(deadline, max_attempts, base_backoff, max_backoff, on_connect, ttft_window)
+        self.http = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            event_hooks={"request": [self._on_request]},
+        )
+        self.openai = OpenAI(api_key=api_key, base_url=base_url, http_client=self.http, max_retries=0)
+
+    def _on_request(self, request):
+        on_event = self._connection_tracer(request)
+
+        def trace(event_name, info):
+            on_event(event_name)
+
+        request.extensions["trace"] = trace
+
+    # --- Calls ---
+
+    def stream_chat(self, deadline=None, **kwargs):
+        """
+        流式调用，逐个返回 chunk
+
+        Retries connection errors, timeouts, 429 and 5xx until the first
+        chunk with content has been yielded; after that any error is
+        raised to the caller. ``deadline`` (seconds) bounds the whole call.
+        """
+        started = time.monotonic()
+        deadline_at = started + (deadline or self.deadline)
+        attempt = 0
+        self._count("streams")
+        while True:
+            attempt += 1
+            shown = False
+            try:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded("LLM request deadline exceeded")
+                stream = self.openai.chat.completions.create(
+                    stream=True,
+                    timeout=httpx.Timeout(min(remaining, self.http.timeout.read), connect=self.http.timeout.connect),
+                    **kwargs,
+                )
+                try:
+                    for chunk in stream:
+                        if time.monotonic() > deadline_at:
+                            raise DeadlineExceeded("LLM request deadline exceeded")
+                        if not shown and chunk.choices and chunk.choices[0].delta.content:
+                            shown = True
+                            self._first_token(time.monotonic() - started)
+                        yield chunk
+                finally:
+                    stream.close()
+                return
+            except Exception as e:
+                if shown or attempt >= self.max_attempts or not is_retryable(e):
+                    self._count("failures")
+                    raise
+                delay = self._backoff(attempt, e)
+                if time.monotonic() + delay >= deadline_at:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                logger.warning("LLM stream failed before first token (%s), retry %d in %.2fs", e, attempt, delay)
+                time.sleep(delay)
+
+    def complete(self, deadline=None, **kwargs):
+        """
+        非流式调用（用于预热等后台任务），同样带重试
+        """
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return self.openai.chat.completions.create(timeout=max(0.1, deadline_at - time.monotonic()), **kwargs)
+            except Exception as e:
+                delay = self._backoff(attempt, e)
+                if attempt >= self.max_attempts or not is_retryable(e) or time.monotonic() + delay >= deadline_at:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                time.sleep(delay)
@@ -0,0 +1,209 @@
+"""
+投机预取下一段教学内容
+
+After a teaching segment that ends with a check-in ("Ready to move on?"),
+the next segment is generated in the background as if the participant
+had answered "yes". If the real reply is a plain affirmative, the
+buffered (or still streaming) text is committed at once; otherwise it is
+cancelled and its tokens are counted as wasted. Only tokens the
+speculation actually added count: its completion and the part of the
+prompt the provider's prefix cache could not serve (the conversation
+prefix was sent, and cached, by the turn that produced the check-in).
+
+Speculation is capped per session (wasted tokens, and a minimum hit rate
+once a few attempts have been made) and per process (concurrent
+speculative streams).
+"""
+import re
+import threading
+
+import telemetry
+from context_manager import estimate_tokens
+
+ASSUMED_REPLY = "Yes, I'm ready."
+
+# 纯肯定回复里允许出现的词；必须至少包含一个 CORE 词
+_CORE = {
+    "yes", "yeah", "yep", "yup", "ya", "sure", "ok", "okay", "ready", "continue", "next",
+    "proceed", "sense", "clear", "got", "good", "great", "perfect", "fine", "alright",
+    "understood", "understand", "go", "course", "cool", "absolutely", "definitely",
+}
+_FILLER = {
+    "i", "i'm", "im", "am", "it", "that", "this", "makes", "sounds", "lets", "let's", "let",
+    "us", "move", "on", "ahead", "please", "of", "totally", "thanks", "thank", "you", "now",
+    "so", "far", "very", "all", "right", "do", "nice", "really", "much", "to", "the", "thing",
+}
+_MAX_WORDS = 8
+_WORD_RE = re.compile(r"[a-z']+")
+
+_CHECK_IN_PHRASES = (
+    "make sense", "makes sense", "ready", "clear", "proceed", "move on", "sound",
+    "continue", "next section", "next part", "next topic", "follow",
+)
+
+STARTED = telemetry.REGISTRY.counter("tutor_prefetch_started_total", "Speculative next-segment generations started")
+HITS = telemetry.REGISTRY.counter("tutor_prefetch_hits_total", "Speculative replies committed")
+MISSES = telemetry.REGISTRY.counter("tutor_prefetch_misses_total", "Speculative replies discarded")
+SKIPPED = telemetry.REGISTRY.counter("tutor_prefetch_skipped_total", "Check-ins not prefetched because of a cap")
+FAILED = telemetry.REGISTRY.counter("tutor_prefetch_failed_total", "Speculative replies that ended with an error")
+USED_TOKENS = telemetry.REGISTRY.counter("tutor_prefetch_used_tokens_total", "Tokens of committed speculative replies")
+WASTED_TOKENS = telemetry.REGISTRY.counter("tutor_prefetch_wasted_tokens_total", "Tokens of discarded speculative replies")
+
+
+def is_affirmative(text):
+    """
+    简短的纯肯定回复（"yes", "ok ready", "makes sense, let's continue"）
+    """
+    if not text or "?" in text:
+        return False
+    words = _WORD_RE.findall(text.lower().replace("’", "'"))
+    if not words or len(words) > _MAX_WORDS:
+        return False
+    return all(w in _CORE or w in _FILLER for w in words) and any(w in _CORE for w in words)
+
+
+def is_check_in(reply):
+    """
+    回复是否以确认式提问结尾（"Does this make sense?" / "Shall I proceed?"）
+    """
+    tail = reply.rstrip()[-160:]
+    if not tail.endswith("?"):
+        return False
+    last = tail.rsplit("\n", 1)[-1].lower()
+    return any(phrase in last for phrase in _CHECK_IN_PHRASES)
+
+
+def new_session_stats():
+    return {"attempts": 0, "hits": 0, "misses": 0, "errors": 0, "wasted_tokens": 0}
+
+
+class Speculation:
+    """
+    A speculative reply: the ``StreamHandle`` it is streaming into (on the
+    shared engine loop) plus the turn tail and prompt estimate it was
+    generated for. ``uncached_estimate`` is the part of the prompt that
+    is new since the previous request (default: the whole prompt).
+    ``on_discard()``, if set by the caller, runs once the speculation has
+    been discarded (e.g. to settle its rate-limit reservation).
+    """
+
+    def __init__(self, tail, prompt_estimate, handle, uncached_estimate=None):
+        self.tail = tail
+        self.prompt_estimate = prompt_estimate
+        self.uncached_estimate = prompt_estimate if uncached_estimate is None else uncached_estimate
+        self.handle = handle
+        self.on_discard = None
+
+    @property
+    def usage(self):
+        return self.handle.usage
+
+    @property
+    def error(self):
+        return self.handle.error
+
+    @property
+    def usable(self):
+        return self.handle.usable
+
+    @property
+    def text(self):
+        return self.handle.text
+
+    def tokens(self):
+        """
+        实际 token 数；流被取消、没有 usage 时按估算
+        """
+        if self.usage is not None:
+            return self.usage.total_tokens
+        return self.prompt_estimate + estimate_tokens(self.text)
+
+    def wasted_tokens(self):
+        """
+        丢弃时额外花掉的 token：补全加上未命中前缀缓存的提示词
+        """
+        if self.usage is not None:
+            details = getattr(self.usage, "prompt_tokens_details", None)
+            cached = getattr(details, "cached_tokens", 0) or 0
+            return (self.usage.completion_tokens or 0) + max(0, (self.usage.prompt_tokens or 0) - cached)
+        return self.uncached_estimate + estimate_tokens(self.text)
+
+    def cancel(self):
+        self.handle.cancel()
+
+    def deltas(self):
+        return self.handle.deltas()
+
+
+class Prefetcher:
+    """
+    Shared per process. ``start`` returns a ``Speculation`` or None when a
+    cap applies; ``commit`` / ``discard`` settle the per-session stats.
+    A miss costs at most one reply (``max_tokens``) plus the uncached
+    prompt, so the default ``max_wasted_tokens`` leaves room for the
+    ``warmup`` attempts and the hit-rate cap decides after that.
+    """
+
+    def __init__(self, max_inflight=20, max_wasted_tokens=5000, min_hit_rate=0.3, warmup=4):
+        self.max_wasted_tokens = max_wasted_tokens
+        self.min_hit_rate = min_hit_rate
+        self.warmup = warmup
+        self._slots = threading.BoundedSemaphore(max_inflight)
+
+    def allows(self, stats):
+        if stats["wasted_tokens"] >= self.max_wasted_tokens:
+            return False
+        decided = stats["hits"] + stats["misses"]
+        return decided < self.warmup or stats["hits"] / decided >= self.min_hit_rate
+
+    def start(self, stats, tail, prompt_estimate, launch, uncached_estimate=None):
+        """
+        ``launch(on_done)`` starts the stream and returns its handle; it may
+        raise (e.g. no free rate-limit quota), which skips this check-in
+        """
+        if not self.allows(stats) or not self._slots.acquire(blocking=False):
+            SKIPPED.inc()
+            return None
+        try:
+            handle = launch(self._slots.release)
+        except Exception:
+            self._slots.release()
+            SKIPPED.inc()
+            return None
+        stats["attempts"] += 1
+        STARTED.inc()
+        return Speculation(tail, prompt_estimate, handle, uncached_estimate)
+
+    def commit(self, spec, stats):
+        stats["hits"] += 1
+        HITS.inc()
+        USED_TOKENS.inc(spec.tokens())
+
+    def discard(self, spec, stats):
+        spec.cancel()
+        if spec.error is not None:
+            # 请求失败：不算一次未命中（不影响命中率），但已经生成的部分照样计入浪费
+            stats["errors"] += 1
+            FAILED.inc()
+            wasted = spec.wasted_tokens() if spec.text or spec.usage is not None else 0
+        else:
+            wasted = spec.wasted_tokens()
+            stats["misses"] += 1
+            MISSES.inc()
+        stats["wasted_tokens"] += wasted
+        WASTED_TOKENS.inc(wasted)
+        if spec.on_discard is not None:
+            spec.on_discard()
+
+    def stats(self):
+        decided = HITS.value + MISSES.value
+        return {
+            "started": STARTED.value,
+            "hits": HITS.value,
+            "misses": MISSES.value,
+            "skipped": SKIPPED.value,
+            "failed": FAILED.value,
+            "hit_rate": round(HITS.value / decided, 3) if decided else 0.0,
+            "used_tokens": USED_TOKENS.value,
+            "wasted_tokens": WASTED_TOKENS.value,
+        }
@@ -0,0 +1,283 @@
+"""
+本地测验引擎（题库 + 即时判分）
+
+Mini-quiz and final-exam questions come from ``questions/bank.json``
+instead of being written by the model, and answers are graded in-process.
+The model is only asked for the short feedback text. The local grade is
+written into the stored reply as the usual ``[CORRECT]`` / ``[INCORRECT]``
+tag, so scoring, the context manager and offline analytics keep reading
+the same format.
+
+The engine is a small state machine kept per session:
+
+    teaching --[QUIZ] from the model--> mini-quiz question shown
+    mini-quiz answered --> teaching (next topic)
+    "begin the final exam" from the model --> exam question 1 shown
+    exam answer n --> question n+1 ... --> "The session is complete."
+"""
+import json
+import os
+import random
+import re
+from functools import lru_cache
+
+from stream_parser import EXAM_START, QUIZ_DUE
+
+QUESTION_BANK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions", "bank.json")
+
+LETTERS = "ABCD"
+# 先认写出的选项内容；再收集所有点名的字母："B)", "b.", "(c)", "D" 单独一行;
+# "answer: d", "option C", "I'd pick b"; 句中单独的大写字母（"A" 也可能是冠词，只认 "A)" 和句末）。
+# 开头的大写字母后面跟着单词时是句子开头（"A neutral stimulus"），不算选项
+_LEADING_RE = re.compile(r"^\s*\(?(?:([A-D])|([a-d]))\s*(?=[).:,!]|$)")
+_KEYWORD_RE = re.compile(
+    r"\b(?:answer|option|choice|choose|pick|go with|select)(?:\s+is)?\s*[:\-]?\s*\(?([A-D])(?![\w'])", re.I
+)
+_STANDALONE_RE = re.compile(r"(?<![\w'])(?:([B-D])(?![\w'])|(A)(?=\))|(A)[.!]?\s*$)")
+_ARTICLE_RE = re.compile(r"^(?:an?|the)\s+")
+
+# 教学阶段的固定指令（每轮相同，放在上下文末尾）
+TEACHING_NOTE = (
+    "Quiz and exam questions are supplied by the app, not by you. "
+    "When a topic's Mini-Quiz is due, finish your message and end it with exactly [QUIZ] "
+    "instead of writing a question. When all 3 topics are finished, say "
+    "\"Now we will begin the final exam. I will ask 10 questions one by one.\" and stop; "
+    "do not write any exam question yourself."
+)
+
+
+class Question:
+    __slots__ = ("id", "topic", "text", "options", "answer", "explanation")
+
+    def __init__(self, id, topic, text, options, answer, explanation=""):
+        self.id = id
+        self.topic = topic
+        self.text = text
+        self.options = tuple(options)
+        self.answer = answer
+        self.explanation = explanation
+
+    def option_text(self, letter):
+        return self.options[LETTERS.index(letter)]
+
+    def render(self, heading):
+        lines = [f"**{heading}** {self.text}", ""]
+        lines += [f"{letter}) {option}" for letter, option in zip(LETTERS, self.options)]
+        return "\n".join(lines)
+
+
+class QuestionBank:
+    def __init__(self, topics, exam_per_topic):
+        self.topics = topics                    # [(topic_id, name, [Question, ...]), ...]
+        self.exam_per_topic = list(exam_per_topic)
+        self.by_id = {q.id: q for _, _, questions in topics for q in questions}
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        topics = [
+            (t["id"], t["name"], [
+                Question(q["id"], t["id"], q["question"], q["options"], q["answer"], q.get("explanation", ""))
+                for q in t["questions"]
+            ])
+            for t in data["topics"]
+        ]
+        return cls(topics, data["exam"]["per_topic"])
+
+
+@lru_cache(maxsize=None)
+def default_bank():
+    return QuestionBank.from_file(QUESTION_BANK_PATH)
+
+
+def _option_hits(text, question):
+    """
+    回答里完整出现（按词边界，冠词可省略）的选项
+    """
+    lowered = text.lower()
+    hits = set()
+    for letter, option in zip(LETTERS, question.options):
+        core = _ARTICLE_RE.sub("", option.lower()).strip(" .")
+        if core and re.search(r"(?<![\w'])" + re.escape(core) + r"(?![\w'])", lowered):
+            hits.add(letter)
+    return hits
+
+
+def parse_choice(text, question=None):
+    """
+    从回答中解析选项字母；也接受直接写出的选项内容。无法识别或点名了多个选项时返回 None
+    """
+    if question is not None:
+        hits = _option_hits(text, question)
+        if len(hits) == 1:
+            return hits.pop()
+    letters = set()
+    for pattern in (_LEADING_RE, _KEYWORD_RE, _STANDALONE_RE):
+        for match in pattern.finditer(text):
+            letters.add(next(g for g in match.groups() if g).upper())
+    return letters.pop() if len(letters) == 1 else None
+
+
+class Grade:
+    __slots__ = ("question", "kind", "number", "choice", "correct")
+
+    def __init__(self, question, kind, number, choice):
+        self.question = question
+        self.kind = kind                # "quiz" or "exam"
+        self.number = number            # 1-based topic / exam question number
+        self.choice = choice
+        self.correct = None if choice is None else choice == question.answer
+
+    @property
+    def tag(self):
+        if self.correct is None:
+            return ""
+        return "[CORRECT] " if self.correct else "[INCORRECT] "
+
+
+class QuizEngine:
+    """
+    Questions for a session are drawn once from ``seed`` (the subject ID),
+    so a resumed session gets the same ones. ``state()`` / ``from_state``
+    round-trip through the session journal.
+    """
+
+    def __init__(self, bank, seed):
+        self.bank = bank
+        rng = random.Random(seed)
+        self.quiz_questions = []
+        self.exam_questions = []
+        for (_, _, questions), exam_count in zip(bank.topics, bank.exam_per_topic):
+            picked = rng.sample(questions, 1 + exam_count)
+            self.quiz_questions.append(picked[0])
+            self.exam_questions.extend(picked[1:])
+        rng.shuffle(self.exam_questions)
+
+        self.quizzes_done = 0
+        self.exam_started = False
+        self.exam_answered = 0
+        self.active = None              # ("quiz" | "exam", index) of the open question
+
+    # --- Persistence ---
+
+    def state(self):
+        return {
+            "quiz_questions": [q.id for q in self.quiz_questions],
+            "exam_questions": [q.id for q in self.exam_questions],
+            "quizzes_done": self.quizzes_done,
+            "exam_started": self.exam_started,
+            "exam_answered": self.exam_answered,
+            "active": list(self.active) if self.active else None,
+        }
+
+    @classmethod
+    def from_state(cls, bank, seed, state):
+        engine = cls(bank, seed)
+        if not state:
+            return engine
+        engine.quiz_questions = [bank.by_id[i] for i in state["quiz_questions"]]
+        engine.exam_questions = [bank.by_id[i] for i in state["exam_questions"]]
+        engine.quizzes_done = state["quizzes_done"]
+        engine.exam_started = state["exam_started"]
+        engine.exam_answered = state["exam_answered"]
+        engine.active = tuple(state["active"]) if state.get("active") else None
+        return engine
+
+    # --- Turn handling ---
+
+    @property
+    def finished(self):
+        return self.exam_answered >= len(self.exam_questions)
+
+    def grade(self, answer):
+        """
+        判分（纯本地）；没有进行中的题目时返回 None
+
+        A recognised answer closes the question right away, so the score
+        and the engine state are saved before any model call is made.
+        """
+        if self.active is None:
+            return None
+        kind, index = self.active
+        question = (self.quiz_questions if kind == "quiz" else self.exam_questions)[index]
+        grade = Grade(question, kind, index + 1, parse_choice(answer, question))
+        if grade.correct is not None:
+            self.active = None
+            if kind == "quiz":
+                self.quizzes_done += 1
+            else:
+                self.exam_answered += 1
+        return grade
+
+    def instruction(self, grade):
+        """
+        本轮给模型的附加指令
+        """
+        if grade is None:
+            return None if self.exam_started else TEACHING_NOTE
+        question = grade.question
+        if grade.correct is None:
+            return (
+                "The student's reply does not clearly choose one of the options for the question above. "
+                "Briefly ask them to answer with a letter (A, B, C or D). Do not output scoring tags."
+            )
+        verdict = "CORRECT" if grade.correct else "INCORRECT"
+        text = (
+            f"The app has graded the student's answer to the question above: they chose {grade.choice}, "
+            f"which is {verdict}. The correct answer is {question.answer}) {question.option_text(question.answer)}. "
+            f"Background: {question.explanation} "
+            "Give brief feedback (2-3 sentences) in your teaching style. "
+            "Do not output [CORRECT] or [INCORRECT] tags and do not ask another quiz or exam question."
+        )
+        if grade.kind == "quiz":
+            if grade.number < len(self.quiz_questions):
+                text += " Then ask if they are ready for the next topic."
+            else:
+                text += " Then ask if they are ready for the final exam."
+        else:
+            text += " Do not say that the session is complete."
+        return text
+
+    def fallback_feedback(self, grade):
+        """
+        模型调用失败时的本地反馈文字（判分已生效，本轮照常结束）
+        """
+        question = grade.question
+        if grade.correct:
+            text = "Correct!"
+        else:
+            text = f"Not quite. The correct answer is {question.answer}) {question.option_text(question.answer)}."
+        if question.explanation:
+            text += f" {question.explanation}"
+        if grade.kind == "quiz":
+            text += (" Are you ready for the next topic?" if grade.number < len(self.quiz_questions)
+                     else " Are you ready for the final exam?")
+        return text
+
+    def after_reply(self, grade, events):
+        """
+        模型回复结束后推进状态；返回需要追加到回复末尾的文本（下一题或结束语），没有则为 None
+        """
+        if grade is not None and grade.correct is not None:
+            if grade.kind == "quiz":
+                return None
+            if self.finished:
+                return "The session is complete."
+            return self._ask_exam()
+        if grade is not None or self.active is not None:
+            return None
+        if EXAM_START in events and not self.exam_started:
+            self.exam_started = True
+            return self._ask_exam()
+        if QUIZ_DUE in events and not self.exam_started and self.quizzes_done < len(self.quiz_questions):
+            index = self.quizzes_done
+            self.active = ("quiz", index)
+            _, name, _ = self.bank.topics[index]
+            return self.quiz_questions[index].render(f"Mini-Quiz ({name}):")
+        return None
+
+    def _ask_exam(self):
+        index = self.exam_answered
+        self.active = ("exam", index)
+        return self.exam_questions[index].render(f"Question {index + 1} of {len(self.exam_questions)}:")
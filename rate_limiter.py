@@ -0,0 +1,219 @@
+"""
+跨进程共享的 LLM 调用准入控制
+
+Two token buckets, requests per minute and tokens per minute, live in a
+small SQLite file (WAL) so every Streamlit worker process on the host
+draws from the same quota. Callers wait in a shared queue; the next slot
+goes to the waiting session that has been admitted least often in the
+last minute (oldest ticket first on ties), so one busy session cannot
+starve the others when a whole classroom starts at once.
+
+Token use is reserved up front from an estimate and settled against the
+real usage once the reply is done.
+"""
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name        TEXT PRIMARY KEY,
+    level       REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS waiters (
+    ticket      INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id  TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    heartbeat   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS admissions (
+    session_id  TEXT NOT NULL,
+    admitted_at REAL NOT NULL,
+    tokens      INTEGER NOT NULL,
+    waited      REAL NOT NULL,
+    queued      INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_admissions_time ON admissions (admitted_at);
+CREATE INDEX IF NOT EXISTS idx_admissions_session ON admissions (session_id, admitted_at);
+"""
+
+WINDOW = 60.0
+# 等待者超过这么久没有心跳（进程退出、页面关闭）就从队列移除
+STALE_AFTER = 10.0
+HISTORY_KEEP = 3600.0
+
+
+class QueueTimeout(TimeoutError):
+    pass
+
+
+class Admission:
+    __slots__ = ("session_id", "tokens", "waited", "queued", "settled")
+
+    def __init__(self, session_id, tokens, waited, queued):
+        self.session_id = session_id
+        self.tokens = tokens
+        self.waited = waited
+        self.queued = queued
+        self.settled = False
+
+
+class RateLimiter:
+    """
+    ``acquire`` blocks until the call may go out and returns an
+    ``Admission``; pass it to ``settle`` with the real token count once the
+    call has ended for any reason (an unsettled admission keeps its full
+    estimate charged). Settling twice is a no-op.
+    """
+
+    def __init__(self, path, requests_per_minute, tokens_per_minute,
+                 poll_interval=0.25, on_admit=None):
+        self.path = path
+        self.rpm = float(requests_per_minute)
+        self.tpm = float(tokens_per_minute)
+        self.poll_interval = poll_interval
+        self.on_admit = on_admit
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR IGNORE INTO buckets (name, level, updated_at) VALUES ('requests', ?, ?), ('tokens', ?, ?)",
+            (self.rpm, now, self.tpm, now),
+        )
+
+    def _run(self, fn):
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(cur, time.time())
+                cur.execute("COMMIT")
+                return result
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+
+    # --- Buckets ---
+
+    def _levels(self, cur, now):
+        """
+        按经过的时间补充两个桶，返回 (requests, tokens)
+        """
+        levels = {}
+        for name, capacity in (("requests", self.rpm), ("tokens", self.tpm)):
+            level, updated_at = cur.execute(
+                "SELECT level, updated_at FROM buckets WHERE name = ?", (name,)
+            ).fetchone()
+            level = min(capacity, level + (now - updated_at) * capacity / WINDOW)
+            cur.execute("UPDATE buckets SET level = ?, updated_at = ? WHERE name = ?", (level, now, name))
+            levels[name] = level
+        return levels["requests"], levels["tokens"]
+
+    def _take(self, cur, name, amount):
+        cur.execute("UPDATE buckets SET level = level - ? WHERE name = ?", (amount, name))
+
+    # --- Public API ---
+
+    def acquire(self, session_id, tokens, timeout=60.0, on_wait=None):
+        """
+        等待配额。``on_wait(position)`` 在开始排队以及排队位置变化时调用
+        """
+        # 超过每分钟上限的请求永远等不到，按上限预留
+        tokens = int(min(tokens, self.tpm))
+        started = time.time()
+        ticket = self._run(lambda cur, now: cur.execute(
+            "INSERT INTO waiters (session_id, enqueued_at, heartbeat) VALUES (?, ?, ?)",
+            (session_id, now, now),
+        ).lastrowid)
+
+        last_position = None
+        try:
+            while True:
+                queued = last_position is not None
+                admitted, position, wait = self._run(
+                    lambda cur, now: self._try_admit(cur, now, ticket, tokens, queued)
+                )
+                if admitted:
+                    waited = time.time() - started
+                    admission = Admission(session_id, tokens, waited, queued)
+                    if self.on_admit is not None:
+                        self.on_admit(admission)
+                    return admission
+                if time.time() - started >= timeout:
+                    raise QueueTimeout("Timed out waiting for an LLM rate-limit slot")
+                if position != last_position and on_wait is not None:
+                    on_wait(position)
+                last_position = position
+                time.sleep(max(0.01, min(self.poll_interval, wait)))
+        except BaseException:
+            self._run(lambda cur, now: cur.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,)))
+            raise
+
+    def _try_admit(self, cur, now, ticket, tokens, queued):
+        cur.execute("UPDATE waiters SET heartbeat = ? WHERE ticket = ?", (now, ticket))
+        cur.execute("DELETE FROM waiters WHERE heartbeat < ?", (now - STALE_AFTER,))
+        # 公平排队：最近一分钟被放行次数最少的会话优先，其次按先来后到
+        order = [row[0] for row in cur.execute(
+            "SELECT w.ticket FROM waiters w "
+            "LEFT JOIN (SELECT session_id, COUNT(*) AS served FROM admissions "
+            "           WHERE admitted_at > ? GROUP BY session_id) a ON a.session_id = w.session_id "
+            "ORDER BY COALESCE(a.served, 0), w.ticket",
+            (now - WINDOW,),
+        )]
+        position = order.index(ticket) + 1 if ticket in order else 1
+        requests_level, tokens_level = self._levels(cur, now)
+        if position == 1 and requests_level >= 1 and tokens_level >= tokens:
+            self._take(cur, "requests", 1)
+            self._take(cur, "tokens", tokens)
+            session_id, enqueued_at = cur.execute(
+                "SELECT session_id, enqueued_at FROM waiters WHERE ticket = ?", (ticket,)
+            ).fetchone()
+            cur.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+            cur.execute(
+                "INSERT INTO admissions (session_id, admitted_at, tokens, waited, queued) VALUES (?, ?, ?, ?, ?)",
+                (session_id, now, tokens, now - enqueued_at, int(queued)),
+            )
+            cur.execute("DELETE FROM admissions WHERE admitted_at < ?", (now - HISTORY_KEEP,))
+            return True, 0, 0.0
+        # 预计多久后桶里够用（只对队首有意义，其余按轮询间隔）
+        missing = max((1 - requests_level) * WINDOW / self.rpm, (tokens - tokens_level) * WINDOW / self.tpm, 0.0)
+        return False, position, missing
+
+    def settle(self, admission, actual_tokens):
+        """
+        按实际 token 数结算（多退少补，桶可以暂时为负）；每个 admission 只结算一次
+        """
+        if actual_tokens is None or admission.settled:
+            return
+        admission.settled = True
+        delta = actual_tokens - admission.tokens
+        if delta:
+            self._run(lambda cur, now: (self._levels(cur, now), self._take(cur, "tokens", delta)))
+
+    def stats(self):
+        def read(cur, now):
+            requests_level, tokens_level = self._levels(cur, now)
+            admitted, tokens, queued, wait_total, max_wait = cur.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tokens), 0), COALESCE(SUM(queued), 0), "
+                "COALESCE(SUM(waited), 0), COALESCE(MAX(waited), 0) FROM admissions WHERE admitted_at > ?",
+                (now - WINDOW,),
+            ).fetchone()
+            waiting = cur.execute("SELECT COUNT(*) FROM waiters").fetchone()[0]
+            return {
+                "requests_per_minute": self.rpm,
+                "tokens_per_minute": self.tpm,
+                "requests_available": round(requests_level, 1),
+                "tokens_available": round(tokens_level),
+                "admitted_last_minute": admitted,
+                "tokens_last_minute": tokens,
+                "queued_last_minute": queued,
+                "mean_wait_last_minute": round(wait_total / admitted, 3) if admitted else 0.0,
+                "max_wait_last_minute": round(max_wait, 3),
+                "waiting": waiting,
+            }
+        return self._run(read)
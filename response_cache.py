@@ -0,0 +1,77 @@
+"""
+确定性阶段的回复缓存（Phase 1 开场白）
+
+Every session opens with the same trigger on one of two fixed system
+prompts, so the introduction is effectively the same request each time.
+Replies are cached under a key of mode + normalized message prefix, with a
+small bounded set of variants per key so participants do not all see the
+exact same wording.
+"""
+import hashlib
+import logging
+import random
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prefix(messages):
+    return "\n".join(f"{m['role']}:{' '.join(m['content'].split())}" for m in messages)
+
+
+def cache_key(mode, messages):
+    return hashlib.sha256(f"{mode}\n{normalize_prefix(messages)}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Thread-safe in-memory cache. A key is served from cache only once it
+    holds ``max_variants`` replies; until then lookups miss so that live
+    calls keep filling it up.
+    """
+
+    def __init__(self, max_variants=3, max_keys=16):
+        self.max_variants = max_variants
+        self.max_keys = max_keys
+        self._variants = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def is_full(self, key):
+        with self._lock:
+            return len(self._variants.get(key, ())) >= self.max_variants
+
+    def get(self, key):
+        with self._lock:
+            variants = self._variants.get(key, [])
+            if len(variants) >= self.max_variants:
+                self.hits += 1
+                reply = random.choice(variants)
+            else:
+                self.misses += 1
+                reply = None
+            hit_rate = self.hits / (self.hits + self.misses)
+        logger.info("Intro cache %s (hit rate %.0f%%)", "hit" if reply else "miss", hit_rate * 100)
+        return reply
+
+    def add(self, key, reply):
+        if not reply:
+            return
+        with self._lock:
+            if key not in self._variants and len(self._variants) >= self.max_keys:
+                return
+            variants = self._variants.setdefault(key, [])
+            if len(variants) < self.max_variants and reply not in variants:
+                variants.append(reply)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "keys": len(self._variants),
+                "variants": sum(len(v) for v in self._variants.values()),
+            }
@@ -0,0 +1,159 @@
+"""
+本地 SQLite 会话日志（WAL 模式）
+
+Every turn is appended as soon as it happens, together with a snapshot of
+the scalar session metrics, so a participant can resume after a reconnect
+or a server restart without re-running any LLM calls. Completed sessions
+keep their Sheets row until the writer confirms it, which lets a fresh
+process replay everything that never reached Sheets.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    subject_id  TEXT PRIMARY KEY,
+    mode        TEXT NOT NULL,
+    started_at  TEXT NOT NULL,
+    state_json  TEXT NOT NULL DEFAULT '{}',
+    completed   INTEGER NOT NULL DEFAULT 0,
+    synced      INTEGER NOT NULL DEFAULT 0,
+    row_json    TEXT,
+    updated_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    subject_id  TEXT NOT NULL,
+    seq         INTEGER NOT NULL,
+    role        TEXT NOT NULL,
+    content     TEXT NOT NULL,
+    display     TEXT,
+    created_at  REAL NOT NULL,
+    PRIMARY KEY (subject_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_pending ON sessions (completed, synced);
+"""
+
+
+class SessionJournal:
+    """
+    Thread-safe wrapper around one SQLite connection. The Sheets writer
+    thread calls ``mark_synced`` while script threads append turns.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def _transaction(self, statements):
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    cur.execute(sql, params)
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+
+    # --- Writes ---
+
+    def start_session(self, subject_id, mode, started_at, state=None):
+        self._transaction([(
+            "INSERT OR IGNORE INTO sessions (subject_id, mode, started_at, state_json, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (subject_id, mode, started_at, json.dumps(state or {}), time.time()),
+        )])
+
+    def record_turn(self, subject_id, role, content, display=None, state=None):
+        """
+        追加一轮对话，并在同一个事务里更新指标快照
+        """
+        now = time.time()
+        statements = [(
+            "INSERT INTO turns (subject_id, seq, role, content, display, created_at) "
+            "VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM turns WHERE subject_id = ?), ?, ?, ?, ?)",
+            (subject_id, subject_id, role, content, display, now),
+        )]
+        if state is not None:
+            statements.append((
+                "UPDATE sessions SET state_json = ?, updated_at = ? WHERE subject_id = ?",
+                (json.dumps(state), now, subject_id),
+            ))
+        self._transaction(statements)
+
+    def save_state(self, subject_id, state):
+        self._transaction([(
+            "UPDATE sessions SET state_json = ?, updated_at = ? WHERE subject_id = ?",
+            (json.dumps(state), time.time(), subject_id),
+        )])
+
+    def mark_completed(self, subject_id, row):
+        self._transaction([(
+            "UPDATE sessions SET completed = 1, row_json = ?, updated_at = ? WHERE subject_id = ?",
+            (json.dumps(row, ensure_ascii=False), time.time(), subject_id),
+        )])
+
+    def mark_synced(self, subject_id):
+        self._transaction([(
+            "UPDATE sessions SET synced = 1, updated_at = ? WHERE subject_id = ?",
+            (time.time(), subject_id),
+        )])
+
+    # --- Reads ---
+
+    def load_session(self, subject_id):
+        """
+        返回会话快照与全部对话轮次；不存在时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mode, started_at, state_json, completed, synced FROM sessions WHERE subject_id = ?",
+                (subject_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            turns = self._conn.execute(
+                "SELECT role, content, display, created_at FROM turns WHERE subject_id = ? ORDER BY seq",
+                (subject_id,),
+            ).fetchall()
+        mode, started_at, state_json, completed, synced = row
+        return {
+            "subject_id": subject_id,
+            "mode": mode,
+            "started_at": started_at,
+            "state": json.loads(state_json),
+            "completed": bool(completed),
+            "synced": bool(synced),
+            "turns": [
+                {"role": r, "content": c, "display": d, "created_at": t} for r, c, d, t in turns
+            ],
+        }
+
+    def session_ids(self, completed_only=False):
+        sql = "SELECT subject_id FROM sessions"
+        if completed_only:
+            sql += " WHERE completed = 1"
+        with self._lock:
+            return [sid for (sid,) in self._conn.execute(sql + " ORDER BY started_at").fetchall()]
+
+    def pending_rows(self):
+        """
+        已完成但尚未写入 Sheets 的会话 -> [(subject_id, row), ...]
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT subject_id, row_json FROM sessions "
+                "WHERE completed = 1 AND synced = 0 AND row_json IS NOT NULL ORDER BY updated_at"
+            ).fetchall()
+        return [(sid, json.loads(row_json)) for sid, row_json in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
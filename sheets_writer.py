@@ -0,0 +1,231 @@
+"""
+Google Sheets 后台批量写入器
+
+The worksheet is authorized once per process and session rows are appended
+from a single background thread with ``append_rows`` batching, so the
+end-of-session UI never waits on Google round trips.
+"""
+import logging
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+NON_RETRYABLE_ERRORS = ("SpreadsheetNotFound", "WorksheetNotFound")
+
+
+def open_worksheet(creds_dict, sheet_name):
+    """
+    授权并打开目标表格的第一个 worksheet（每个进程只调用一次）
+    """
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    credentials = Credentials.from_service_account_info(dict(creds_dict), scopes=SCOPES)
+    gc = gspread.authorize(credentials)
+    return gc.open(sheet_name).sheet1
+
+
+class FakeQuotaError(Exception):
+    """
+    模拟 Sheets 配额错误（HTTP 429）
+    """
+
+    class _Response:
+        status_code = 429
+
+    response = _Response()
+
+
+class FakeWorksheet:
+    """
+    本地 Sheets 替身：行保存在内存里，可模拟写入延迟和每分钟配额，
+    用于压测和本地调试（secrets 中 sheets_backend = "fake"）。
+    """
+
+    def __init__(self, latency=0.3, requests_per_minute=60):
+        self.latency = latency
+        self.requests_per_minute = requests_per_minute
+        self.rows = []
+        self.calls = 0
+        self._window = []
+        self._lock = threading.Lock()
+
+    def append_rows(self, rows, value_input_option="RAW"):
+        with self._lock:
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 60]
+            if self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+                raise FakeQuotaError("Quota exceeded for 'Write requests per minute'")
+            self._window.append(now)
+            self.calls += 1
+        time.sleep(self.latency)
+        with self._lock:
+            self.rows.extend(list(r) for r in rows)
+
+
+def is_retryable(exc):
+    if type(exc).__name__ in NON_RETRYABLE_ERRORS:
+        return False
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None:
+        # Network errors, timeouts, token refresh failures ...
+        return True
+    return status in RETRYABLE_STATUS
+
+
+class SheetsWriter:
+    """
+    Queue of pending rows flushed by a daemon thread.
+
+    ``worksheet_factory`` is called lazily (and again after a failed batch)
+    and must return an object with an ``append_rows(rows, value_input_option=...)``
+    method, so a local fake can stand in for gspread. ``on_flush(latency)``
+    is called once per written row with its enqueue-to-written seconds.
+    """
+
+    def __init__(self, worksheet_factory, batch_size=50, linger=0.5,
+                 max_retries=6, base_backoff=1.0, max_backoff=60.0, on_flush=None):
+        self._factory = worksheet_factory
+        self._on_flush = on_flush
+        self._worksheet = None
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._queue = queue.Queue()
+        self._closing = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            "rows_written": 0,
+            "rows_failed": 0,
+            "batches": 0,
+            "retries": 0,
+            "last_batch_size": 0,
+            "last_flush_latency": 0.0,
+            "max_flush_latency": 0.0,
+            "last_error": "",
+        }
+        self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+        self._thread.start()
+
+    # --- Public API ---
+
+    def enqueue(self, row, on_done=None):
+        """
+        Queue one row. ``on_done(success, message)`` is called from the
+        writer thread once the row is written or finally given up on.
+        """
+        self._queue.put((list(row), on_done, time.monotonic()))
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["queue_depth"] = self.queue_depth()
+        return snapshot
+
+    def flush(self, timeout=None):
+        """
+        Block until everything queued so far has been handled.
+        Returns False if ``timeout`` expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout=10.0):
+        """
+        进程退出前调用：不再等待凑批，尽快写完队列里的行
+        """
+        self._closing.set()
+        return self.flush(timeout)
+
+    # --- Worker ---
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            linger_until = time.monotonic() + self.linger
+            while len(batch) < self.batch_size and not self._closing.is_set():
+                remaining = linger_until - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    # 分段等待，关闭时可以立即停止凑批
+                    batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+                except queue.Empty:
+                    continue
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        rows = [row for row, _, _ in batch]
+        attempt = 0
+        while True:
+            try:
+                if self._worksheet is None:
+                    self._worksheet = self._factory()
+                self._worksheet.append_rows(rows, value_input_option="RAW")
+                break
+            except Exception as e:
+                # Re-authorize on the next attempt, the cached handle may be stale
+                self._worksheet = None
+                attempt += 1
+                with self._lock:
+                    self._stats["last_error"] = str(e)
+                if not is_retryable(e) or attempt > self.max_retries:
+                    logger.error("Sheets batch of %d rows failed: %s", len(rows), e)
+                    with self._lock:
+                        self._stats["rows_failed"] += len(rows)
+                    self._notify(batch, False, str(e))
+                    return
+                delay = min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1))
+                delay = random.uniform(delay / 2, delay)
+                with self._lock:
+                    self._stats["retries"] += 1
+                logger.warning("Sheets append failed (%s), retry %d in %.1fs", e, attempt, delay)
+                time.sleep(delay)
+
+        now = time.monotonic()
+        latencies = [now - enqueued for _, _, enqueued in batch]
+        latency = max(latencies)
+        if self._on_flush is not None:
+            for row_latency in latencies:
+                self._on_flush(row_latency)
+        with self._lock:
+            self._stats["rows_written"] += len(rows)
+            self._stats["batches"] += 1
+            self._stats["last_batch_size"] = len(rows)
+            self._stats["last_flush_latency"] = round(latency, 3)
+            self._stats["max_flush_latency"] = round(max(self._stats["max_flush_latency"], latency), 3)
+        logger.info(
+            "Flushed %d rows to Sheets (latency %.2fs, queue depth %d)",
+            len(rows), latency, self.queue_depth(),
+        )
+        self._notify(batch, True, "Success")
+
+    def _notify(self, batch, success, message):
+        for _, on_done, _ in batch:
+            if on_done is None:
+                continue
+            try:
+                on_done(success, message)
+            except Exception:
+                logger.exception("Sheets on_done callback failed")
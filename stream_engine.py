@@ -0,0 +1,340 @@
+"""
+共享事件循环上的异步流式引擎
+
+Every completion stream of the process runs as an asyncio task on one
+event loop in a single background thread, over one ``AsyncOpenAI`` client
+and httpx connection pool. ``stream`` returns a ``StreamHandle`` at once;
+all network I/O, retries and hedge races happen on the loop, and the
+Streamlit script thread of the session only waits (on a condition
+variable) for deltas that have already arrived. Streamlit still runs one
+script thread per rerunning session, but no extra thread is started per
+stream, hedge or speculative prefetch, and socket reads for all sessions
+share the one loop thread.
+
+Retries and deadlines follow ``llm_client.LLMClient.stream_chat``;
+hedging sends a duplicate request when the first token is later than a
+percentile of recent TTFTs and keeps whichever stream shows text first. A
+cancelled stream (participant gone, hedge loser, discarded speculation)
+is closed on the loop right away rather than at its next chunk. ``run``
+schedules any other coroutine, e.g. speech synthesis, on the same loop.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+from llm_client import ClientBase, DeadlineExceeded, is_retryable
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class StreamHandle:
+    """
+    Text of one stream, filled on the loop and read from a script thread.
+    ``deltas()`` replays what has arrived and then follows the stream;
+    leaving it early cancels the stream.
+    """
+
+    def __init__(self, on_done=None):
+        self.usage = None
+        self.error = None
+        # 哪一路先出文本："primary" / "hedge"；还没有文本时为 None
+        self.winner = None
+        self._parts = []
+        self._done = False
+        self._cancelled = False
+        self._cond = threading.Condition()
+        self._future = None
+        self._on_done = on_done
+
+    # --- Loop side ---
+
+    def _push(self, chunk):
+        with self._cond:
+            if chunk.usage is not None:
+                self.usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                self._parts.append(chunk.choices[0].delta.content)
+            self._cond.notify_all()
+
+    def _finished(self, future):
+        # 流结束或出错时在循环线程里调用；被 cancel() 取消时（包括任务还没开始）在调用 cancel 的线程里调用
+        with self._cond:
+            if not future.cancelled():
+                self.error = future.exception()
+            self._done = True
+            self._cond.notify_all()
+        if self._on_done is not None:
+            self._on_done()
+
+    # --- Script side ---
+
+    @property
+    def done(self):
+        return self._done
+
+    @property
+    def usable(self):
+        return self.error is None and not self._cancelled
+
+    @property
+    def text(self):
+        with self._cond:
+            return "".join(self._parts)
+
+    def cancel(self):
+        self._cancelled = True
+        if self._future is not None:
+            self._future.cancel()
+
+    def deltas(self):
+        i = 0
+        finished = False
+        try:
+            while True:
+                with self._cond:
+                    while i >= len(self._parts) and not self._done:
+                        self._cond.wait()
+                    parts = self._parts[i:]
+                    done = self._done
+                i += len(parts)
+                yield from parts
+                if done:
+                    finished = True
+                    if self.error is not None:
+                        raise self.error
+                    return
+        finally:
+            if not finished:
+                self.cancel()
+
+
+class StreamEngine(ClientBase):
+    """
+    Thread-safe; share one instance across all sessions of the process.
+    ``secondary_base_url`` / ``secondary_api_key`` give the endpoint used
+    for hedged duplicates (default: the primary one).
+    """
+
+    def __init__(self, api_key, base_url=None, secondary_base_url=None, secondary_api_key=None,
+                 max_connections=500, max_keepalive=100, keepalive_expiry=60.0,
+                 connect_timeout=5.0, read_timeout=30.0, deadline=120.0, max_attempts=3,
+                 base_backoff=0.5, max_backoff=8.0, on_connect=None, ttft_window=200):
+        super().__init__(deadline, max_attempts, base_backoff, max_backoff, on_connect, ttft_window)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._stats.update(active_streams=0, peak_active_streams=0)
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.openai = self._client(api_key, base_url)
+        self.secondary = (
+            self._client(secondary_api_key or api_key, secondary_base_url) if secondary_base_url else self.openai
+        )
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="stream-engine", daemon=True)
+        self._thread.start()
+
+    def _client(self, api_key, base_url):
+        http = httpx.AsyncClient(
+            limits=self._limits,
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            event_hooks={"request": [self._on_request]},
+        )
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http, max_retries=0)
+
+    async def _on_request(self, request):
+        on_event = self._connection_tracer(request)
+
+        async def trace(event_name, info):
+            on_event(event_name)
+
+        request.extensions["trace"] = trace
+
+    def _active(self, n):
+        with self._lock:
+            self._stats["active_streams"] += n
+            self._stats["peak_active_streams"] = max(
+                self._stats["peak_active_streams"], self._stats["active_streams"]
+            )
+
+    # --- Script-thread API ---
+
+    def run(self, coro):
+        """
+        在共享循环上运行协程，返回 ``concurrent.futures.Future``
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def stream(self, hedge_after=None, secondary_model=None, may_hedge=None, prompt_tokens=0,
+               deadline=None, on_done=None, on_usage=None, **kwargs):
+        """
+        开始一次流式调用，立即返回 ``StreamHandle``
+
+        ``hedge_after`` (seconds) enables hedging: if no text has arrived by
+        then and ``may_hedge()`` (run in a worker thread) agrees, the same
+        request goes to the secondary endpoint, with ``secondary_model`` if
+        given. The loser's cost is counted as ``prompt_tokens``.
+        ``on_usage(usage)`` also runs in a worker thread once the final
+        usage is known. ``on_done()`` runs once when the stream ends for
+        any reason: on the loop thread, or on the thread that called
+        ``cancel()`` if the stream was cancelled. It must be thread-safe
+        and must not block.
+        """
+        handle = StreamHandle(on_done)
+        handle._future = self.run(self._run(
+            handle, hedge_after, secondary_model, may_hedge, prompt_tokens, deadline, on_usage, kwargs
+        ))
+        handle._future.add_done_callback(handle._finished)
+        return handle
+
+    def close(self, timeout=5.0):
+        async def _close():
+            await self.openai.close()
+            if self.secondary is not self.openai:
+                await self.secondary.close()
+
+        self.run(_close()).result(timeout=timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # --- Loop side ---
+
+    async def _attempts(self, client, kwargs, deadline_at, started):
+        """
+        一路请求（含重试），逐个产出 chunk；规则同 ``LLMClient.stream_chat``
+        """
+        attempt = 0
+        self._count("streams")
+        while True:
+            attempt += 1
+            shown = False
+            try:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded("LLM request deadline exceeded")
+                stream = await client.chat.completions.create(
+                    stream=True,
+                    timeout=httpx.Timeout(min(remaining, self.read_timeout), connect=self.connect_timeout),
+                    **kwargs,
+                )
+                try:
+                    async for chunk in stream:
+                        if time.monotonic() > deadline_at:
+                            raise DeadlineExceeded("LLM request deadline exceeded")
+                        if not shown and chunk.choices and chunk.choices[0].delta.content:
+                            shown = True
+                            self._first_token(time.monotonic() - started)
+                        yield chunk
+                finally:
+                    await stream.close()
+                return
+            except Exception as e:
+                if shown or attempt >= self.max_attempts or not is_retryable(e):
+                    self._count("failures")
+                    raise
+                delay = self._backoff(attempt, e)
+                if time.monotonic() + delay >= deadline_at:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                logger.warning("LLM stream failed before first token (%s), retry %d in %.2fs", e, attempt, delay)
+                await asyncio.sleep(delay)
+
+    async def _run(self, handle, hedge_after, secondary_model, may_hedge, prompt_tokens, deadline,
+                   on_usage, kwargs):
+        started = time.monotonic()
+        deadline_at = started + (deadline or self.deadline)
+        out = asyncio.Queue()
+        legs = {}
+
+        async def pump(tag, client, call_kwargs):
+            try:
+                async for chunk in self._attempts(client, call_kwargs, deadline_at, started):
+                    out.put_nowait((tag, chunk))
+                out.put_nowait((tag, _DONE))
+            except Exception as e:
+                out.put_nowait((tag, e))
+
+        def launch(tag, client, call_kwargs):
+            legs[tag] = {"task": asyncio.ensure_future(pump(tag, client, call_kwargs)), "chunks": []}
+
+        async def start_hedge():
+            if may_hedge is not None and not await asyncio.to_thread(may_hedge):
+                return False
+            self._count("hedges")
+            launch("hedge", self.secondary, dict(kwargs, model=secondary_model) if secondary_model else kwargs)
+            return True
+
+        if hedge_after is not None:
+            self._count("hedged_streams")
+        self._active(1)
+        launch("primary", self.openai, kwargs)
+        hedge_decided = hedge_after is None
+        hedge_at = started + (hedge_after or 0.0)
+        winner = None
+        failed = set()
+        try:
+            while True:
+                wait = (deadline_at if hedge_decided else hedge_at) - time.monotonic()
+                try:
+                    tag, item = await asyncio.wait_for(out.get(), max(0.0, wait))
+                except asyncio.TimeoutError:
+                    if hedge_decided:
+                        raise DeadlineExceeded("LLM request deadline exceeded")
+                    hedge_decided = True
+                    await start_hedge()
+                    continue
+                if winner is not None and tag != winner:
+                    continue
+                if isinstance(item, Exception):
+                    if winner is not None:
+                        raise item
+                    failed.add(tag)
+                    if len(failed) < len(legs):
+                        continue
+                    # 主请求（含重试）失败且还没对冲：立刻发出对冲请求
+                    if not hedge_decided:
+                        hedge_decided = True
+                        if await start_hedge():
+                            continue
+                    raise item
+                if winner is None:
+                    if item is not _DONE:
+                        legs[tag]["chunks"].append(item)
+                        if not (item.choices and item.choices[0].delta.content):
+                            continue
+                    winner = handle.winner = tag
+                    # 胜负已分：之后只等截止时间，不再对冲
+                    hedge_decided = True
+                    self._settle_race(legs, winner, prompt_tokens, started)
+                    for chunk in legs[winner]["chunks"]:
+                        handle._push(chunk)
+                elif item is not _DONE:
+                    handle._push(item)
+                if item is _DONE:
+                    break
+        finally:
+            for leg in legs.values():
+                leg["task"].cancel()
+            self._active(-1)
+        if on_usage is not None and handle.usage is not None:
+            await asyncio.to_thread(on_usage, handle.usage)
+
+    def _settle_race(self, legs, winner, prompt_tokens, started):
+        for tag, leg in legs.items():
+            if tag != winner:
+                leg["task"].cancel()
+                # 输家还没有文本（否则它就是赢家），浪费的是提示词
+                self._count("hedge_wasted_tokens", prompt_tokens)
+        if winner == "hedge":
+            self._count("hedge_wins")
+            # 被取消的主请求没有首 token 时间，记一个下界，避免分位数越算越低
+            self._first_token(time.monotonic() - started)
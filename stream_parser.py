@@ -0,0 +1,128 @@
+"""
+流式回复解析器（状态机）
+
+Sits between the OpenAI chunk iterator and the renderer. Scoring tags are
+consumed as soon as they are complete, so ``[CORRECT]`` never reaches the
+screen, and phrases such as "The session is complete." are recognised the
+moment they arrive. Only a short tail that could still be the start of a
+marker is held back; nothing ever rescans the full reply.
+"""
+
+CORRECT = "correct"
+INCORRECT = "incorrect"
+EXAM_START = "exam_start"
+SESSION_COMPLETE = "session_complete"
+# 模型请求由应用出一道小测验题（见 quiz_engine）
+QUIZ_DUE = "quiz_due"
+
+# (marker, event, hidden, case_sensitive)
+MARKERS = (
+    ("[CORRECT]", CORRECT, True, True),
+    ("[INCORRECT]", INCORRECT, True, True),
+    ("[QUIZ]", QUIZ_DUE, True, True),
+    ("begin the final exam", EXAM_START, False, False),
+    ("the session is complete", SESSION_COMPLETE, False, False),
+)
+
+
+class ReplyParser:
+    """
+    ``feed(delta)`` returns ``(display_delta, events)``; ``finish()`` flushes
+    whatever is still held back. ``raw`` and ``display`` give the full raw
+    reply (tags included, as stored in ``messages``) and the visible text.
+    """
+
+    def __init__(self, markers=MARKERS):
+        self.markers = markers
+        self._max_len = max(len(m[0]) for m in markers)
+        self._hold = ""
+        self._raw = []
+        self._display = []
+        self._at_start = True
+        self.events = []
+
+    @property
+    def raw(self):
+        return "".join(self._raw)
+
+    @property
+    def display(self):
+        return "".join(self._display).strip()
+
+    def has(self, event):
+        return event in self.events
+
+    def feed(self, delta):
+        if not delta:
+            return "", []
+        self._raw.append(delta)
+        buf = self._hold + delta
+        out = []
+        events = []
+
+        while True:
+            hit = self._find_marker(buf)
+            if hit is None:
+                break
+            pos, marker, event, hidden = hit
+            out.append(buf[:pos])
+            if not hidden:
+                out.append(buf[pos:pos + len(marker)])
+            events.append(event)
+            buf = buf[pos + len(marker):]
+
+        keep = self._partial_suffix(buf)
+        out.append(buf[:len(buf) - keep])
+        self._hold = buf[len(buf) - keep:]
+
+        self.events.extend(events)
+        return self._emit("".join(out)), events
+
+    def finish(self):
+        tail, self._hold = self._hold, ""
+        return self._emit(tail)
+
+    # --- internals ---
+
+    def _emit(self, text):
+        if self._at_start:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._at_start = False
+        self._display.append(text)
+        return text
+
+    def _find_marker(self, buf):
+        lower = None
+        best = None
+        for marker, event, hidden, case_sensitive in self.markers:
+            if case_sensitive:
+                pos = buf.find(marker)
+            else:
+                if lower is None:
+                    lower = buf.lower()
+                pos = lower.find(marker)
+            if pos != -1 and (best is None or pos < best[0]):
+                best = (pos, marker, event, hidden)
+        return best
+
+    def _partial_suffix(self, buf):
+        """
+        buf 末尾可能是某个标记开头的最长长度
+        """
+        lower = None
+        for size in range(min(len(buf), self._max_len - 1), 0, -1):
+            tail = buf[-size:]
+            for marker, _, _, case_sensitive in self.markers:
+                if size >= len(marker):
+                    continue
+                if case_sensitive:
+                    if marker.startswith(tail):
+                        return size
+                else:
+                    if lower is None:
+                        lower = buf[-(self._max_len - 1):].lower()
+                    if marker.startswith(lower[-size:]):
+                        return size
+        return 0
@@ -0,0 +1,246 @@
+"""
+延迟与吞吐量指标
+
+Process-wide histograms (Prometheus text format, served from a small
+background HTTP server and shown in the admin view) plus a per-session
+summary that is saved with the session data. Observing a value is a
+bisect and a lock, cheap enough for the streaming loop.
+
+Cold-start phases (imports, first paint of the landing page, lazily
+loaded subsystems) are kept once per process for the startup report.
+"""
+import bisect
+import contextlib
+import json
+import statistics
+import sys
+import threading
+import time
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 20, 30, 60)
+RATE_BUCKETS = (5, 10, 20, 30, 40, 60, 80, 100, 150, 200)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 16000)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def render(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total:.6f}")
+        lines.append(f"{self.name}_count {count}")
+        return "\n".join(lines)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} counter\n{self.name} {self.value}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, buckets)
+            return self._metrics[name]
+
+    def counter(self, name, help_text):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help_text)
+            return self._metrics[name]
+
+    def gauge(self, name, help_text, fn):
+        """
+        注册一个在导出时才求值的 gauge（例如队列深度）
+        """
+        with self._lock:
+            self._gauges[name] = (help_text, fn)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            gauges = list(self._gauges.items())
+        parts = [m.render() for m in metrics]
+        for name, (help_text, fn) in gauges:
+            try:
+                value = float(fn())
+            except Exception:
+                continue
+            parts.append(f"# HELP {name} {help_text}\n# TYPE {name} gauge\n{name} {value}")
+        return "\n".join(parts) + "\n"
+
+
+REGISTRY = Registry()
+
+TTFT = REGISTRY.histogram("tutor_llm_ttft_seconds", "Time from request to first visible token")
+TURN = REGISTRY.histogram("tutor_llm_turn_seconds", "Time from request to last token")
+TPS = REGISTRY.histogram("tutor_llm_tokens_per_second", "Completion tokens per second after the first token", RATE_BUCKETS)
+RENDER = REGISTRY.histogram("tutor_render_seconds", "Time spent in markdown renders per reply")
+PROMPT_TOKENS = REGISTRY.histogram("tutor_prompt_tokens", "Prompt tokens per call", TOKEN_BUCKETS)
+COMPLETION_TOKENS = REGISTRY.histogram("tutor_completion_tokens", "Completion tokens per call", TOKEN_BUCKETS)
+CONNECT = REGISTRY.histogram("tutor_llm_connect_seconds", "TCP/TLS connection setup to the LLM API")
+SHEETS_FLUSH = REGISTRY.histogram("tutor_sheets_flush_seconds", "Time from enqueue to rows written in Sheets")
+QUEUE_WAIT = REGISTRY.histogram("tutor_llm_queue_wait_seconds", "Time an LLM call waited for rate-limit admission")
+LANDING_RENDER = REGISTRY.histogram("tutor_landing_render_seconds", "Script start to the landing page fully drawn")
+
+
+# --- Startup profile ---
+
+# 启动报告里列出是否已加载的重量级依赖
+HEAVY_MODULES = ("openai", "httpx", "gspread", "google.oauth2", "pandas", "pyarrow", "edge_tts", "mutagen")
+
+_startup = {}
+_startup_lock = threading.Lock()
+
+
+def startup_phase(name, seconds):
+    """
+    记录一个启动阶段的耗时；每个进程只保留第一次（冷启动）的值，同时导出为 gauge
+    """
+    with _startup_lock:
+        if name in _startup:
+            return
+        _startup[name] = round(seconds, 4)
+    REGISTRY.gauge(f"tutor_startup_{name}_seconds", f"Cold-start time of {name}", lambda: _startup[name])
+
+
+@contextlib.contextmanager
+def startup_timer(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_phase(name, time.perf_counter() - started)
+
+
+def startup_report():
+    with _startup_lock:
+        report = dict(_startup)
+    report["heavy_modules_loaded"] = [m for m in HEAVY_MODULES if m in sys.modules]
+    return report
+
+
+class TurnTimer:
+    """
+    Timing of one assistant reply. Call ``first_token()`` when the first
+    visible text arrives and ``finish(...)`` at the end of the stream.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self.started = clock()
+        self.ttft = None
+
+    def first_token(self):
+        if self.ttft is None:
+            self.ttft = self._clock() - self.started
+
+    def finish(self, render_seconds=0.0, prompt_tokens=None, completion_tokens=None):
+        total = self._clock() - self.started
+        ttft = self.ttft if self.ttft is not None else total
+        generation = total - ttft
+        tps = completion_tokens / generation if completion_tokens and generation > 0 else None
+
+        TTFT.observe(ttft)
+        TURN.observe(total)
+        RENDER.observe(render_seconds)
+        if tps is not None:
+            TPS.observe(tps)
+        if prompt_tokens:
+            PROMPT_TOKENS.observe(prompt_tokens)
+        if completion_tokens:
+            COMPLETION_TOKENS.observe(completion_tokens)
+        return {
+            "ttft": round(ttft, 3),
+            "turn": round(total, 3),
+            "tps": round(tps, 1) if tps is not None else None,
+            "render": round(render_seconds, 4),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        }
+
+
+def summarize_turns(turns):
+    """
+    会话级延迟汇总（写入 data_payload）
+    """
+    summary = {"turns": len(turns)}
+    for key in ("ttft", "turn", "tps", "render"):
+        values = sorted(t[key] for t in turns if t.get(key) is not None)
+        if not values:
+            continue
+        summary[key] = {
+            "p50": round(statistics.median(values), 3),
+            "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+            "max": round(values[-1], 3),
+        }
+    return summary
+
+
+def summary_json(turns):
+    return json.dumps(summarize_turns(turns), separators=(",", ":"))
+
+
+def start_metrics_server(port, registry=REGISTRY, host="0.0.0.0"):
+    """
+    后台线程提供 GET /metrics（Prometheus 文本格式）
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
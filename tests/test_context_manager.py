@@ -0,0 +1,93 @@
+from context_manager import ContextManager, message_tokens
+
+SYSTEM = {"role": "system", "content": "You are a psychology teacher."}
+
+
+def exchange(i):
+    return [
+        {"role": "user", "content": f"yes, ready {i}"},
+        {"role": "assistant", "content": f"Segment {i} explains one idea in a few sentences. " * 4 + "Ready?"},
+    ]
+
+
+def history_tokens(messages):
+    return sum(message_tokens(m) for m in messages[1:])
+
+
+def test_sync_counts_only_new_messages():
+    context = ContextManager()
+    messages = [SYSTEM] + exchange(0)
+    context.sync(messages)
+    assert context.history_tokens == history_tokens(messages)
+    messages += exchange(1)
+    context.sync(messages)
+    context.sync(messages)                          # 重复 sync 不重复计数
+    assert context.history_tokens == history_tokens(messages)
+    assert context.build(messages) == messages
+
+
+def test_fold_starts_over_budget_and_goes_down_to_low_water():
+    per_exchange = history_tokens([SYSTEM] + exchange(0))
+    context = ContextManager(history_budget=per_exchange * 6, min_recent=2)
+    messages = [SYSTEM]
+    for i in range(6):
+        messages += exchange(i)
+        context.sync(messages)
+    assert context.folded_count == 0                # 还没超过预算
+    messages += exchange(6)
+    context.sync(messages)
+    assert context.folded_count > 0
+    assert context.history_tokens <= context.low_water
+    assert context.summary_lines[0].startswith("- Covered: Segment 0")
+
+
+def test_summary_prefix_stays_stable_between_folds():
+    per_exchange = history_tokens([SYSTEM] + exchange(0))
+    context = ContextManager(history_budget=per_exchange * 6, min_recent=2)
+    messages = [SYSTEM]
+    prefixes = []
+    for i in range(20):
+        messages += exchange(i)
+        built = context.build(messages)
+        prefixes.append(built[1]["content"] if context.summary_lines else None)
+    changes = sum(1 for a, b in zip(prefixes, prefixes[1:]) if a != b)
+    # 每次折叠到 60%：20 轮里摘要只变化几次，而不是每轮都变
+    assert 1 <= changes <= 6
+
+
+def test_build_order_is_stable_to_volatile():
+    per_exchange = history_tokens([SYSTEM] + exchange(0))
+    context = ContextManager(history_budget=per_exchange * 3, min_recent=2)
+    messages = [SYSTEM]
+    for i in range(4):
+        messages += exchange(i)
+    messages.append({"role": "assistant", "content": "Now we will begin the final exam."})
+    tail = [{"role": "system", "content": "turn instruction"}]
+    built = context.build(messages, tail)
+    assert built[0] is SYSTEM
+    assert built[1]["content"].startswith("Summary of the earlier part")
+    assert built[2:-2] == messages[context._start:]
+    assert built[-2]["content"].startswith("Exam state:")
+    assert built[-1] is tail[0]
+
+
+def test_exam_message_tracks_graded_answers():
+    context = ContextManager(exam_questions=10)
+    messages = [SYSTEM, {"role": "assistant", "content": "[CORRECT] Before the exam."}]
+    context.sync(messages)
+    assert context.exam_message() is None
+    messages += [
+        {"role": "assistant", "content": "Now we will begin the final exam."},
+        {"role": "user", "content": "B"},
+        {"role": "assistant", "content": "[CORRECT] Yes."},
+        {"role": "user", "content": "A"},
+        {"role": "assistant", "content": "[INCORRECT] No."},
+    ]
+    context.sync(messages)
+    text = context.exam_message()["content"]
+    assert "2 of 10 questions have been answered" in text
+    assert text.endswith("Continue with Question 3.")
+
+    local = ContextManager(exam_questions=10, local_questions=True)
+    local.sync(messages)
+    assert "Continue with Question" not in local.exam_message()["content"]
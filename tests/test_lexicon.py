@@ -0,0 +1,62 @@
+import sys
+
+import pytest
+
+from lexicon import Lexicon, default_lexicon
+
+
+@pytest.fixture
+def lexicon():
+    return default_lexicon()
+
+
+@pytest.mark.parametrize("text", [
+    "I know this one",
+    "my eyes are tired",
+    "nothing to add",
+    "goodness, okay",
+])
+def test_terms_only_match_whole_words(lexicon, text):
+    assert lexicon.score(text) == (0, 0)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("no", (0, 1)),
+    ("Yes!", (1, 0)),
+    ("YES, good.", (2, 0)),
+    ("this is hard? no", (0, 2)),
+])
+def test_terms_match_next_to_punctuation_and_any_case(lexicon, text, expected):
+    assert lexicon.score(text) == expected
+
+
+def test_dont_understand_is_negative_only(lexicon):
+    # 最长词条优先："don't understand" 不再同时算一次 "understand"
+    assert lexicon.score("I don't understand") == (0, 1)
+    assert lexicon.score("I don’t  understand") == (0, 1)
+    assert lexicon.score("I understand now") == (1, 0)
+
+
+def test_longest_phrase_wins_over_its_words():
+    lexicon = Lexicon(positive=["makes sense"], negative=["sense", "not sure"])
+    assert lexicon.matches("that makes sense") == {"makes sense"}
+    assert lexicon.matches("not sure about the sense of it") == {"not sure", "sense"}
+    assert lexicon.score("that makes   sense, not sure") == (1, 1)
+
+
+def test_repeated_terms_count_once(lexicon):
+    assert lexicon.score("good good good") == (1, 0)
+
+
+def test_score_batch_matches_score(lexicon):
+    pd = pytest.importorskip("pandas")
+    texts = ["I don't understand", "yes, great", None, "I know"]
+    frame = lexicon.score_batch(texts)
+    assert isinstance(frame, pd.DataFrame)
+    assert frame[["positive", "negative"]].values.tolist() == [[0, 1], [2, 0], [0, 0], [0, 0]]
+    assert frame["confused"].tolist() == [True, False, False, False]
+
+
+def test_score_batch_without_pandas(lexicon, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pandas", None)
+    assert lexicon.score_batch(["no", "yes"]) == [(0, 1), (1, 0)]
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+from prefetch import Prefetcher, is_affirmative, is_check_in, new_session_stats
+
+
+class StubHandle:
+    """Finished or cancelled stream as seen by a Speculation."""
+
+    def __init__(self, text="", usage=None, error=None):
+        self.text = text
+        self.usage = usage
+        self.error = error
+        self.usable = error is None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def usage(prompt, completion, cached):
+    return SimpleNamespace(
+        prompt_tokens=prompt,
+        completion_tokens=completion,
+        total_tokens=prompt + completion,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+    )
+
+
+def speculate(prefetcher, stats, handle, prompt_estimate=3000, uncached_estimate=400):
+    return prefetcher.start(stats, None, prompt_estimate, lambda on_done: handle,
+                            uncached_estimate=uncached_estimate)
+
+
+def test_affirmative_and_check_in():
+    assert is_affirmative("yes")
+    assert is_affirmative("Makes sense, let's continue")
+    assert not is_affirmative("why is the bell a conditioned stimulus?")
+    assert is_check_in("The bell becomes a signal for food.\n\nReady to move on?")
+    assert not is_check_in("The bell becomes a signal for food.")
+
+
+def test_miss_counts_completion_and_uncached_prompt_only():
+    prefetcher = Prefetcher()
+    stats = new_session_stats()
+    handle = StubHandle("next segment", usage(prompt=3000, completion=600, cached=2560))
+    prefetcher.discard(speculate(prefetcher, stats, handle), stats)
+    assert handle.cancelled
+    assert stats["misses"] == 1
+    assert stats["wasted_tokens"] == 600 + 440
+
+
+def test_cancelled_miss_without_usage_uses_the_uncached_estimate():
+    prefetcher = Prefetcher()
+    stats = new_session_stats()
+    handle = StubHandle("x" * 400)
+    prefetcher.discard(speculate(prefetcher, stats, handle, uncached_estimate=300), stats)
+    assert 300 < stats["wasted_tokens"] < 3000
+
+
+def test_one_full_miss_does_not_turn_prefetch_off():
+    prefetcher = Prefetcher()
+    stats = new_session_stats()
+    full_miss = StubHandle("x" * 3200, usage(prompt=3500, completion=800, cached=3072))
+    prefetcher.discard(speculate(prefetcher, stats, full_miss), stats)
+    assert prefetcher.allows(stats)
+    assert speculate(prefetcher, stats, StubHandle()) is not None
+
+
+def test_failed_speculation_is_not_a_miss():
+    prefetcher = Prefetcher()
+    stats = new_session_stats()
+    prefetcher.discard(speculate(prefetcher, stats, StubHandle(error=TimeoutError())), stats)
+    assert stats["misses"] == 0
+    assert stats["errors"] == 1
+    assert stats["wasted_tokens"] == 0
+
+
+def test_failed_speculation_still_counts_the_text_it_produced():
+    prefetcher = Prefetcher()
+    stats = new_session_stats()
+    handle = StubHandle("x" * 400, error=ConnectionError("reset"))
+    prefetcher.discard(speculate(prefetcher, stats, handle, uncached_estimate=300), stats)
+    assert stats["errors"] == 1 and stats["misses"] == 0
+    assert stats["wasted_tokens"] > 300
+    assert prefetcher.allows(stats)
+
+
+def test_discard_runs_the_callback_once_accounted():
+    prefetcher = Prefetcher()
+    stats = new_session_stats()
+    spec = speculate(prefetcher, stats, StubHandle("x" * 40))
+    seen = []
+    spec.on_discard = lambda: seen.append(stats["wasted_tokens"])
+    prefetcher.discard(spec, stats)
+    assert seen == [stats["wasted_tokens"]] and seen[0] > 0
+
+
+def test_hit_rate_cap_after_warmup():
+    prefetcher = Prefetcher(max_inflight=10, warmup=4, min_hit_rate=0.3)
+    stats = new_session_stats()
+    for _ in range(4):
+        prefetcher.discard(speculate(prefetcher, stats, StubHandle("x" * 40)), stats)
+    assert not prefetcher.allows(stats)
+    assert speculate(prefetcher, stats, StubHandle()) is None
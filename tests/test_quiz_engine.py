@@ -0,0 +1,105 @@
+import pytest
+
+from quiz_engine import QuizEngine, default_bank, parse_choice
+from stream_parser import EXAM_START, QUIZ_DUE
+
+
+@pytest.fixture
+def cc1():
+    # 选项：A) An unconditioned stimulus  B) A neutral stimulus  C) A conditioned response  D) An unconditioned response
+    return default_bank().by_id["cc1"]
+
+
+@pytest.mark.parametrize("text, letter", [
+    ("B", "B"),
+    ("b", "B"),
+    ("c)", "C"),
+    ("(d)", "D"),
+    ("A.", "A"),
+    ("A: the bell", "A"),
+    ("answer: d", "D"),
+    ("I'd pick b", "B"),
+    ("I think it's C because of the pairing", "C"),
+    ("I think A", "A"),
+])
+def test_parse_choice_letters(cc1, text, letter):
+    assert parse_choice(text, cc1) == letter
+
+
+@pytest.mark.parametrize("text, letter", [
+    ("A neutral stimulus", "B"),
+    ("A conditioned response", "C"),
+    ("an unconditioned response", "D"),
+    ("I'd say it was a neutral stimulus", "B"),
+    ("neutral stimulus", "B"),
+])
+def test_parse_choice_option_text_beats_a_leading_article(cc1, text, letter):
+    assert parse_choice(text, cc1) == letter
+
+
+@pytest.mark.parametrize("text", [
+    "Is it B or C?",
+    "either A) or D)",
+    "a neutral stimulus or a conditioned response",
+    "I'm not sure",
+    "A bell is a bell",
+])
+def test_parse_choice_ambiguous_or_missing(cc1, text):
+    assert parse_choice(text, cc1) is None
+
+
+def test_every_option_text_parses_to_its_own_letter():
+    bank = default_bank()
+    for question in bank.by_id.values():
+        for letter, option in zip("ABCD", question.options):
+            assert parse_choice(option, question) == letter, (question.id, option)
+
+
+def test_quiz_flow_grades_locally_and_asks_from_the_bank():
+    quiz = QuizEngine(default_bank(), "P1")
+    assert quiz.grade("B") is None                      # 没有待答的题目
+    shown = quiz.after_reply(None, [QUIZ_DUE])
+    assert shown.startswith("**Mini-Quiz (")
+    assert quiz.active == ("quiz", 0)
+
+    unclear = quiz.grade("hmm, not sure")
+    assert unclear.correct is None and unclear.tag == ""
+    assert quiz.active == ("quiz", 0)                   # 题目仍然开放
+    assert quiz.after_reply(unclear, []) is None
+
+    question = quiz.quiz_questions[0]
+    grade = quiz.grade(question.option_text(question.answer))
+    assert grade.correct and grade.tag == "[CORRECT] "
+    assert quiz.active is None and quiz.quizzes_done == 1
+    assert quiz.after_reply(grade, []) is None          # 小测之后回到教学
+
+
+def test_exam_flow_runs_to_completion_and_round_trips_state():
+    quiz = QuizEngine(default_bank(), "P2")
+    quiz.quizzes_done = len(quiz.quiz_questions)
+    # 开考之后模型再输出 [QUIZ] 也不会出小测题
+    first = quiz.after_reply(None, [EXAM_START])
+    assert first.startswith("**Question 1 of 10:**")
+    assert quiz.after_reply(None, [QUIZ_DUE]) is None
+
+    wrong = 0
+    for n in range(1, 11):
+        restored = QuizEngine.from_state(default_bank(), "P2", quiz.state())
+        assert restored.state() == quiz.state()
+        question = quiz.exam_questions[n - 1]
+        choice = "A" if question.answer != "A" else "B"
+        grade = quiz.grade(choice)
+        assert grade.kind == "exam" and grade.number == n and grade.correct is False
+        wrong += 1
+        followup = quiz.after_reply(grade, [])
+        if n < 10:
+            assert followup.startswith(f"**Question {n + 1} of 10:**")
+    assert followup == "The session is complete."
+    assert quiz.finished and wrong == 10
+
+
+def test_same_seed_draws_the_same_questions():
+    a = QuizEngine(default_bank(), "P3")
+    b = QuizEngine(default_bank(), "P3")
+    assert [q.id for q in a.exam_questions] == [q.id for q in b.exam_questions]
+    assert len({q.id for q in a.quiz_questions + a.exam_questions}) == 13
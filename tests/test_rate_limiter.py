@@ -0,0 +1,113 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import QueueTimeout, RateLimiter
+
+
+class FakeClock:
+    """time.time / time.sleep for the limiter: sleeping advances the clock."""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", fake)
+    return fake
+
+
+def make_limiter(tmp_path, rpm=60, tpm=6000):
+    return RateLimiter(str(tmp_path / "limits.db"), rpm, tpm, poll_interval=0.25)
+
+
+def levels(limiter):
+    return limiter._run(lambda cur, now: limiter._levels(cur, now))
+
+
+def test_tokens_bucket_drains_and_refills(tmp_path, clock):
+    limiter = make_limiter(tmp_path, rpm=60, tpm=6000)
+    limiter.acquire("s1", 3000)
+    limiter.acquire("s2", 3000)
+    requests, tokens = levels(limiter)
+    assert (requests, tokens) == (58, 0)
+    with pytest.raises(QueueTimeout):
+        limiter.acquire("s3", 1000, timeout=0)
+    clock.sleep(10)                                 # 10 s = 1/6 of the window
+    assert levels(limiter) == pytest.approx((60, 1000))
+    limiter.acquire("s3", 1000, timeout=0)
+
+
+def test_requests_bucket_limits_calls(tmp_path, clock):
+    limiter = make_limiter(tmp_path, rpm=2, tpm=100000)
+    limiter.acquire("s1", 10)
+    limiter.acquire("s1", 10)
+    with pytest.raises(QueueTimeout):
+        limiter.acquire("s1", 10, timeout=0)
+    started = clock.now
+    positions = []
+    limiter.acquire("s1", 10, timeout=60, on_wait=positions.append)
+    # 每分钟 2 次：30 秒补回一次
+    assert 29 <= clock.now - started <= 31
+    assert positions == [1]
+
+
+def test_queue_timeout_removes_the_waiter(tmp_path, clock):
+    limiter = make_limiter(tmp_path, rpm=1, tpm=100000)
+    limiter.acquire("s1", 10)
+    with pytest.raises(QueueTimeout):
+        limiter.acquire("s2", 10, timeout=5)
+    assert limiter.stats()["waiting"] == 0
+
+
+def test_least_served_session_is_admitted_first(tmp_path, clock):
+    limiter = make_limiter(tmp_path, rpm=3, tpm=100000)
+    for _ in range(3):
+        limiter.acquire("busy", 10)
+
+    def enqueue(session_id):
+        return limiter._run(lambda cur, now: cur.execute(
+            "INSERT INTO waiters (session_id, enqueued_at, heartbeat) VALUES (?, ?, ?)",
+            (session_id, now, now),
+        ).lastrowid)
+
+    def try_admit(ticket):
+        return limiter._run(lambda cur, now: limiter._try_admit(cur, now, ticket, 10, True))
+
+    busy, fresh = enqueue("busy"), enqueue("fresh")
+    assert try_admit(busy)[:2] == (False, 2)        # 先到，但最近一分钟已被放行 3 次
+    assert try_admit(fresh)[:2] == (False, 1)
+    admitted = []
+    # 两个等待者都按轮询发心跳；每 20 秒补回一次请求
+    while len(admitted) < 2:
+        clock.sleep(5)
+        for name, ticket in (("busy", busy), ("fresh", fresh)):
+            if name not in admitted and try_admit(ticket)[0]:
+                admitted.append(name)
+    assert admitted == ["fresh", "busy"]
+
+
+def test_settle_refunds_unused_tokens_once(tmp_path, clock):
+    limiter = make_limiter(tmp_path, rpm=60, tpm=6000)
+    admission = limiter.acquire("s1", 5000)
+    assert levels(limiter)[1] == 1000
+    limiter.settle(admission, 1200)
+    assert levels(limiter)[1] == 4800
+    limiter.settle(admission, 1200)                 # 重复结算不再改变桶
+    assert levels(limiter)[1] == 4800
+    overrun = limiter.acquire("s1", 1000)
+    limiter.settle(overrun, 2000)                   # 超出预估：多扣
+    assert levels(limiter)[1] == 2800
+
+
+def test_estimate_above_the_minute_limit_is_capped(tmp_path, clock):
+    limiter = make_limiter(tmp_path, rpm=60, tpm=6000)
+    admission = limiter.acquire("s1", 50000, timeout=0)
+    assert admission.tokens == 6000
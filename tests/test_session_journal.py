@@ -0,0 +1,67 @@
+import pytest
+
+from session_journal import SessionJournal
+from turn_log import TurnLog
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = SessionJournal(str(tmp_path / "journal.db"))
+    yield journal
+    journal.close()
+
+
+def test_resume_restores_turns_and_latest_state(tmp_path, journal):
+    journal.start_session("P1", "Empathy Mode", "2026-01-01T10:00:00", {"correct_count": 0})
+    journal.record_turn("P1", "system", "prompt")
+    journal.record_turn("P1", "assistant", "Welcome! Ready?", "Welcome! Ready?", state={"correct_count": 0})
+    journal.record_turn("P1", "user", "B", "B")
+    journal.record_turn("P1", "assistant", "[CORRECT] Yes.", "Yes.", state={"correct_count": 1})
+    # 同一会话再次 start（页面刷新）不会覆盖已有快照
+    journal.start_session("P1", "Neutral Mode", "2026-01-01T11:00:00")
+
+    # 新进程（新连接）也能读到
+    reopened = SessionJournal(str(tmp_path / "journal.db"))
+    saved = reopened.load_session("P1")
+    reopened.close()
+    assert saved["mode"] == "Empathy Mode"
+    assert saved["state"] == {"correct_count": 1}
+    assert not saved["completed"] and not saved["synced"]
+    assert [(t["role"], t["display"]) for t in saved["turns"]] == [
+        ("system", None), ("assistant", "Welcome! Ready?"), ("user", "B"), ("assistant", "Yes."),
+    ]
+    log = TurnLog.from_journal(saved["turns"])
+    assert log.shown_count == 3
+    assert list(log.display_history())[-1] == ("assistant", "Yes.")
+    assert journal.load_session("missing") is None
+
+
+def test_turn_sequence_is_per_session(journal):
+    for sid in ("P1", "P2"):
+        journal.start_session(sid, "Neutral Mode", "2026-01-01T10:00:00")
+    journal.record_turn("P1", "user", "a")
+    journal.record_turn("P2", "user", "b")
+    journal.record_turn("P1", "user", "c")
+    assert [t["content"] for t in journal.load_session("P1")["turns"]] == ["a", "c"]
+    assert [t["content"] for t in journal.load_session("P2")["turns"]] == ["b"]
+
+
+def test_completed_rows_replay_until_synced(journal):
+    for sid, started in (("P1", "2026-01-01T10:00:00"), ("P2", "2026-01-01T10:05:00"), ("P3", "2026-01-01T10:10:00")):
+        journal.start_session(sid, "Neutral Mode", started)
+    journal.mark_completed("P1", ["P1", "Neutral Mode", 7])
+    journal.mark_completed("P2", ["P2", "Neutral Mode", 9])
+    assert journal.session_ids(completed_only=True) == ["P1", "P2"]
+    assert journal.session_ids() == ["P1", "P2", "P3"]
+    assert sorted(journal.pending_rows()) == [("P1", ["P1", "Neutral Mode", 7]), ("P2", ["P2", "Neutral Mode", 9])]
+
+    journal.mark_synced("P1")
+    assert journal.pending_rows() == [("P2", ["P2", "Neutral Mode", 9])]
+    saved = journal.load_session("P1")
+    assert saved["completed"] and saved["synced"]
+
+
+def test_save_state_overwrites_the_snapshot(journal):
+    journal.start_session("P1", "Neutral Mode", "2026-01-01T10:00:00", {"session_completed": False})
+    journal.save_state("P1", {"session_completed": True})
+    assert journal.load_session("P1")["state"] == {"session_completed": True}
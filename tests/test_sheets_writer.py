@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+from sheets_writer import FakeQuotaError, FakeWorksheet, SheetsWriter
+
+
+class FlakyWorksheet(FakeWorksheet):
+    """Raises ``error`` on the first ``failures`` appends, then behaves like the fake."""
+
+    def __init__(self, failures, error=None):
+        super().__init__(latency=0.0, requests_per_minute=0)
+        self.failures = failures
+        self.error = error or FakeQuotaError("Quota exceeded for 'Write requests per minute'")
+
+    def append_rows(self, rows, value_input_option="RAW"):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        super().append_rows(rows, value_input_option)
+
+
+class SpreadsheetNotFound(Exception):
+    pass
+
+
+def make_writer(sheet, **kwargs):
+    kwargs.setdefault("linger", 0.2)
+    kwargs.setdefault("base_backoff", 0.01)
+    factory_calls = []
+
+    def factory():
+        factory_calls.append(1)
+        return sheet
+
+    return SheetsWriter(factory, **kwargs), factory_calls
+
+
+def test_rows_enqueued_together_are_written_in_one_batch():
+    sheet = FakeWorksheet(latency=0.0)
+    writer, factory_calls = make_writer(sheet)
+    for i in range(5):
+        writer.enqueue([f"SUB_{i}", i])
+    assert writer.flush(timeout=5)
+    assert sheet.rows == [[f"SUB_{i}", i] for i in range(5)]
+    assert sheet.calls == 1
+    assert len(factory_calls) == 1
+    stats = writer.stats()
+    assert stats["rows_written"] == 5
+    assert stats["batches"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_batches_are_capped_at_batch_size():
+    sheet = FakeWorksheet(latency=0.0)
+    writer, _ = make_writer(sheet, batch_size=2)
+    for i in range(5):
+        writer.enqueue([i])
+    assert writer.flush(timeout=5)
+    assert sheet.calls == 3
+    assert len(sheet.rows) == 5
+
+
+def test_quota_errors_are_retried_with_backoff():
+    sheet = FlakyWorksheet(failures=2)
+    writer, factory_calls = make_writer(sheet)
+    results = []
+    writer.enqueue(["SUB_1"], on_done=lambda ok, msg: results.append((ok, msg)))
+    assert writer.flush(timeout=5)
+    assert results == [(True, "Success")]
+    assert sheet.rows == [["SUB_1"]]
+    stats = writer.stats()
+    assert stats["retries"] == 2
+    assert stats["rows_failed"] == 0
+    # 失败后重新获取 worksheet
+    assert len(factory_calls) == 3
+
+
+def test_retries_give_up_after_max_retries():
+    sheet = FlakyWorksheet(failures=10)
+    writer, _ = make_writer(sheet, max_retries=2)
+    results = []
+    writer.enqueue(["SUB_1"], on_done=lambda ok, msg: results.append(ok))
+    assert writer.flush(timeout=5)
+    assert results == [False]
+    assert writer.stats()["rows_failed"] == 1
+    assert writer.stats()["retries"] == 2
+
+
+def test_non_retryable_errors_fail_at_once():
+    sheet = FlakyWorksheet(failures=1, error=SpreadsheetNotFound("Experiment_Data"))
+    writer, _ = make_writer(sheet)
+    results = []
+    writer.enqueue(["SUB_1"], on_done=lambda ok, msg: results.append(ok))
+    assert writer.flush(timeout=5)
+    assert results == [False]
+    assert writer.stats()["retries"] == 0
+
+
+def test_close_flushes_without_waiting_for_a_full_batch():
+    sheet = FakeWorksheet(latency=0.0)
+    writer, _ = make_writer(sheet, linger=30.0)
+    written = threading.Event()
+    writer.enqueue(["SUB_1"], on_done=lambda ok, msg: written.set())
+    assert writer.close(timeout=2)
+    assert written.is_set()
+    assert sheet.rows == [["SUB_1"]]
+
+
+def test_fake_worksheet_enforces_requests_per_minute():
+    sheet = FakeWorksheet(latency=0.0, requests_per_minute=1)
+    sheet.append_rows([["a"]])
+    with pytest.raises(FakeQuotaError) as excinfo:
+        sheet.append_rows([["b"]])
+    assert excinfo.value.response.status_code == 429
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+import types
+
+import pytest
+
+# openai / httpx 来自 requirements.txt；网络请求全部由下面的 StubClient 代替
+from stream_engine import StreamEngine
+
+
+def chunk(text=None, usage=None):
+    choices = [types.SimpleNamespace(delta=types.SimpleNamespace(content=text))] if text is not None else []
+    return types.SimpleNamespace(choices=choices, usage=usage)
+
+
+class StubStream:
+    def __init__(self, first_token, texts):
+        self.first_token = first_token
+        self.texts = texts
+        self.closed = False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        yield chunk("")
+        await asyncio.sleep(self.first_token)
+        for text in self.texts:
+            yield chunk(text)
+            await asyncio.sleep(0.1)
+        yield chunk(usage=types.SimpleNamespace(total_tokens=10, prompt_tokens=5, completion_tokens=5))
+
+    async def close(self):
+        self.closed = True
+
+
+class StubClient:
+    """``AsyncOpenAI`` stand-in: each ``create`` call takes the next (first_token, texts) plan."""
+
+    def __init__(self, plans):
+        self.plans = list(plans)
+        self.calls = 0
+        self.streams = []
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    async def create(self, stream, timeout, **kwargs):
+        self.calls += 1
+        first_token, texts = self.plans.pop(0)
+        self.streams.append(StubStream(first_token, texts))
+        return self.streams[-1]
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def engine():
+    engine = StreamEngine("test")
+    yield engine
+    engine._loop.call_soon_threadsafe(engine._loop.stop)
+
+
+def test_plain_stream(engine):
+    engine.openai = engine.secondary = StubClient([(0.0, ["Hel", "lo"])])
+    handle = engine.stream(model="m", messages=[])
+    assert "".join(handle.deltas()) == "Hello"
+    assert handle.usage.total_tokens == 10
+
+
+def test_primary_winning_before_hedge_deadline_is_not_hedged(engine):
+    # 首 token 0.2s，对冲阈值 0.5s：流在阈值之后仍在进行，但不应再发对冲请求
+    client = StubClient([(0.2, ["a"] * 10), (0.0, ["hedge"])])
+    engine.openai = engine.secondary = client
+    started = time.monotonic()
+    handle = engine.stream(hedge_after=0.5, model="m", messages=[])
+    assert "".join(handle.deltas()) == "a" * 10
+    assert client.calls == 1
+    assert engine.stats()["hedges"] == 0
+    assert time.monotonic() - started < 2.0
+
+
+def test_late_primary_is_hedged(engine):
+    client = StubClient([(1.5, ["slow"]), (0.0, ["fast"])])
+    engine.openai = engine.secondary = client
+    handle = engine.stream(hedge_after=0.2, model="m", messages=[])
+    assert "".join(handle.deltas()) == "fast"
+    stats = engine.stats()
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
+    assert handle.winner == "hedge"
+    # 输家（主请求）在循环上被取消并关闭
+    assert wait_for(lambda: client.streams[0].closed)
+    assert wait_for(lambda: engine.stats()["active_streams"] == 0)
+
+
+def test_leaving_deltas_early_cancels_the_stream(engine):
+    client = StubClient([(0.0, ["a"] * 50)])
+    engine.openai = engine.secondary = client
+    done_on = []
+    handle = engine.stream(on_done=lambda: done_on.append(threading.current_thread()), model="m", messages=[])
+    deltas = handle.deltas()
+    assert next(deltas) == "a"
+    deltas.close()                                  # 参与者离开：生成器提前结束
+    assert not handle.usable
+    # 被取消时 on_done 在调用 cancel 的线程（这里是测试线程）里运行，且只运行一次
+    assert done_on == [threading.current_thread()]
+    assert wait_for(lambda: client.streams[0].closed)
+    assert wait_for(lambda: engine.stats()["active_streams"] == 0)
+    assert len(done_on) == 1
+
+
+def test_finished_stream_calls_on_done_on_the_loop(engine):
+    engine.openai = engine.secondary = StubClient([(0.0, ["x"])])
+    done_on = []
+    handle = engine.stream(on_done=lambda: done_on.append(threading.current_thread().name), model="m", messages=[])
+    assert "".join(handle.deltas()) == "x"
+    assert wait_for(lambda: done_on == ["stream-engine"])
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from analytics import analyze_session
+from stream_parser import CORRECT, EXAM_START, INCORRECT, QUIZ_DUE, SESSION_COMPLETE, ReplyParser
+
+
+def feed_all(parser, chunks):
+    shown = "".join(parser.feed(chunk)[0] for chunk in chunks)
+    return shown + parser.finish()
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+REPLY = "[CORRECT] Well done. Now we will begin the final exam. The Session Is Complete."
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 8, len(REPLY)])
+def test_tags_and_markers_split_across_chunks(size):
+    parser = ReplyParser()
+    shown = feed_all(parser, chunked(REPLY, size))
+    assert shown == "Well done. Now we will begin the final exam. The Session Is Complete."
+    assert parser.display == shown
+    assert parser.raw == REPLY
+    assert parser.events == [CORRECT, EXAM_START, SESSION_COMPLETE]
+
+
+def test_quiz_marker_is_hidden_and_reported():
+    parser = ReplyParser()
+    shown = feed_all(parser, ["That covers the topic. [QU", "IZ]"])
+    assert "[QUIZ]" not in shown
+    assert parser.display == "That covers the topic."
+    assert parser.events == [QUIZ_DUE]
+
+
+def test_partial_marker_is_held_back_then_released():
+    parser = ReplyParser()
+    assert parser.feed("Score: [INC") == ("Score: ", [])
+    display, events = parser.feed("lusive] range")
+    assert display == "[INClusive] range"
+    assert events == []
+    assert parser.finish() == ""
+
+
+def test_events_are_reported_in_order_of_appearance():
+    parser = ReplyParser()
+    _, events = parser.feed("Let's begin the final exam. [INCORRECT] [CORRECT]")
+    assert events == [EXAM_START, INCORRECT, CORRECT]
+    assert parser.has(INCORRECT) and not parser.has(QUIZ_DUE)
+
+
+def test_tags_are_case_sensitive_phrases_are_not():
+    parser = ReplyParser()
+    feed_all(parser, ["[correct] the SESSION is complete"])
+    assert parser.events == [SESSION_COMPLETE]
+
+
+def session_record(*replies):
+    messages = [{"role": "system", "content": "prompt"}]
+    for reply in replies:
+        messages += [{"role": "user", "content": "B"}, {"role": "assistant", "content": reply}]
+    return {"session_id": "S1", "mode": "Neutral Mode", "dialogue_json": json.dumps(messages)}
+
+
+def test_analytics_scores_events_in_order_like_the_app():
+    # 判分标签在前、开考在后：应用里分数被清零，分析结果也必须是 0
+    session, turns = analyze_session(session_record(
+        "[CORRECT] Great. Are you ready for the final exam?",
+        "[CORRECT] Correct! Now we will begin the final exam.",
+    ))
+    assert session["score"] == 0
+    assert session["exam_started"]
+    assert turns[-1]["graded"] == "correct"
+    assert turns[-1]["text"] == "Correct! Now we will begin the final exam."
+
+
+def test_analytics_counts_exam_answers_after_the_start():
+    session, _ = analyze_session(session_record(
+        "[CORRECT] Good.",
+        "Now we will begin the final exam.",
+        "[CORRECT] Right.",
+        "[INCORRECT] Not quite.",
+        "[CORRECT] Yes. The session is complete.",
+    ))
+    assert session["score"] == 2
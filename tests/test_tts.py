@@ -0,0 +1,173 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from tts import AudioCache, ReplySpeech, SentenceSplitter, TTSPipeline, speakable
+
+
+class StubSynth:
+    """Local stand-in for edge-tts: returns fake MP3 bytes and counts calls."""
+
+    def __init__(self, size=600, fail=False):
+        self.size = size
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, text, voice):
+        self.calls.append((text, voice))
+        if self.fail:
+            raise ConnectionError("edge-tts unreachable")
+        return b"x" * self.size
+
+
+class AsyncStubSynth(StubSynth):
+    """Coroutine version, as used on the stream engine's loop; records the thread it ran on."""
+
+    def __init__(self, size=600, fail=False, delay=0.05):
+        super().__init__(size, fail)
+        self.delay = delay
+        self.threads = set()
+
+    async def __call__(self, text, voice):
+        self.threads.add(threading.current_thread().name)
+        await asyncio.sleep(self.delay)
+        return StubSynth.__call__(self, text, voice)
+
+
+class LoopEngine:
+    """Minimal ``StreamEngine`` stand-in: ``run(coro)`` on one background event loop."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="engine-loop", daemon=True)
+        self.thread.start()
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+@pytest.fixture
+def engine():
+    engine = LoopEngine()
+    yield engine
+    engine.close()
+
+
+def test_splitter_returns_completed_sentences_only():
+    splitter = SentenceSplitter(min_chars=10)
+    assert splitter.feed("Classical conditioning pairs") == []
+    assert splitter.feed(" two stimuli. The bell") == ["Classical conditioning pairs two stimuli."]
+    assert splitter.feed(" rings. ") == ["The bell rings."]
+    assert splitter.flush() == []
+
+
+def test_splitter_merges_short_sentences_and_flushes_the_rest():
+    splitter = SentenceSplitter(min_chars=15)
+    assert splitter.feed("Yes. That is right! Now the next part") == ["Yes. That is right!"]
+    assert splitter.flush() == ["Now the next part"]
+
+
+def test_speakable_strips_markdown_and_tags():
+    assert speakable("[CORRECT] **Great** job, `really`!") == "Great job, really!"
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=250)
+    a, b, c = (cache.key("v", text) for text in ("a", "b", "c"))
+    cache.put(a, b"a" * 100)
+    cache.put(b, b"b" * 100)
+    os.utime(os.path.join(tmp_path, a + ".mp3"), (1000, 1000))
+    os.utime(os.path.join(tmp_path, b + ".mp3"), (2000, 2000))
+    assert cache.get(a) == b"a" * 100           # refreshes a
+    cache.put(c, b"c" * 100)
+    assert cache.get(b) is None
+    assert cache.get(a) is not None and cache.get(c) is not None
+    assert cache.total_bytes == 200
+
+
+def test_cache_size_is_restored_from_disk(tmp_path):
+    AudioCache(str(tmp_path)).put("k", b"x" * 123)
+    assert AudioCache(str(tmp_path)).total_bytes == 123
+
+
+def test_repeated_sentence_is_served_from_cache(tmp_path):
+    synth = StubSynth()
+    pipeline = TTSPipeline(AudioCache(str(tmp_path)), synthesize=synth, max_workers=2)
+    first = pipeline.submit("Ready to move on?", "voice").result(timeout=5)
+    second = pipeline.submit("Ready to move on?", "voice").result(timeout=5)
+    assert len(synth.calls) == 1
+    assert not first.cached and second.cached
+    assert second.data == first.data
+    assert second.duration > 0
+    stats = pipeline.stats()
+    assert stats["clips"] == 2 and stats["cache_hits"] == 1
+
+
+def test_synthesis_errors_are_counted_not_raised(tmp_path):
+    pipeline = TTSPipeline(AudioCache(str(tmp_path)), synthesize=StubSynth(fail=True))
+    assert pipeline.submit("Hello there.", "voice").result(timeout=5) is None
+    assert pipeline.stats()["errors"] == 1
+
+
+def test_reply_speech_plays_clips_in_order(tmp_path):
+    now = [0.0]
+    pipeline = TTSPipeline(AudioCache(str(tmp_path)), synthesize=StubSynth(size=6000))
+    speech = ReplySpeech(pipeline, "voice", clock=lambda: now[0])
+    speech.add_text("This is the first sentence here. This is the second one here. ")
+    for future in speech._futures:
+        future.result(timeout=5)
+    first = speech.poll()
+    assert first.text == "This is the first sentence here."
+    assert speech.poll() is None                # first clip still playing (1s)
+    now[0] = 1.0
+    assert speech.poll().text == "This is the second one here."
+    speech.add_text("And a final part")
+    speech.finish()
+    delay, clips = speech.remaining()
+    assert [c.text for c in clips] == ["And a final part"]
+    assert delay == 1.0
+
+
+def test_engine_path_synthesizes_concurrently_on_the_loop(tmp_path, engine):
+    synth = AsyncStubSynth(delay=0.2)
+    pipeline = TTSPipeline(AudioCache(str(tmp_path)), synthesize=synth, engine=engine)
+    assert pipeline._pool is None
+    started = time.monotonic()
+    futures = [pipeline.submit(f"Sentence number {i} is here.", "voice") for i in range(5)]
+    clips = [f.result(timeout=5) for f in futures]
+    # 五句并发合成，全部在事件循环线程上，不占线程池
+    assert time.monotonic() - started < 0.8
+    assert synth.threads == {"engine-loop"}
+    assert [c.text for c in clips] == [f"Sentence number {i} is here." for i in range(5)]
+    assert pipeline.stats()["clips"] == 5
+
+
+def test_engine_path_uses_the_cache_and_counts_errors(tmp_path, engine):
+    synth = AsyncStubSynth()
+    pipeline = TTSPipeline(AudioCache(str(tmp_path)), synthesize=synth, engine=engine)
+    first = pipeline.submit("Ready to move on?", "voice").result(timeout=5)
+    second = pipeline.submit("Ready to move on?", "voice").result(timeout=5)
+    assert len(synth.calls) == 1
+    assert not first.cached and second.cached
+    assert pipeline.stats()["cache_hits"] == 1
+
+    failing = TTSPipeline(AudioCache(str(tmp_path / "other")), synthesize=AsyncStubSynth(fail=True), engine=engine)
+    assert failing.submit("Hello there.", "voice").result(timeout=5) is None
+    assert failing.stats()["errors"] == 1
+
+
+def test_reply_speech_over_the_engine(tmp_path, engine):
+    now = [0.0]
+    pipeline = TTSPipeline(AudioCache(str(tmp_path)), synthesize=AsyncStubSynth(size=6000), engine=engine)
+    speech = ReplySpeech(pipeline, "voice", clock=lambda: now[0])
+    speech.add_text("This is the first sentence here. This is the second one here.")
+    speech.finish()
+    delay, clips = speech.remaining()
+    assert delay == 0.0
+    assert [c.text for c in clips] == ["This is the first sentence here.", "This is the second one here."]
@@ -0,0 +1,51 @@
+import pytest
+
+from turn_log import TurnLog, decode_dialogue, display_text, encode_dialogue
+
+
+def test_display_is_parsed_once_and_kept_as_offsets():
+    log = TurnLog()
+    log.append("system", "prompt", shown=False)
+    log.append("user", "B")
+    log.append("assistant", "[CORRECT] Well done. [QUIZ]")
+    assert list(log.display_history()) == [("user", "B"), ("assistant", "Well done.")]
+    turn = log.turns[-1]
+    assert turn._span == (10, 20)
+    assert log.turns[1].display is log.turns[1].content
+
+
+def test_display_from_journal_is_stored_as_offsets_only():
+    log = TurnLog.from_journal([
+        {"role": "system", "content": "prompt", "display": None},
+        {"role": "assistant", "content": "[INCORRECT] Not quite.", "display": "Not quite."},
+    ])
+    assert log.shown_count == 1
+    assert log.turns[1]._span == (12, 22)
+    assert log.turns[1].display == "Not quite."
+    assert log[1] == {"role": "assistant", "content": "[INCORRECT] Not quite."}
+
+
+@pytest.mark.parametrize("content", [
+    "Plain teaching text. Ready to move on?",
+    "  [CORRECT]  Great.  ",
+    "Good so far. [CORRECT] And then more. [QUIZ]",
+    "[INCORRECT]",
+    "",
+])
+def test_display_matches_a_full_parse(content):
+    log = TurnLog()
+    log.append("assistant", content)
+    assert log.turns[0].display == display_text("assistant", content)
+    assert log.turns[0].display == display_text("assistant", content)
+
+
+def test_dialogue_round_trip_restores_known_prompts():
+    messages = [
+        {"role": "system", "content": "You are a tutor."},
+        {"role": "user", "content": "yes"},
+        {"role": "assistant", "content": "[CORRECT] Great."},
+    ]
+    value = encode_dialogue(messages, {"Neutral Mode": "You are a tutor."})
+    assert value.startswith("v2:")
+    assert decode_dialogue(value, {"Neutral Mode": "You are a tutor."}) == messages
+    assert decode_dialogue(value)[0]["content"] == "<system prompt: Neutral Mode>"
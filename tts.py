@@ -0,0 +1,309 @@
+"""
+头像语音：按句流水线合成 (edge-tts) + 音频缓存
+
+The streamed reply is split at sentence boundaries while the LLM is still
+generating. Each sentence is synthesized concurrently on a shared thread
+pool (or as coroutines on the stream engine's event loop), clip
+durations come from ``mutagen`` and drive playback scheduling, and a
+content-addressed on-disk cache with LRU eviction serves repeated
+phrases (introductions, check-ins) without new synthesis.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VOICES = {
+    "Empathy Mode": "en-US-AriaNeural",
+    "Neutral Mode": "en-US-GuyNeural",
+}
+# edge-tts 默认输出 24kHz / 48kbps 单声道 MP3
+FALLBACK_BYTES_PER_SECOND = 6000
+
+SENTENCE_END_RE = re.compile(r"[.!?](?:[\"')\]]*)(?=\s)")
+MARKDOWN_RE = re.compile(r"[*_`#>]+|^\s*[-•]\s+|\[(?:CORRECT|INCORRECT)\]", re.M)
+
+
+def speakable(text):
+    """
+    去掉 markdown 符号，只保留要朗读的文字
+    """
+    return " ".join(MARKDOWN_RE.sub("", text).split())
+
+
+def clip_duration(data):
+    try:
+        from mutagen.mp3 import MP3
+        return MP3(io.BytesIO(data)).info.length
+    except Exception:
+        return len(data) / FALLBACK_BYTES_PER_SECOND
+
+
+async def edge_tts_synthesize_async(text, voice):
+    """
+    调用 edge-tts 合成一句话（协程），返回 MP3 字节
+    """
+    import edge_tts
+
+    audio = bytearray()
+    async for chunk in edge_tts.Communicate(text, voice).stream():
+        if chunk["type"] == "audio":
+            audio.extend(chunk["data"])
+    return bytes(audio)
+
+
+def edge_tts_synthesize(text, voice):
+    """
+    调用 edge-tts 合成一句话，返回 MP3 字节
+    """
+    return asyncio.run(edge_tts_synthesize_async(text, voice))
+
+
+class SentenceSplitter:
+    """
+    Incremental splitter: ``feed`` returns the sentences completed by the
+    new text. Sentences shorter than ``min_chars`` are merged with the next
+    one so the avatar does not speak in tiny fragments.
+    """
+
+    def __init__(self, min_chars=24):
+        self.min_chars = min_chars
+        self._buf = ""
+
+    def feed(self, text):
+        self._buf += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END_RE.finditer(self._buf):
+            end = match.end()
+            if end - start >= self.min_chars:
+                sentences.append(self._buf[start:end].strip())
+                start = end
+        self._buf = self._buf[start:]
+        return [s for s in sentences if s]
+
+    def flush(self):
+        rest, self._buf = self._buf.strip(), ""
+        return [rest] if rest else []
+
+
+class AudioCache:
+    """
+    Content-addressed MP3 cache (``<sha256>.mp3``). Reads refresh the file
+    mtime, and writes evict the least recently used files once the
+    directory grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = {}
+        for name in os.listdir(directory):
+            if name.endswith(".mp3"):
+                self._sizes[name] = os.path.getsize(os.path.join(directory, name))
+        self.total_bytes = sum(self._sizes.values())
+
+    @staticmethod
+    def key(voice, text):
+        return hashlib.sha256(f"{voice}\n{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".mp3")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def put(self, key, data):
+        name = key + ".mp3"
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.total_bytes += len(data) - self._sizes.get(name, 0)
+            self._sizes[name] = len(data)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in self._sizes:
+            try:
+                entries.append((os.path.getmtime(os.path.join(self.directory, name)), name))
+            except OSError:
+                entries.append((0, name))
+        for _, name in sorted(entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            self.total_bytes -= self._sizes.pop(name)
+
+
+class Clip:
+    __slots__ = ("text", "data", "duration", "cached")
+
+    def __init__(self, text, data, duration, cached):
+        self.text = text
+        self.data = data
+        self.duration = duration
+        self.cached = cached
+
+
+class TTSPipeline:
+    """
+    Process-wide synthesis pool. ``start_reply(voice)`` returns a
+    ``ReplySpeech`` that receives the visible text of one reply.
+    ``synthesize(text, voice) -> bytes`` can be replaced by a local stub.
+
+    With ``engine`` (a ``stream_engine.StreamEngine``) synthesis runs as
+    coroutines on the engine's event loop instead of the thread pool, and
+    ``synthesize`` must be a coroutine function.
+    """
+
+    def __init__(self, cache, synthesize=edge_tts_synthesize, max_workers=4, engine=None):
+        self.cache = cache
+        self.synthesize = synthesize
+        self.engine = engine
+        self._pool = None if engine else ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+        self._lock = threading.Lock()
+        self._stats = {"clips": 0, "cache_hits": 0, "synth_seconds": 0.0, "errors": 0}
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["cache_bytes"] = self.cache.total_bytes
+        return snapshot
+
+    def start_reply(self, voice):
+        return ReplySpeech(self, voice)
+
+    def submit(self, text, voice):
+        if self.engine is not None:
+            return self.engine.run(self._clip_async(text, voice))
+        return self._pool.submit(self._clip, text, voice)
+
+    def _clip(self, text, voice):
+        key = self.cache.key(voice, text)
+        data = self.cache.get(key)
+        cached = data is not None
+        if not cached:
+            started = time.perf_counter()
+            try:
+                data = self.synthesize(text, voice)
+            except Exception as e:
+                return self._failed(text, e)
+            data = self._synthesized(key, data, started)
+        return self._make_clip(text, data, cached)
+
+    async def _clip_async(self, text, voice):
+        key = self.cache.key(voice, text)
+        data = self.cache.get(key)
+        cached = data is not None
+        if not cached:
+            started = time.perf_counter()
+            try:
+                data = await self.synthesize(text, voice)
+            except Exception as e:
+                return self._failed(text, e)
+            data = self._synthesized(key, data, started)
+        return self._make_clip(text, data, cached)
+
+    def _failed(self, text, exc):
+        logger.warning("TTS failed for %r: %s", text[:40], exc)
+        with self._lock:
+            self._stats["errors"] += 1
+        return None
+
+    def _synthesized(self, key, data, started):
+        with self._lock:
+            self._stats["synth_seconds"] += time.perf_counter() - started
+        if data:
+            self.cache.put(key, data)
+        return data
+
+    def _make_clip(self, text, data, cached):
+        with self._lock:
+            self._stats["clips"] += 1
+            self._stats["cache_hits"] += int(cached)
+        if not data:
+            return None
+        return Clip(text, data, clip_duration(data), cached)
+
+
+class ReplySpeech:
+    """
+    One reply's speech. ``add_text`` queues finished sentences for
+    synthesis; ``poll()`` hands back the next clip once it is ready and the
+    previous clip has finished playing (based on its duration).
+    """
+
+    def __init__(self, pipeline, voice, clock=time.monotonic):
+        self.pipeline = pipeline
+        self.voice = voice
+        self._clock = clock
+        self._splitter = SentenceSplitter()
+        self._futures = []
+        self._next = 0
+        self.play_until = 0.0
+
+    def add_text(self, text):
+        for sentence in self._splitter.feed(text):
+            self._queue(sentence)
+
+    def finish(self):
+        for sentence in self._splitter.flush():
+            self._queue(sentence)
+
+    def _queue(self, sentence):
+        spoken = speakable(sentence)
+        if spoken:
+            self._futures.append(self.pipeline.submit(spoken, self.voice))
+
+    def poll(self):
+        now = self._clock()
+        while self._next < len(self._futures) and now >= self.play_until:
+            future = self._futures[self._next]
+            if not future.done():
+                return None
+            self._next += 1
+            clip = future.result()
+            if clip is not None:
+                self.play_until = now + clip.duration
+                return clip
+        return None
+
+    def remaining(self, timeout=10.0):
+        """
+        等待剩余句子合成完成，返回 (起播延迟秒数, [clip, ...])
+        """
+        deadline = self._clock() + timeout
+        clips = []
+        for future in self._futures[self._next:]:
+            try:
+                clip = future.result(timeout=max(0.0, deadline - self._clock()))
+            except Exception:
+                break
+            if clip is not None:
+                clips.append(clip)
+        self._next = len(self._futures)
+        return max(0.0, self.play_until - self._clock()), clips
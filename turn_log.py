@@ -0,0 +1,178 @@
+"""
+紧凑的对话记录与压缩序列化
+
+Each turn is stored once, as the raw text sent to / received from the API,
+in a slotted record. The API view (``{"role", "content"}`` dicts) is
+derived on access. The display view (scoring tags stripped) is parsed at
+most once per turn; the record keeps only where it sits in the content
+(two offsets), so the text itself is stored once and the display is a
+slice of it. User turns display their content as is.
+
+``encode_dialogue`` produces the versioned ``dialogue_json`` cell value:
+``v2:`` followed by base64 of zlib-compressed compact JSON, with known
+system prompts replaced by a reference. Legacy plain-JSON values still
+decode. ``split_cells`` keeps every piece under the Sheets cell limit.
+"""
+import base64
+import hashlib
+import json
+import zlib
+from collections.abc import Sequence
+
+from stream_parser import ReplyParser
+
+VERSION_PREFIX = "v2:"
+# Google Sheets: at most 50,000 characters per cell
+CELL_LIMIT = 50000
+
+
+def display_text(role, content):
+    """
+    聊天区显示的文本：助手回复去掉评分标签，其余原样
+    """
+    if role != "assistant":
+        return content
+    parser = ReplyParser()
+    parser.feed(content)
+    parser.finish()
+    return parser.display
+
+
+def display_span(content, display):
+    """
+    显示文本在原文中的位置 (start, end)；不是原文的连续片段时（标签在句中）返回 ()
+    """
+    start = content.find(display)
+    return (start, start + len(display)) if start != -1 else ()
+
+
+class Turn:
+    __slots__ = ("role", "content", "shown", "_span")
+
+    def __init__(self, role, content, shown=True, display=None):
+        self.role = role
+        self.content = content
+        self.shown = shown
+        # 只缓存显示文本的位置，不另存一份文本；None 表示还没解析过
+        self._span = None if display is None or role != "assistant" else display_span(content, display)
+
+    @property
+    def display(self):
+        # 聊天区每次重跑都要重新输出全部历史：解析一次，之后只做切片
+        if self.role != "assistant":
+            return self.content
+        if self._span is None:
+            self._span = display_span(self.content, display_text(self.role, self.content))
+        if not self._span:
+            return display_text(self.role, self.content)
+        start, end = self._span
+        return self.content[start:end]
+
+    def as_message(self):
+        return {"role": self.role, "content": self.content}
+
+
+class TurnLog(Sequence):
+    """
+    Sequence of API message dicts (so it can be passed wherever a
+    ``messages`` list was used), backed by ``Turn`` records.
+    """
+
+    def __init__(self, turns=()):
+        self.turns = list(turns)
+        self._shown = sum(1 for t in self.turns if t.shown)
+
+    @classmethod
+    def from_journal(cls, turns):
+        # 日志中 display 为 None 的轮次（系统提示、自动开场指令）不显示
+        return cls(Turn(t["role"], t["content"], t["display"] is not None, t["display"]) for t in turns)
+
+    def append(self, role, content, shown=True, display=None):
+        self.turns.append(Turn(role, content, shown, display))
+        if shown:
+            self._shown += 1
+
+    def __len__(self):
+        return len(self.turns)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [t.as_message() for t in self.turns[index]]
+        return self.turns[index].as_message()
+
+    def __iter__(self):
+        return (t.as_message() for t in self.turns)
+
+    # --- Derived views ---
+
+    def display_history(self):
+        """
+        逐条返回 (role, display_text)，只包含聊天区可见的轮次
+        """
+        for t in self.turns:
+            if t.shown:
+                yield t.role, t.display
+
+    @property
+    def shown_count(self):
+        return self._shown
+
+    def count_role(self, role):
+        return sum(1 for t in self.turns if t.role == role)
+
+    def has_role(self, role):
+        return any(t.role == role for t in self.turns)
+
+
+# --- dialogue_json encoding ---
+
+def prompt_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+def encode_dialogue(messages, prompts=None):
+    """
+    压缩编码对话；``prompts`` 为 {名称: 系统提示}，匹配的系统消息只保存引用
+    """
+    by_text = {text: name for name, text in (prompts or {}).items()}
+    items = []
+    for m in messages:
+        name = by_text.get(m["content"]) if m["role"] == "system" else None
+        if name is not None:
+            items.append({"role": "system", "ref": name, "sha": prompt_digest(m["content"])})
+        else:
+            items.append({"role": m["role"], "content": m["content"]})
+    raw = json.dumps(items, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return VERSION_PREFIX + base64.b64encode(zlib.compress(raw, 9)).decode("ascii")
+
+
+def decode_dialogue(value, prompts=None):
+    """
+    解码 dialogue_json（v2 或旧版纯 JSON），返回消息列表
+
+    A referenced system prompt is restored from ``prompts`` when the name
+    and digest match; otherwise its content is a ``<system prompt: name>``
+    placeholder and the message keeps its ``ref``.
+    """
+    if not value:
+        return []
+    if not value.startswith(VERSION_PREFIX):
+        return json.loads(value)
+    items = json.loads(zlib.decompress(base64.b64decode(value[len(VERSION_PREFIX):])))
+    for i, item in enumerate(items):
+        ref = item.get("ref")
+        if ref is None:
+            continue
+        text = (prompts or {}).get(ref)
+        if text is not None and prompt_digest(text) == item.get("sha"):
+            items[i] = {"role": "system", "content": text}
+        else:
+            item["content"] = f"<system prompt: {ref}>"
+    return items
+
+
+def split_cells(value, limit=CELL_LIMIT):
+    """
+    切分成若干不超过单元格上限的片段（拼接即可还原）
+    """
+    return [value[i:i + limit] for i in range(0, len(value), limit)] or [""]